@@ -2,6 +2,8 @@
 ASGI config for Schedulo_app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This is the production entry point (see Procfile): clock-in/out run as async
+views there, so reverse geocoding doesn't hold a worker while it waits.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
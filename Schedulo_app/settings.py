@@ -80,18 +80,18 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.middleware.AsyncWhiteNoiseMiddleware",  # whitenoise, async capable
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
 
-    # 🔽 Delaala domain lock (must be after auth middleware)
-    "core.middleware.DelaalaDomainOrgLockMiddleware",
-
     # 🔽 derive tenant from host/subdomain/db router/etc.
     "core.multitenancy.TenantMiddleware",
 
+    # 🔽 Delaala domain lock (must be after auth + tenant middleware)
+    "core.middleware.DelaalaDomainOrgLockMiddleware",
+
     # 🔽 fallback: from session or user's profile; also writes session key
     "core.middleware.CurrentOrgMiddleware",
 
@@ -165,6 +165,92 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'Schedulo_app.wsgi.application'
+ASGI_APPLICATION = 'Schedulo_app.asgi.application'
+
+# Route clock-in/out to the async views (non-blocking geocoding). Best served by
+# the ASGI app (gunicorn -k uvicorn.workers.UvicornWorker); still correct under WSGI.
+PUNCH_VIEWS_ASYNC = os.environ.get("PUNCH_VIEWS_ASYNC", "1") == "1"
+
+# Punch postcode resolution: backends are tried in order until one answers.
+# The offline index is built with `manage.py build_postcode_index <centroids.csv>`;
+# while the file is absent that backend just passes to Nominatim.
+POSTCODE_RESOLVER_BACKENDS = [
+    "shifts.geocoding.OfflineIndexBackend",
+    "shifts.geocoding.NominatimBackend",
+]
+POSTCODE_INDEX_PATH = os.environ.get("POSTCODE_INDEX_PATH", str(BASE_DIR / "data" / "postcodes.idx"))
+POSTCODE_INDEX_MAX_KM = float(os.environ.get("POSTCODE_INDEX_MAX_KM", "1.0"))
+# Remote (Nominatim) answers are cached per geohash cell; 7 chars ~ 150 m x 150 m.
+GEOCODE_CACHE_PRECISION = int(os.environ.get("GEOCODE_CACHE_PRECISION", "7"))
+GEOCODE_CACHE_TTL = int(os.environ.get("GEOCODE_CACHE_TTL", str(7 * 24 * 3600)))
+GEOCODE_CACHE_NEGATIVE_TTL = int(os.environ.get("GEOCODE_CACHE_NEGATIVE_TTL", "120"))
+# Shift sites (allowed_postcode -> site_lat/site_lng) are geocoded after the save commits,
+# on SITE_GEOCODE_WORKERS threads (0: only `manage.py geocode_shift_sites`), within these countries.
+SITE_GEOCODE_WORKERS = int(os.environ.get("SITE_GEOCODE_WORKERS", "1"))
+NOMINATIM_COUNTRY_CODES = os.environ.get("NOMINATIM_COUNTRY_CODES", "gb")
+
+# Save punches at once and check their postcode in the background
+# (`manage.py verify_pending_punches --loop`); flagged punches go to the admin queue.
+PUNCH_VERIFICATION_DEFERRED = os.environ.get("PUNCH_VERIFICATION_DEFERRED", "0") == "1"
+PUNCH_VERIFICATION_BATCH = int(os.environ.get("PUNCH_VERIFICATION_BATCH", "200"))
+PUNCH_VERIFICATION_WORKERS = int(os.environ.get("PUNCH_VERIFICATION_WORKERS", "2"))
+PUNCH_VERIFICATION_RETRY_HOURS = int(os.environ.get("PUNCH_VERIFICATION_RETRY_HOURS", "24"))
+
+# Offline punch sync (POST /punches/sync/): batch size and accepted device-clock range.
+# Each item spends a "punch" rate-limit token, so keep the batch within that user burst.
+PUNCH_SYNC_MAX_ITEMS = int(os.environ.get("PUNCH_SYNC_MAX_ITEMS", "10"))
+PUNCH_SYNC_MAX_SKEW_SECONDS = int(os.environ.get("PUNCH_SYNC_MAX_SKEW_SECONDS", "300"))
+PUNCH_SYNC_MAX_AGE_HOURS = int(os.environ.get("PUNCH_SYNC_MAX_AGE_HOURS", "72"))
+
+# `manage.py close_overdue_bookings` settles bookings this long after the shift's
+# scheduled end (auto clock-out / no-show). Keep it >= the 6 h clock-out window.
+AUTO_CLOSE_GRACE_HOURS = int(os.environ.get("AUTO_CLOSE_GRACE_HOURS", "6"))
+
+# Idempotency-Key replay window for punch/booking POSTs (core/idempotency.py)
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+# Report exports stream rows fetched EXPORT_CHUNK_SIZE at a time (shifts/exports.py).
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "2000"))
+# Exports over more than EXPORT_BACKGROUND_DAYS (or open-ended) become ExportJobs rendered
+# by `manage.py run_export_jobs --loop` (shifts/export_jobs.py); files are kept
+# EXPORT_JOB_TTL_HOURS. EXPORT_WORKERS > 0 also renders them on threads in the web process.
+EXPORT_BACKGROUND_DAYS = int(os.environ.get("EXPORT_BACKGROUND_DAYS", "92"))
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "0"))
+EXPORT_JOB_TTL_HOURS = int(os.environ.get("EXPORT_JOB_TTL_HOURS", "24"))
+EXPORT_JOB_REUSE_MINUTES = int(os.environ.get("EXPORT_JOB_REUSE_MINUTES", "15"))
+
+# Token-bucket throttling (core/ratelimit.py): scope -> {"user"|"tenant": (burst, seconds)}.
+# "cache" shares buckets across workers through CACHES; "local" keeps them per process.
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "local")
+RATE_LIMITS = {
+    "punch": {"user": (10, 60), "tenant": (600, 60)},
+    "search": {"user": (20, 10), "tenant": (200, 10)},
+}
+
+# Clock-out signatures: size cap checked in the request; recompression (palette
+# PNG or "webp") and thumbnails run after the response on SIGNATURE_WORKERS threads.
+SIGNATURE_MAX_BYTES = int(os.environ.get("SIGNATURE_MAX_BYTES", str(512 * 1024)))
+SIGNATURE_FORMAT = os.environ.get("SIGNATURE_FORMAT", "png")
+SIGNATURE_WORKERS = int(os.environ.get("SIGNATURE_WORKERS", "1"))
+# spool uploads over 256 KB to a temp file instead of holding them in memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
+
+# Shared cache: tenant host lookups and their version stamps, request contexts,
+# idempotency keys, rate-limit buckets and geocoder answers must be seen by every
+# worker. REDIS_URL -> Redis; otherwise the database cache table (created by
+# `manage.py createcachetable`). Per-process LocMem only for local SQLite dev.
+REDIS_URL = os.environ.get("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+elif USE_SQLITE:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "django_cache"}}
+# Seconds a process trusts its copy of a namespace version stamp (tenant hosts,
+# role rules) before re-reading it from CACHES; bounds cross-worker staleness.
+CACHE_VERSION_LOCAL_TTL = float(os.environ.get("CACHE_VERSION_LOCAL_TTL", "5"))
 
 
 # Database
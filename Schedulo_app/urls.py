@@ -8,12 +8,20 @@ from django.urls import path, include
 from shifts import views as shift_views
 from shifts.views import NoCacheLoginView
 from shifts.views_audit import audit_log
+from shifts import views_exports
 from accounts import views as accounts_views
+from core import views as core_views
 
 # Debug import (remove in production)
 if settings.DEBUG:
     from debug_views import debug_id_card_form
 
+# Punch views: async variants don't block a worker on the geocoder (serve via ASGI)
+if settings.PUNCH_VIEWS_ASYNC:
+    clock_in_view, clock_out_view = shift_views.clock_in_async, shift_views.clock_out_async
+else:
+    clock_in_view, clock_out_view = shift_views.clock_in, shift_views.clock_out
+
 urlpatterns = [
     # Include shifts app (namespaced) — must be BEFORE admin.site.urls
     path("", include(("shifts.urls", "shifts"), namespace="shifts")),
@@ -40,8 +48,9 @@ urlpatterns = [
     path("completed-shifts/", shift_views.completed_shifts, name="completed_shifts"),
     path("past-shifts/", shift_views.past_shifts, name="past_shifts"),
     path("cancel-booking/<int:booking_id>/", shift_views.cancel_booking, name="cancel_booking"),
-    path("clock-in/<int:booking_id>/", shift_views.clock_in, name="clock_in"),
-    path("clock-out/<int:booking_id>/", shift_views.clock_out, name="clock_out"),
+    path("clock-in/<int:booking_id>/", clock_in_view, name="clock_in"),
+    path("clock-out/<int:booking_id>/", clock_out_view, name="clock_out"),
+    path("punches/sync/", shift_views.sync_punches, name="sync_punches"),
     path("my-paid-shifts/", shift_views.my_paid_shifts, name="my_paid_shifts"),
 
     # Admin pages
@@ -58,6 +67,7 @@ urlpatterns = [
     path("admin/manage-shifts/booking/<int:booking_id>/cancel/", shift_views.admin_cancel_booking_admin, name="admin_cancel_booking_admin"),
     path("admin/manage-shifts/booking/<int:booking_id>/clock-in/", shift_views.admin_clock_in_for_user, name="admin_clock_in_for_user"),
     path("admin/manage-shifts/booking/<int:booking_id>/clock-out/", shift_views.admin_clock_out_for_user, name="admin_clock_out_for_user"),
+    path("admin/manage-shifts/shift/<int:shift_id>/team/", shift_views.admin_shift_team, name="admin_shift_team"),
     path("admin/bookings/<int:booking_id>/mark-paid/", shift_views.admin_mark_booking_paid, name="admin_mark_booking_paid"),
 
     # Reports & compliance
@@ -68,6 +78,12 @@ urlpatterns = [
     path("admin/compliance/", shift_views.compliance_admin_upload, name="compliance_admin_upload"),
     path("accounts/compliance/", shift_views.my_compliance, name="my_compliance"),
     path("admin/audit/", audit_log, name="audit_log"),
+    path("admin/exports/", views_exports.export_jobs, name="admin_export_jobs"),
+    path("admin/exports/<int:job_id>/status/", views_exports.export_job_status, name="admin_export_job_status"),
+    path("admin/exports/<int:job_id>/download/", views_exports.export_job_download, name="admin_export_job_download"),
+    path("admin/punch-mismatches/", shift_views.admin_punch_mismatches, name="admin_punch_mismatches"),
+    path("admin/punch-mismatches/<int:booking_id>/accept/", shift_views.admin_accept_punch, name="admin_accept_punch"),
+    path("admin/metrics/cache/", core_views.cache_metrics, name="cache_metrics"),
 
     # Django admin — keep LAST
     path("admin/", admin.site.urls),
@@ -11,6 +11,8 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
 from django.db.models import Q
 
+from core.ratelimit import ratelimit
+
 from .forms import UserUpdateForm, ProfileForm, CustomPasswordResetForm, IDCardForm
 from .models import Profile, User
 
@@ -240,6 +242,7 @@ def my_id_card_view(request):
 
 
 @login_required
+@ratelimit("search")
 def employee_search(request):
     """AJAX endpoint for searching employees with pagination"""
     from django.http import JsonResponse
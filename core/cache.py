@@ -0,0 +1,185 @@
+# core/cache.py
+"""
+Small caching building blocks shared by the apps:
+
+- LRUTTLCache: per-process LRU with a time-to-live, for hot lookups that must
+  not touch the DB on every request.
+- get_version / bump_version: namespace version stamps kept in Django's shared
+  cache. Embed the version in a cache key and bump it from a signal to
+  invalidate every entry of that namespace at once (across processes). Signals
+  fire before the change commits, so bump through bump_version_on_commit():
+  a reader that misses in between would otherwise re-cache the old row under
+  the new version. "Across processes" needs a real shared CACHES backend
+  (Redis or the database cache, see settings); LocMem is per process.
+  get_local_version() memoises a version in-process for a few seconds, for
+  per-request hot paths that must not round-trip to the shared cache.
+- CacheStats: hit/miss counters registered by name so they can be inspected
+  at runtime (see core.views.cache_metrics).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+MISSING = object()
+
+# ---------- Counters ----------
+_STATS = {}
+_STATS_LOCK = threading.Lock()
+
+
+class CacheStats:
+    """Thread-safe named counters (e.g. local_hit / shared_hit / miss)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def incr(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + n
+
+    def peak(self, key: str, value: int) -> None:
+        """Keep the largest value seen under `key` (e.g. worst-case latency)."""
+        with self._lock:
+            if value > self._counts.get(key, 0):
+                self._counts[key] = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        hits = sum(v for k, v in counts.items() if k.endswith("hit"))
+        misses = counts.get("miss", 0)
+        total = hits + misses
+        counts["hit_rate"] = round(hits / total, 4) if total else None
+        return counts
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+def get_stats(name: str) -> CacheStats:
+    """Return (creating on first use) the counters registered under `name`."""
+    with _STATS_LOCK:
+        stats = _STATS.get(name)
+        if stats is None:
+            stats = _STATS[name] = CacheStats(name)
+        return stats
+
+
+def all_stats() -> dict:
+    with _STATS_LOCK:
+        registered = list(_STATS.values())
+    return {s.name: s.snapshot() for s in registered}
+
+
+# ---------- In-process LRU + TTL ----------
+class LRUTTLCache:
+    """
+    Bounded, thread-safe LRU cache whose entries expire `ttl` seconds after
+    they were stored. Use MISSING as the default to tell "cached None" apart
+    from "not cached".
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires <= now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+# ---------- Shared-cache version stamps ----------
+def _version_key(namespace: str) -> str:
+    return f"v:{namespace}"
+
+
+def get_version(namespace: str) -> int:
+    return get_versions(namespace)[namespace]
+
+
+def get_versions(*namespaces: str) -> dict:
+    """Fetch several namespace versions in one cache round-trip."""
+    keys = {_version_key(ns): ns for ns in namespaces}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, ns in keys.items():
+        v = found.get(key)
+        if v is None:
+            v = 1
+            cache.add(key, v, timeout=None)
+        versions[ns] = v
+    return versions
+
+
+_local_versions = LRUTTLCache(maxsize=256, ttl=getattr(settings, "CACHE_VERSION_LOCAL_TTL", 5))
+
+
+def get_local_version(namespace: str) -> int:
+    """
+    get_version(), remembered in this process for CACHE_VERSION_LOCAL_TTL
+    seconds. Bumps from this process are seen at once; bumps from other
+    processes within that TTL.
+    """
+    version = _local_versions.get(namespace)
+    if version is MISSING:
+        version = get_version(namespace)
+        _local_versions.set(namespace, version)
+    return version
+
+
+def bump_version(namespace: str) -> None:
+    key = _version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # key missing (evicted / first bump): any value != 1 invalidates
+        cache.set(key, int(time.time()), timeout=None)
+
+
+def bump_version_on_commit(namespace: str, then=None) -> None:
+    """bump_version() (and `then()`) once the current transaction commits; at once outside one."""
+    def bump():
+        bump_version(namespace)
+        _local_versions.delete(namespace)
+        if then is not None:
+            then()
+
+    transaction.on_commit(bump)
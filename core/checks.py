@@ -0,0 +1,29 @@
+# core/checks.py
+"""
+System checks for settings the caching/idempotency code relies on.
+
+Tenant lookups, version stamps, idempotency claims and rate-limit buckets
+must be visible to every worker. With a per-process cache backend each
+gunicorn/uvicorn worker would keep its own copy, so a retried punch landing
+on another worker would run again.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    if settings.DEBUG or backend not in PROCESS_LOCAL_BACKENDS:
+        return []
+    return [Warning(
+        f"The default cache ({backend.rsplit('.', 1)[-1]}) is per process.",
+        hint="Set REDIS_URL, or run `manage.py createcachetable` and use the database cache, so "
+             "idempotency keys, tenant lookups and rate limits are shared by all workers.",
+        id="core.W001",
+    )]
@@ -0,0 +1,163 @@
+# core/idempotency.py
+"""
+Idempotency-Key support for retry-prone POSTs (punches, bookings).
+
+A client that may retry sends the same `Idempotency-Key: <opaque string>`
+header on every attempt of one logical request. The first attempt claims the
+key with cache.add() and runs the view; its response is stored in Django's
+shared cache for IDEMPOTENCY_TTL seconds, keyed by user + path + key. Any
+later attempt gets that stored response back (with `Idempotent-Replayed:
+true`) and the view never runs: no geocoding, no audit rows, no messages.
+
+The claim only holds across workers if CACHES is shared (Redis or the
+database cache); core.checks warns (core.W001) when it's per process.
+
+A request is identified by a fingerprint of its body. For multipart uploads
+that is the form fields plus each file's name, size and SHA-256 (read from
+Django's spooled upload, not held in memory), so a different signature of
+the same byte length is a different request.
+
+  same key while the first attempt is still running  -> 409
+  same key with a different request body             -> 422
+  first attempt failed with a 5xx                    -> not stored; retry runs
+
+Counters are under "idempotency" in the cache metrics (hit_rate = replay rate).
+Requests without the header are untouched.
+"""
+import functools
+import hashlib
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+from .cache import get_stats
+
+HEADER = "HTTP_IDEMPOTENCY_KEY"
+MAX_KEY_LENGTH = 255
+_STORED_HEADERS = ("Content-Type", "Location")
+
+idempotency_stats = get_stats("idempotency")
+
+
+def _cache_key(request, user, key: str) -> str:
+    scope = hashlib.sha256(f"{user.pk}:{request.path}:{key}".encode("utf-8")).hexdigest()
+    return f"idem:{scope}"
+
+
+def _file_digest(uploaded) -> str:
+    digest = hashlib.sha256()
+    for chunk in uploaded.chunks():
+        digest.update(chunk)
+    uploaded.seek(0)  # the view reads it again
+    return digest.hexdigest()
+
+
+def _fingerprint(request) -> str:
+    if request.content_type == "multipart/form-data":
+        # request.body isn't available once uploads are streamed; hash what was parsed
+        digest = hashlib.sha256(b"multipart")
+        for name in sorted(request.POST):
+            for value in request.POST.getlist(name):
+                digest.update(f"\0f:{name}={value}".encode("utf-8"))
+        for name in sorted(request.FILES):
+            for uploaded in request.FILES.getlist(name):
+                digest.update(f"\0u:{name}:{uploaded.name}:{uploaded.size}:{_file_digest(uploaded)}".encode("utf-8"))
+        return digest.hexdigest()
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def _replay(entry):
+    response = HttpResponse(entry["content"], status=entry["status"])
+    for name, value in entry["headers"].items():
+        response[name] = value
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _begin(request, user):
+    """(cache key, fingerprint, early response). early response is set when the view must not run."""
+    key = request.META.get(HEADER, "")
+    if request.method != "POST" or not key:
+        return None, None, None
+    if len(key) > MAX_KEY_LENGTH:
+        return None, None, JsonResponse({"ok": False, "msg": "Idempotency-Key is too long."}, status=400)
+
+    cache_key = _cache_key(request, user, key)
+    fp = _fingerprint(request)
+    lock_ttl = getattr(settings, "IDEMPOTENCY_LOCK_TTL", 60)
+    if cache.add(cache_key, {"state": "running", "fp": fp}, timeout=lock_ttl):
+        idempotency_stats.incr("miss")
+        return cache_key, fp, None
+
+    entry = cache.get(cache_key)
+    if entry is None:
+        # expired between add() and get(); treat as a fresh request
+        cache.set(cache_key, {"state": "running", "fp": fp}, timeout=lock_ttl)
+        idempotency_stats.incr("miss")
+        return cache_key, fp, None
+    if entry["fp"] != fp:
+        idempotency_stats.incr("mismatch")
+        return None, None, JsonResponse(
+            {"ok": False, "msg": "Idempotency-Key was already used for a different request."}, status=422)
+    if entry["state"] == "running":
+        idempotency_stats.incr("in_flight")
+        return None, None, JsonResponse(
+            {"ok": False, "msg": "A request with this Idempotency-Key is still being processed."}, status=409)
+    idempotency_stats.incr("replay_hit")
+    return None, None, _replay(entry)
+
+
+def _finish(cache_key, fp, response):
+    if response.status_code >= 500 or getattr(response, "streaming", False):
+        cache.delete(cache_key)  # let the client's retry run for real
+        return
+    cache.set(cache_key, {
+        "state": "done", "fp": fp, "status": response.status_code,
+        "headers": {h: response[h] for h in _STORED_HEADERS if h in response},
+        "content": response.content,
+    }, timeout=getattr(settings, "IDEMPOTENCY_TTL", 24 * 3600))
+
+
+def idempotent(view):
+    """Honour the Idempotency-Key header on POSTs to `view` (apply inside login_required)."""
+    if iscoroutinefunction(view):
+        # cache round-trips don't need the thread-sensitive executor the ORM work queues on
+        begin = sync_to_async(_begin, thread_sensitive=False)
+        finish = sync_to_async(_finish, thread_sensitive=False)
+        forget = sync_to_async(lambda key: cache.delete(key), thread_sensitive=False)
+
+        @functools.wraps(view)
+        async def _async_wrapped(request, *args, **kwargs):
+            cache_key, fp, early = await begin(request, await request.auser())
+            if early is not None:
+                return early
+            try:
+                response = await view(request, *args, **kwargs)
+            except BaseException:
+                if cache_key:
+                    await forget(cache_key)
+                raise
+            if cache_key:
+                await finish(cache_key, fp, response)
+            return response
+
+        return _async_wrapped
+
+    @functools.wraps(view)
+    def _wrapped(request, *args, **kwargs):
+        cache_key, fp, early = _begin(request, request.user)
+        if early is not None:
+            return early
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            if cache_key:
+                cache.delete(cache_key)
+            raise
+        if cache_key:
+            _finish(cache_key, fp, response)
+        return response
+
+    return _wrapped
@@ -1,79 +1,125 @@
 # core/middleware.py
+#
+# All middlewares here are sync *and* async capable. Under ASGI a single
+# sync-only middleware makes Django run the rest of the chain (including async
+# views) on one shared thread, which would serialise every clock-in again.
 import logging
+from abc import ABC, abstractmethod
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
 from django.shortcuts import redirect
 from django.contrib.auth import logout
-from core.models import Organization
+from whitenoise.middleware import WhiteNoiseMiddleware
 from core.org_context import org_context
-from .org_utils import user_org_name
+from .request_context import ACTIVE_ORG_SESSION_KEY, get_request_context
 
 logger = logging.getLogger(__name__)
-ACTIVE_ORG_SESSION_KEY = "active_org_id"
 
-class DelaalaDomainOrgLockMiddleware:
-    """
-    Middleware to restrict portal.delaala.co.uk access to only Delaala Company Limited users.
-    """
+
+class _HybridMiddleware(ABC):
+    """Base for the middlewares below: dispatches to handle() under WSGI and __acall__() under ASGI."""
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        host = request.get_host().split(":")[0]
-
-        if host == getattr(settings, 'DELAALA_DOMAIN', ''):
-            if request.user.is_authenticated and not request.user.is_superuser:
-                org = (user_org_name(request.user) or "").strip().lower()
-                delaala_org = getattr(settings, 'DELAALA_ORG_NAME', '').lower()
-                
-                if org != delaala_org:
-                    logger.warning(f"User {request.user.username} with org '{org}' attempted to access Delaala domain")
-                    logout(request)
-                    # Redirect to login with error message
-                    return redirect("/accounts/login/?error=not_authorized")
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
 
-        return self.get_response(request)
+    @abstractmethod
+    def handle(self, request):
+        """Sync path: return the response."""
 
-logger = logging.getLogger(__name__)
-ACTIVE_ORG_SESSION_KEY = "active_org_id"
+    @abstractmethod
+    async def __acall__(self, request):
+        """Async path: return the response."""
 
-class CurrentOrgMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
 
-    def __call__(self, request):
-        # 0) If a previous middleware (e.g., TenantMiddleware) already set tenant, keep it.
-        org = getattr(request, "tenant", None)
-
-        # 1) If not set, try session
-        if org is None and hasattr(request, "session"):
-            org_id = request.session.get(ACTIVE_ORG_SESSION_KEY)
-            if org_id:
-                try:
-                    org = Organization.objects.get(pk=org_id)
-                    logger.debug("Tenant resolved from session: %s", org_id)
-                except Organization.DoesNotExist:
-                    logger.info("Stale active_org_id=%s; clearing.", org_id)
-                    request.session.pop(ACTIVE_ORG_SESSION_KEY, None)
-
-        # 2) If still not set, fallback to user's profile org
-        user = getattr(request, "user", None)
-        if org is None and user is not None and getattr(user, "is_authenticated", False):
-            profile = getattr(user, "profile", None)
-            prof_org = getattr(profile, "organization", None) if profile else None
-            if prof_org:
-                org = prof_org
-                if hasattr(request, "session"):
-                    request.session[ACTIVE_ORG_SESSION_KEY] = org.pk
-                logger.debug("Tenant resolved from user.profile.organization: %s", org.pk)
-            else:
-                logger.debug("Authenticated user has no profile.organization.")
-
-        # 3) Attach only if we found one; otherwise leave any existing value untouched
+class DelaalaDomainOrgLockMiddleware(_HybridMiddleware):
+    """
+    Middleware to restrict portal.delaala.co.uk access to only Delaala Company Limited users.
+    Reads the verdict from the request context (must run after TenantMiddleware).
+    """
+    def _reject(self, request):
+        if request.user.is_authenticated:
+            ctx = get_request_context(request)
+            if ctx.domain_locked_out:
+                logger.warning(f"User {request.user.username} with org '{ctx.org_name}' attempted to access Delaala domain")
+                logout(request)
+                # Redirect to login with error message
+                return redirect("/accounts/login/?error=not_authorized")
+        return None
+
+    def handle(self, request):
+        return self._reject(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        response = await sync_to_async(self._reject)(request)
+        return response or await self.get_response(request)
+
+
+class CurrentOrgMiddleware(_HybridMiddleware):
+    def _resolve(self, request):
+        # Resolution order (host tenant > session > user's profile org) lives in
+        # core.request_context; this middleware only activates the result.
+        ctx = get_request_context(request)
+        org = ctx.org
+
+        # Remember a profile-derived org in the session (only write on change)
+        if ctx.source == "profile" and org is not None and hasattr(request, "session"):
+            if request.session.get(ACTIVE_ORG_SESSION_KEY) != org.pk:
+                request.session[ACTIVE_ORG_SESSION_KEY] = org.pk
+            logger.debug("Tenant resolved from user.profile.organization: %s", org.pk)
+
+        # Attach only if we found one; otherwise leave any existing value untouched
         if org is not None:
             request.tenant = org
+        else:
+            logger.debug("No tenant resolved for path=%s", request.path)
+        return org
+
+    def handle(self, request):
+        org = self._resolve(request)
+        if org is not None:
             # Activate context only when org exists
             with org_context(org):
                 return self.get_response(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        org = await sync_to_async(self._resolve)(request)
+        if org is not None:
+            # ContextVar set in this task is inherited by every await/sync hop below
+            with org_context(org):
+                return await self.get_response(request)
+        return await self.get_response(request)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, but async capable so it doesn't force the chain onto one thread."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
 
-        logger.debug("No tenant resolved for path=%s", request.path)
-        return self.get_response(request)
\ No newline at end of file
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
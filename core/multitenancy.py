@@ -1,19 +1,78 @@
-from core.tenant import set_current_org
+from core.tenant import get_current_org, set_current_org
 # core/multitenancy.py
-from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.deprecation import MiddlewareMixin
 from django.db.utils import ProgrammingError, OperationalError
+from .cache import LRUTTLCache, MISSING, bump_version_on_commit, get_local_version, get_stats
 from .models import Domain
 
-_current_tenant = ContextVar("current_tenant", default=None)
-
 def get_current_tenant():
-    return _current_tenant.get()
+    # Single source of truth: core.tenant's ContextVar, set by TenantMiddleware /
+    # CurrentOrgMiddleware. ContextVars are copied into sync_to_async/async_to_sync
+    # hops, so the value follows a request across awaits under ASGI.
+    return get_current_org()
+
+# ---------- Host -> Organization cache ----------
+# Tier 1: per-process LRU (no network, no DB).
+# Tier 2: Django's shared cache, keyed by a namespace version that signals bump
+#         whenever a Domain or Organization changes (see core/signals.py). The
+#         version itself is memoised in-process (get_local_version), so a local
+#         hit costs no round-trip to the shared cache.
+# Unknown hosts are cached too (as None) so bots hitting random hosts stay cheap.
+TENANT_CACHE_NAMESPACE = "tenant-host"
+_NO_TENANT = "__none__"
+
+_host_cache = LRUTTLCache(
+    maxsize=getattr(settings, "TENANT_HOST_CACHE_SIZE", 512),
+    ttl=getattr(settings, "TENANT_HOST_CACHE_LOCAL_TTL", 30),
+)
+host_cache_stats = get_stats("tenant_host")
+
+
+def _shared_key(version, host):
+    return f"tenant-host:{version}:{host}"
+
+
+def resolve_tenant_for_host(host: str):
+    """Return the active Organization for `host` (or None), caching both outcomes."""
+    version = get_local_version(TENANT_CACHE_NAMESPACE)
+    local_key = (version, host)
+
+    org = _host_cache.get(local_key)
+    if org is not MISSING:
+        host_cache_stats.incr("local_hit")
+        return org
+
+    key = _shared_key(version, host)
+    cached = cache.get(key, MISSING)
+    if cached is not MISSING:
+        host_cache_stats.incr("shared_hit")
+        org = None if cached == _NO_TENANT else cached
+        _host_cache.set(local_key, org)
+        return org
+
+    host_cache_stats.incr("miss")
+    try:
+        domain = Domain.objects.select_related("organization").filter(domain=host, is_active=True).first()
+    except (ProgrammingError, OperationalError):
+        # tables not migrated yet (fresh deploy / collectstatic): don't cache
+        return None
+    org = domain.organization if domain else None
+    cache.set(key, org if org is not None else _NO_TENANT,
+              timeout=getattr(settings, "TENANT_HOST_CACHE_SHARED_TTL", 300))
+    _host_cache.set(local_key, org)
+    return org
+
+
+def invalidate_tenant_cache():
+    """Drop every cached host mapping (all processes, via the version stamp) once the change commits."""
+    bump_version_on_commit(TENANT_CACHE_NAMESPACE, then=_host_cache.clear)
+
 
 class TenantMiddleware(MiddlewareMixin):
     def process_request(self, request):
         host = request.get_host().split(":")[0].lower()
-        domain = Domain.objects.select_related("organization").filter(domain=host, is_active=True).first()
-        org = domain.organization if domain else None
+        org = resolve_tenant_for_host(host)
         request.tenant = org
         set_current_org(org)
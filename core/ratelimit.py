@@ -0,0 +1,162 @@
+# core/ratelimit.py
+"""
+Token-bucket rate limiting for hot endpoints (punches, employee search).
+
+Each scope in settings.RATE_LIMITS has two buckets, one per user and one per
+tenant:
+
+    RATE_LIMITS = {"punch": {"user": (10, 60), "tenant": (600, 60)}, ...}
+
+(capacity, seconds) means a bucket holds `capacity` tokens and refills at
+capacity/seconds tokens per second, so short bursts up to `capacity` pass and
+the sustained rate is capped. A request spends one token from the user bucket
+and then one from the tenant bucket (batch endpoints spend one per item, see
+limited()). If either bucket is empty, the view
+doesn't run: the response is 429 with Retry-After, in whole seconds until a
+token is back.
+
+RATE_LIMIT_BACKEND picks where buckets live:
+  "local"  per-process dict (default; exact, no I/O, limits are per worker)
+  "cache"  Django's shared cache, so all workers share one bucket. Updates are
+           read-then-write, so simultaneous requests on different workers can
+           overshoot by a few tokens.
+
+Counters are under "ratelimit" in the cache metrics
+(<scope>_allowed, <scope>_limited_user, <scope>_limited_tenant).
+"""
+import functools
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+from .cache import LRUTTLCache, MISSING, get_stats
+
+ratelimit_stats = get_stats("ratelimit")
+
+
+def _refill(state, capacity: float, rate: float, now: float):
+    tokens, updated = state
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class LocalBackend:
+    """Buckets in this process. Idle buckets expire once they would be full again."""
+
+    def __init__(self, maxsize: int = 50_000):
+        self._buckets = LRUTTLCache(maxsize=maxsize, ttl=3600)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, period: float, now: float, cost: int = 1) -> float:
+        """Spend `cost` tokens. Returns 0 if allowed, else seconds until enough are available."""
+        rate = capacity / period
+        with self._lock:
+            state = self._buckets.get(key)
+            tokens = capacity if state is MISSING else _refill(state, capacity, rate, now)
+            if tokens < cost:
+                self._buckets.set(key, (tokens, now), ttl=period)
+                return (cost - tokens) / rate
+            self._buckets.set(key, (tokens - cost, now), ttl=period)
+            return 0.0
+
+
+class CacheBackend:
+    """Buckets in Django's shared cache (best effort; see module docstring)."""
+
+    def take(self, key: str, capacity: int, period: float, now: float, cost: int = 1) -> float:
+        rate = capacity / period
+        state = cache.get(key)
+        tokens = capacity if state is None else _refill(state, capacity, rate, now)
+        timeout = math.ceil(period)
+        if tokens < cost:
+            cache.set(key, (tokens, now), timeout=timeout)
+            return (cost - tokens) / rate
+        cache.set(key, (tokens - cost, now), timeout=timeout)
+        return 0.0
+
+
+_local = LocalBackend()
+_shared = CacheBackend()
+
+
+def get_backend():
+    return _shared if getattr(settings, "RATE_LIMIT_BACKEND", "local") == "cache" else _local
+
+
+def check(scope: str, user_id, tenant_id, now: float | None = None, cost: int = 1) -> float:
+    """Spend `cost` tokens for (scope, user) and (scope, tenant). Returns 0 if allowed, else seconds to wait."""
+    limits = getattr(settings, "RATE_LIMITS", {}).get(scope)
+    if not limits or not getattr(settings, "RATE_LIMIT_ENABLED", True):
+        return 0.0
+    backend = get_backend()
+    now = time.time() if now is None else now
+
+    for level, ident in (("user", user_id), ("tenant", tenant_id)):
+        if ident is None or level not in limits:
+            continue
+        capacity, period = limits[level]
+        wait = backend.take(f"rl:{scope}:{level}:{ident}", capacity, period, now, cost)
+        if wait:
+            ratelimit_stats.incr(f"{scope}_limited_{level}")
+            return wait
+    ratelimit_stats.incr(f"{scope}_allowed")
+    return 0.0
+
+
+def _too_many(wait: float):
+    retry_after = max(1, math.ceil(wait))
+    response = JsonResponse(
+        {"ok": False, "msg": f"Too many requests. Please try again in {retry_after} s."}, status=429)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def _tenant_id(request):
+    return getattr(getattr(request, "tenant", None), "pk", None)
+
+
+def limited(scope: str, request, cost: int = 1):
+    """
+    In-view form of @ratelimit for sync views whose cost is only known after
+    parsing the body (e.g. one token per item of a batch). Returns the 429
+    response to send, or None when allowed.
+    """
+    wait = check(scope, request.user.pk, _tenant_id(request), cost=cost)
+    return _too_many(wait) if wait else None
+
+
+def ratelimit(scope: str):
+    """Throttle `view` with the RATE_LIMITS[scope] buckets (apply inside login_required)."""
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            # a cache round-trip must not queue behind ORM work on the thread-sensitive executor
+            acheck = sync_to_async(check, thread_sensitive=False)
+
+            @functools.wraps(view)
+            async def _async_wrapped(request, *args, **kwargs):
+                user = await request.auser()
+                if get_backend() is _local:
+                    wait = check(scope, user.pk, _tenant_id(request))
+                else:
+                    wait = await acheck(scope, user.pk, _tenant_id(request))
+                if wait:
+                    return _too_many(wait)
+                return await view(request, *args, **kwargs)
+
+            return _async_wrapped
+
+        @functools.wraps(view)
+        def _wrapped(request, *args, **kwargs):
+            wait = check(scope, request.user.pk, _tenant_id(request))
+            if wait:
+                return _too_many(wait)
+            return view(request, *args, **kwargs)
+
+        return _wrapped
+
+    return decorator
@@ -0,0 +1,176 @@
+# core/request_context.py
+"""
+Request-scoped "who is asking, for which organization" context.
+
+Built once per request (memoized on the request object) from a single joined
+query over Profile -> Organization plus OrgMembership subqueries, and cached
+per session in Django's cache. The cache key carries two version stamps:
+
+- the tenant namespace (bumped on any Organization/Domain change), and
+- a per-user namespace (bumped on Profile/OrgMembership changes for that user),
+
+so edits are visible on the very next request. Middlewares and views should
+call get_request_context(request) instead of walking request.user.profile.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+
+from .cache import MISSING, bump_version_on_commit, get_stats, get_versions
+from .models import Organization
+from .multitenancy import TENANT_CACHE_NAMESPACE
+
+logger = logging.getLogger(__name__)
+ACTIVE_ORG_SESSION_KEY = "active_org_id"
+REQUEST_CONTEXT_TTL = getattr(settings, "REQUEST_CONTEXT_TTL", 300)
+
+context_cache_stats = get_stats("request_context")
+
+
+class RequestContext:
+    """Resolved user/profile/org/membership for one request."""
+
+    def __init__(self, user=None, profile=None, org=None, role=None, org_name=None, source=None):
+        self.user = user
+        self.profile = profile
+        self.org = org                  # active tenant (host > session > profile)
+        self.role = role                # OrgMembership.role in `org`, if any
+        self.org_name = org_name        # user's own org name (used by the domain lock)
+        self.source = source            # "host" | "session" | "profile" | None
+        self.domain_locked_out = False
+
+    @property
+    def user_id(self):
+        return getattr(self.user, "pk", None)
+
+    @property
+    def profile_org(self):
+        return getattr(self.profile, "organization", None)
+
+    def __repr__(self):
+        return f"<RequestContext user={self.user_id} org={getattr(self.org, 'pk', None)} role={self.role}>"
+
+
+def _user_namespace(user_id) -> str:
+    return f"reqctx-user:{user_id}"
+
+
+def invalidate_user_context(user_id) -> None:
+    bump_version_on_commit(_user_namespace(user_id))
+
+
+def _load_profile(user, org_id=None):
+    """
+    One query: the user's profile + its organization, the membership role in
+    the active org (or the profile org) and the first membership org name
+    (fallback for users without a profile org).
+    """
+    from accounts.models import OrgMembership, Profile
+
+    memberships = OrgMembership.objects.filter(user=OuterRef("user"))
+    role_org = org_id if org_id is not None else OuterRef("organization")
+    return (
+        Profile.objects
+        .select_related("organization")
+        .annotate(
+            membership_role=Subquery(memberships.filter(organization=role_org).values("role")[:1]),
+            membership_org_name=Subquery(memberships.order_by("pk").values("organization__name")[:1]),
+        )
+        .filter(user_id=user.pk)
+        .first()
+    )
+
+
+def _resolve(request, user):
+    tenant = getattr(request, "tenant", None)
+    session = getattr(request, "session", None)
+    session_org_id = session.get(ACTIVE_ORG_SESSION_KEY) if session is not None else None
+
+    if tenant is not None:
+        org_id, source = tenant.pk, "host"
+    elif session_org_id:
+        org_id, source = session_org_id, "session"
+    else:
+        org_id, source = None, "profile"
+
+    profile = _load_profile(user, org_id) if user is not None else None
+    prof_org = getattr(profile, "organization", None)
+
+    org = tenant
+    if source == "session":
+        if prof_org is not None and prof_org.pk == session_org_id:
+            org = prof_org
+        else:
+            org = Organization.objects.filter(pk=session_org_id).first()
+            if org is None:
+                logger.info("Stale active_org_id=%s; clearing.", session_org_id)
+                session.pop(ACTIVE_ORG_SESSION_KEY, None)
+                source = "profile"
+    if org is None and source == "profile":
+        org = prof_org
+        if org is None:
+            source = None
+
+    role = getattr(profile, "membership_role", None)
+    org_name = (prof_org.name if prof_org else None) or getattr(profile, "membership_org_name", None)
+    return RequestContext(user=user, profile=profile, org=org, role=role, org_name=org_name, source=source)
+
+
+def build_request_context(request) -> RequestContext:
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return RequestContext(org=getattr(request, "tenant", None),
+                              source="host" if getattr(request, "tenant", None) else None)
+
+    session = getattr(request, "session", None)
+    session_key = getattr(session, "session_key", None)
+    key = None
+    if session_key:
+        versions = get_versions(TENANT_CACHE_NAMESPACE, _user_namespace(user.pk))
+        tenant_id = getattr(getattr(request, "tenant", None), "pk", None)
+        key = "reqctx:{}:{}:{}:{}:{}".format(
+            session_key, user.pk, tenant_id,
+            versions[TENANT_CACHE_NAMESPACE], versions[_user_namespace(user.pk)],
+        )
+        cached = cache.get(key, MISSING)
+        if cached is not MISSING:
+            context_cache_stats.incr("shared_hit")
+            profile, org, role, org_name, source = cached
+            if profile is not None:
+                # prime the reverse one-to-one so user.profile costs no query
+                user.profile = profile
+            return RequestContext(user=user, profile=profile, org=org, role=role,
+                                  org_name=org_name, source=source)
+
+    context_cache_stats.incr("miss")
+    ctx = _resolve(request, user)
+    if ctx.profile is not None:
+        user.profile = ctx.profile
+    if key is not None:
+        cache.set(key, (ctx.profile, ctx.org, ctx.role, ctx.org_name, ctx.source), REQUEST_CONTEXT_TTL)
+    return ctx
+
+
+def _apply_domain_lock(request, ctx: RequestContext) -> None:
+    """Delaala domain lock verdict: only the configured org may use its portal."""
+    host = request.get_host().split(":")[0]
+    user = ctx.user
+    if host != getattr(settings, "DELAALA_DOMAIN", "") or user is None or user.is_superuser:
+        ctx.domain_locked_out = False
+        return
+    org = (ctx.org_name or "").strip().lower()
+    ctx.domain_locked_out = org != getattr(settings, "DELAALA_ORG_NAME", "").lower()
+
+
+def get_request_context(request) -> RequestContext:
+    """Return the memoized context, (re)building it if the user changed (login/logout)."""
+    ctx = getattr(request, "_request_context", None)
+    user = getattr(request, "user", None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    if ctx is None or ctx.user_id != user_id:
+        ctx = build_request_context(request)
+        _apply_domain_lock(request, ctx)
+        request._request_context = ctx
+    return ctx
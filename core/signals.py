@@ -0,0 +1,28 @@
+# core/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Domain, Organization
+from .multitenancy import invalidate_tenant_cache
+from .request_context import invalidate_user_context
+
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def invalidate_tenant_host_cache(sender, **kwargs):
+    # Host -> org mappings embed the Organization row, so any change to either
+    # model must drop them (the version bump, after commit, reaches every worker
+    # through the shared cache).
+    invalidate_tenant_cache()
+
+
+
+@receiver(post_save, sender="accounts.Profile")
+@receiver(post_delete, sender="accounts.Profile")
+@receiver(post_save, sender="accounts.OrgMembership")
+@receiver(post_delete, sender="accounts.OrgMembership")
+def invalidate_user_request_context(sender, instance, **kwargs):
+    # Cached request contexts embed the profile and membership role
+    invalidate_user_context(instance.user_id)
@@ -1,3 +1,11 @@
-from django.shortcuts import render
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import JsonResponse
 
-# Create your views here.
+from .cache import all_stats
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def cache_metrics(request):
+    """Per-worker cache/throughput counters (hit rates etc.) as JSON."""
+    return JsonResponse({"stats": all_stats()})
@@ -3,7 +3,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
 from .models import Shift, ShiftBooking
-from .models import ComplianceDocument, ComplianceDocType
+from .models import ComplianceDocument, ComplianceDocType, RoleDocRequirement, UserRoleCompliance
+from .models import DailyAttendanceFact
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AdminPasswordChangeForm
 
@@ -11,7 +12,7 @@ from django.contrib.auth.forms import AdminPasswordChangeForm
 class ShiftAdmin(admin.ModelAdmin):
     list_display = (
         "title", "date", "start_time", "end_time", "role",
-        "location", "allowed_postcode", "max_staff", "booked_count_admin",
+        "location", "allowed_postcode", "geofence_radius_m", "max_staff", "booked_count",
     )
     list_filter = ("role", "date")
     search_fields = ("title", "location", "allowed_postcode")
@@ -22,10 +23,6 @@ class ShiftAdmin(admin.ModelAdmin):
         # simplest and robust:
         return Shift._base_manager.all()
 
-    def booked_count_admin(self, obj):
-        return obj.bookings.count()   # <-- fixed
-    booked_count_admin.short_description = "Booked"
-
 
 
 @admin.register(ShiftBooking)
@@ -44,6 +41,8 @@ class ShiftBookingAdmin(admin.ModelAdmin):
         "paid_at",
         ("clock_in_at", admin.DateFieldListFilter),
         ("clock_out_at", admin.DateFieldListFilter),
+        "clock_in_verification",
+        "clock_out_verification",
     ]
     
     search_fields = (
@@ -55,21 +54,31 @@ class ShiftBookingAdmin(admin.ModelAdmin):
         "user", "shift", "booked_at",
         "clock_in_at", "clock_in_lat", "clock_in_lng", "clock_in_postcode",
         "clock_out_at", "clock_out_lat", "clock_out_lng", "clock_out_postcode",
+        "clock_in_verification", "clock_out_verification", "verification_note",
     )
     date_hierarchy = "shift__date"
     ordering = ("-id",)
 
-    actions = ["export_csv"]
-    
-    actions = ["mark_as_paid"]
+    actions = ["mark_as_paid", "reverify_locations", "export_csv"]
 
     @admin.action(description="Mark selected bookings as paid")
     def mark_as_paid(self, request, queryset):
-        updated = queryset.filter(clock_in_at__isnull=False, clock_out_at__isnull=False, paid_at__isnull=True) \
-                          .update(paid_at=timezone.now())
+        from .facts import keys_for_bookings, schedule_refresh
+        to_pay = queryset.filter(clock_in_at__isnull=False, clock_out_at__isnull=False, paid_at__isnull=True)
+        ids = list(to_pay.values_list("pk", flat=True))
+        updated = ShiftBooking.all_objects.filter(pk__in=ids, paid_at__isnull=True).update(paid_at=timezone.now())
+        schedule_refresh(keys_for_bookings(ids))  # update() fires no save signals
         self.message_user(request, f"{updated} booking(s) marked as paid.")
     
 
+    @admin.action(description="Re-verify punch locations against the shift geofence")
+    def reverify_locations(self, request, queryset):
+        from .geofence import verify_bookings
+        rows = verify_bookings(queryset)
+        failed = sorted({r["booking_id"] for r in rows if not r["ok"]})
+        msg = f"{len(rows)} punch(es) checked, {len(failed)} booking(s) outside the geofence"
+        self.message_user(request, f"{msg}: {', '.join(f'#{i}' for i in failed)}" if failed else f"{msg}.")
+
     # Niceties for columns
     def shift_date(self, obj):
         return obj.shift.date
@@ -94,26 +103,10 @@ class ShiftBookingAdmin(admin.ModelAdmin):
         return format_html('<span style="padding:.15rem .4rem;border-radius:.5rem;background:{};color:#fff;">{}</span>', color, txt)
     status_badge.short_description = "Status"
 
-    # Simple CSV export
+    # Streaming CSV export
     def export_csv(self, request, queryset):
-        import csv
-        from django.http import HttpResponse
-        resp = HttpResponse(content_type="text/csv")
-        resp["Content-Disposition"] = 'attachment; filename="shift_bookings.csv"'
-        writer = csv.writer(resp)
-        writer.writerow([
-            "ID", "User", "Shift", "Shift date", "Start", "End",
-            "Clock in at", "Clock in postcode", "Clock in lat", "Clock in lng",
-            "Clock out at", "Clock out postcode", "Clock out lat", "Clock out lng",
-        ])
-        for b in queryset.select_related("shift", "user"):
-            s = b.shift
-            writer.writerow([
-                b.id, str(b.user), str(s), s.date, s.start_time, s.end_time,
-                b.clock_in_at, b.clock_in_postcode, b.clock_in_lat, b.clock_in_lng,
-                b.clock_out_at, b.clock_out_postcode, b.clock_out_lat, b.clock_out_lng,
-            ])
-        return resp
+        from .exports import BOOKING_COLUMNS, booking_rows, stream_csv
+        return stream_csv(request, "shift_bookings.csv", BOOKING_COLUMNS, booking_rows(queryset.order_by("id")))
     export_csv.short_description = "Export selected to CSV"
 
 # Compliance models admin can go here too if desired
@@ -131,6 +124,38 @@ class ComplianceDocumentAdmin(admin.ModelAdmin):
     search_fields = ("user__username", "user__first_name", "user__last_name", "doc_type__name")
     autocomplete_fields = ("user", "doc_type", "uploaded_by")
 
+@admin.register(RoleDocRequirement)
+class RoleDocRequirementAdmin(admin.ModelAdmin):
+    list_display = ("organization", "role", "doc_type")
+    list_filter = ("organization", "role")
+    list_select_related = ("organization", "doc_type")
+    autocomplete_fields = ("doc_type",)
+
+@admin.register(UserRoleCompliance)
+class UserRoleComplianceAdmin(admin.ModelAdmin):
+    list_display = ("user", "role", "is_compliant", "valid_until", "refreshed_at")
+    list_filter = ("role", "is_compliant")
+    search_fields = ("user__username", "user__first_name", "user__last_name")
+    readonly_fields = ("user", "role", "is_compliant", "valid_until", "refreshed_at")
+
+@admin.register(DailyAttendanceFact)
+class DailyAttendanceFactAdmin(admin.ModelAdmin):
+    # maintained by shifts/facts.py; rebuild with `manage.py rebuild_attendance_facts`
+    list_display = ("date", "user", "role", "paid", "status", "bookings", "worked_minutes", "late_minutes", "refreshed_at")
+    list_filter = ("organization", "status", "paid", "role")
+    search_fields = ("user__username",)
+    date_hierarchy = "date"
+    list_select_related = ("user",)
+
+    def get_queryset(self, request):
+        return DailyAttendanceFact.all_objects.all()
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 # Customize Django Admin site branding
 admin.site.site_header = "Schedulo Admin"        # header (replaces "Django administration")
@@ -2,12 +2,13 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.contrib import messages
-from django.db.models import Count, F, Q
+from django.db.models import F, Q
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.views.decorators.http import require_POST
 
 from .models import Shift, ShiftBooking
+from .utils import create_booking, AlreadyBookedError, ShiftFullError
 from django.utils.dateparse import parse_date
 
 
@@ -20,8 +21,6 @@ def is_admin(user):
 @user_passes_test(is_admin)
 def manage_shifts(request):
     now = timezone.localtime()
-    today = now.date()
-    current_time = now.time()
 
     # --- Filters (GET) ---
     title_q   = (request.GET.get("title_q")   or "").strip()
@@ -32,13 +31,7 @@ def manage_shifts(request):
     only_open = (request.GET.get("only_open") or "") == "1"     # checkbox
 
     # upcoming / future shifts base
-    future_q = (
-        Q(date__gt=today) |
-        (Q(date=today) & (Q(end_time__gt=current_time) |
-                          Q(end_time__isnull=True, start_time__gt=current_time) |
-                          Q(start_time__isnull=True, end_time__isnull=True)))
-    )
-    shifts_qs = Shift.objects.filter(future_q)
+    shifts_qs = Shift.objects.upcoming(now=now)
 
     if title_q:
         shifts_qs = shifts_qs.filter(title__icontains=title_q)
@@ -53,10 +46,8 @@ def manage_shifts(request):
     if ed:
         shifts_qs = shifts_qs.filter(date__lte=ed)
 
-    shifts_qs = shifts_qs.annotate(booked_total=Count('shiftbooking'))
-
     if only_open:
-        shifts_qs = shifts_qs.filter(booked_total__lt=F('max_staff'))
+        shifts_qs = shifts_qs.filter(booked_count__lt=F('max_staff'))
 
     upcoming_shifts = shifts_qs.order_by('date', 'start_time')[:20]
 
@@ -69,13 +60,8 @@ def manage_shifts(request):
 
     # metrics
     total_shifts = Shift.objects.count()
-    available_upcoming = Shift.objects.filter(future_q).count()
-    booked_upcoming = (
-        Shift.objects.filter(future_q)
-        .annotate(booked_total=Count('shiftbooking'))
-        .filter(booked_total__gte=1)
-        .count()
-    )
+    available_upcoming = Shift.objects.upcoming(now=now).count()
+    booked_upcoming = Shift.objects.upcoming(now=now).filter(booked_count__gte=1).count()
     total_users = get_user_model().objects.count()
 
     # users (with search)
@@ -122,18 +108,16 @@ def admin_book_for_user(request):
     user = get_object_or_404(User, id=user_id)
     shift = get_object_or_404(Shift, id=shift_id)
 
-    # capacity check
-    current_count = ShiftBooking.objects.filter(shift=shift).count()
-    if current_count >= shift.max_staff:
+    # capacity + no dupes, claimed atomically
+    try:
+        create_booking(shift, user)
+    except ShiftFullError:
         messages.warning(request, f"'{shift.title}' is already full.")
         return redirect("admin_manage_shifts")
-
-    # no dupes
-    if ShiftBooking.objects.filter(user=user, shift=shift).exists():
+    except AlreadyBookedError:
         messages.info(request, f"{user} is already booked on '{shift.title}'.")
         return redirect("admin_manage_shifts")
 
-    ShiftBooking.objects.create(user=user, shift=shift)
     messages.success(request, f"Booked '{shift.title}' for {user}.")
     return redirect("admin_manage_shifts")
 
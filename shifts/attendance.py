@@ -0,0 +1,233 @@
+# shifts/attendance.py
+"""
+Settling attendance for shifts that are long over.
+
+`manage.py close_overdue_bookings` (run from cron) calls close_overdue()
+once the clock-out window has passed (AUTO_CLOSE_GRACE_HOURS after the
+scheduled end):
+
+- a booking that was clocked in but never clocked out gets
+  clock_out_at = the shift's scheduled end (or the clock-in, if that came
+  later: an admin clock-in after a no-show), a note, and
+  attendance_status = "auto_closed"
+- a booking that was never clocked in gets attendance_status = "no_show"
+
+Both sets are found through partial indexes (booking_open_punch_idx and
+booking_noshow_scan_idx). Each is closed with one UPDATE per organization,
+and the AuditLog rows are written with bulk_create. Reports read the stored
+status and only work it out live for bookings the job hasn't reached yet.
+
+team_punch() is the admin "clock the whole team in/out" action for one
+shift: the selected bookings are locked, sorted into outcomes, and the
+eligible ones are punched with a single conditional UPDATE.
+
+Both paths write with queryset.update(), which fires no save signals, so
+they schedule the DailyAttendanceFact refresh themselves.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, TextField, Value, When
+from django.db.models.functions import Coalesce, Concat, Greatest
+from django.utils import timezone
+
+from .facts import schedule_refresh
+from .models import AttendanceStatus, AuditAction, AuditLog, Shift, ShiftBooking, shift_bounds
+
+AUTO_CLOSE_NOTE = "[System] Not clocked out; closed at the scheduled end."
+
+
+def overdue_cutoff(now=None):
+    return (now or timezone.now()) - timedelta(hours=getattr(settings, "AUTO_CLOSE_GRACE_HOURS", 6))
+
+
+def appended_note(line: str):
+    """UPDATE expression adding `line` to clock_out_note (on a new line if there is one)."""
+    return Case(
+        When(clock_out_note="", then=Value(line)),
+        default=Concat("clock_out_note", Value("\n" + line), output_field=TextField()),
+        output_field=TextField(),
+    )
+
+
+def open_punches(cutoff):
+    """Clocked in, never clocked out, shift ended before `cutoff` (all organizations)."""
+    return ShiftBooking.all_objects.filter(
+        clock_in_at__isnull=False, clock_out_at__isnull=True,
+        clock_in_at__lt=cutoff,  # range on the partial index; also waits out the grace after a late clock-in
+        shift__end_at__lt=cutoff,
+    )
+
+
+def unattended(cutoff):
+    """Never clocked in, not settled yet, shift ended before `cutoff` (all organizations)."""
+    return ShiftBooking.all_objects.filter(
+        clock_in_at__isnull=True, attendance_status=AttendanceStatus.OPEN,
+        shift__end_at__lt=cutoff,
+    )
+
+
+def _by_org(qs):
+    grouped = defaultdict(list)
+    for row in qs.values("id", "organization_id", "user_id", "shift_id", "shift__end_at", "shift__date", "shift__role"):
+        grouped[row["organization_id"]].append(row)
+    return grouped
+
+
+def _auto_close(org_id, rows, cutoff):
+    ids = [r["id"] for r in rows]
+    # re-check the open-punch condition so a late clock-out in between wins;
+    # never clock out before the clock-in (admin/override clock-ins can come after the end)
+    return open_punches(cutoff).filter(organization_id=org_id, id__in=ids).update(
+        clock_out_at=Greatest(
+            Subquery(Shift.all_objects.filter(pk=OuterRef("shift_id")).values("end_at")[:1]),
+            F("clock_in_at"),
+        ),
+        clock_out_note=appended_note(AUTO_CLOSE_NOTE),
+        attendance_status=AttendanceStatus.AUTO_CLOSED,
+    )
+
+
+def _mark_no_show(org_id, rows, cutoff):
+    ids = [r["id"] for r in rows]
+    return unattended(cutoff).filter(organization_id=org_id, id__in=ids).update(
+        attendance_status=AttendanceStatus.NO_SHOW,
+    )
+
+
+def close_overdue(now=None, dry_run: bool = False) -> dict:
+    """
+    Settle every overdue booking. Returns per-organization counts:
+      {org_id: {"auto_closed": n, "no_show": n}}
+    With dry_run nothing is written and the counts are what would change.
+    """
+    cutoff = overdue_cutoff(now)
+    plans = (
+        (AttendanceStatus.AUTO_CLOSED, open_punches, _auto_close),
+        (AttendanceStatus.NO_SHOW, unattended, _mark_no_show),
+    )
+    result = defaultdict(lambda: {AttendanceStatus.AUTO_CLOSED: 0, AttendanceStatus.NO_SHOW: 0})
+
+    for status, finder, apply in plans:
+        for org_id, rows in _by_org(finder(cutoff)).items():
+            if dry_run:
+                result[org_id][status] = len(rows)
+                continue
+            with transaction.atomic():
+                # lock in the same order as the UPDATE so concurrent punches wait or are skipped
+                locked = list(
+                    finder(cutoff).select_for_update(of=("self",))
+                    .filter(organization_id=org_id, id__in=[r["id"] for r in rows])
+                    .order_by("id").values_list("id", flat=True)
+                )
+                locked = set(locked)
+                rows = [r for r in rows if r["id"] in locked]
+                if not rows:
+                    continue
+                result[org_id][status] = apply(org_id, rows, cutoff)
+                AuditLog.objects.bulk_create([_audit(status, r) for r in rows])
+                schedule_refresh((org_id, r["user_id"], r["shift__date"], r["shift__role"]) for r in rows)
+    return {org_id: {str(k): n for k, n in counts.items()} for org_id, counts in result.items()}
+
+
+def _audit(status, row):
+    end = row["shift__end_at"]
+    if status == AttendanceStatus.AUTO_CLOSED:
+        action, message = AuditAction.AUTO_CLOCK_OUT, "Not clocked out; closed automatically at the scheduled end."
+    else:
+        action, message = AuditAction.BOOKING_NO_SHOW, "Never clocked in; marked as no-show."
+    return AuditLog(
+        actor=None, subject_id=row["user_id"], shift_id=row["shift_id"], booking_id=row["id"],
+        action=action, message=message,
+        extra={"scheduled_end": end.isoformat() if end else None, "source": "close_overdue_bookings"},
+    )
+
+
+# ---------- Team clock in/out ----------
+# Without override, an admin punch must fall in the window the carer could have
+# punched in themselves (ShiftBooking.can_clock_in/can_clock_out plus the views'
+# grace: clock-in from 15 min before the start until 30 min after it, clock-out
+# from the start until 6 h after the end) and a clock-out needs a clock-in.
+# Override lifts both; a clock-out then backfills a missing clock-in to the
+# shift start.
+CLOCK_IN_EARLY = timedelta(minutes=15)
+CLOCK_IN_LATE = timedelta(minutes=30)
+CLOCK_OUT_LATE = timedelta(hours=6)
+
+
+def _punch_window(shift, kind):
+    start_at, end_at = shift_bounds(shift.date, shift.start_time, shift.end_time)
+    if kind == "in":
+        return start_at - CLOCK_IN_EARLY, start_at + CLOCK_IN_LATE
+    return start_at, end_at + CLOCK_OUT_LATE
+
+
+def team_punch(shift, booking_ids, kind: str, actor, override: bool = False, reason: str = "", now=None) -> list:
+    """
+    Clock the selected bookings of `shift` in (kind="in") or out (kind="out").
+    Returns one outcome per requested id, in request order:
+      {"booking", "user", "status", "msg"}
+    status is "applied", "already", "not_clocked_in", "outside_window" or "not_found".
+    """
+    now = now or timezone.now()
+    booking_ids = list(dict.fromkeys(booking_ids))
+    tag = "IN" if kind == "in" else "OUT"
+    note = f"[Admin {tag}] {reason}" if reason else ""
+
+    start, end = _punch_window(shift, kind)
+    in_window = override or start <= now <= end
+
+    with transaction.atomic():
+        bookings = {
+            b["id"]: b for b in
+            ShiftBooking.all_objects.select_for_update(of=("self",))
+            .filter(organization_id=shift.organization_id, shift=shift, id__in=booking_ids)
+            .order_by("id")
+            .values("id", "user_id", "user__username", "clock_in_at", "clock_out_at")
+        }
+
+        outcomes, eligible = [], []
+        for pk in booking_ids:
+            b = bookings.get(pk)
+            if b is None:
+                outcomes.append({"booking": pk, "user": None, "status": "not_found", "msg": "Not a booking on this shift."})
+                continue
+            outcome = {"booking": pk, "user": b["user__username"]}
+            if b[f"clock_{kind}_at"]:
+                outcome.update(status="already", msg=f"Already clocked {kind}.")
+            elif kind == "out" and not b["clock_in_at"] and not override:
+                outcome.update(status="not_clocked_in", msg="Not clocked in (tick override to backfill).")
+            elif not in_window:
+                outcome.update(status="outside_window", msg=f"Outside the clock-{kind} window (tick override).")
+            else:
+                outcome.update(status="applied", msg=f"Clocked {kind}.")
+                eligible.append(b)
+            outcomes.append(outcome)
+
+        if eligible:
+            changes = {f"clock_{kind}_at": now}
+            changes["attendance_status"] = AttendanceStatus.OPEN  # reopens a settled no-show
+            if kind == "out":
+                changes["clock_in_at"] = Coalesce(F("clock_in_at"), Value(min(start, now)))
+            if note:
+                changes["clock_out_note"] = appended_note(note)
+            ShiftBooking.all_objects.filter(
+                id__in=[b["id"] for b in eligible], **{f"clock_{kind}_at__isnull": True},
+            ).update(**changes)
+
+            AuditLog.objects.bulk_create([
+                AuditLog(
+                    actor=actor, subject_id=b["user_id"], shift=shift, booking_id=b["id"],
+                    action=AuditAction.CLOCK_IN if kind == "in" else AuditAction.CLOCK_OUT,
+                    message=f"Admin team clock-{kind} recorded.",
+                    extra={
+                        "team": True, "override": override, "reason": reason,
+                        "backfilled_clock_in": kind == "out" and not b["clock_in_at"],
+                    },
+                )
+                for b in eligible
+            ])
+            schedule_refresh((shift.organization_id, b["user_id"], shift.date, shift.role) for b in eligible)
+    return outcomes
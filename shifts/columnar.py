@@ -0,0 +1,156 @@
+# shifts/columnar.py
+"""
+Columnar (Parquet) export of bookings for payroll analytics.
+
+Each row is one ShiftBooking joined with its Shift and user. Columns are typed:
+- timestamps are timestamp[us, UTC], durations are duration[s], dates are date32
+- the worked/late/early figures and the status are the SQL annotations from
+  shifts/reporting.py
+- low-cardinality strings (role, status, username) are dictionary-encoded
+
+Rows are read EXPORT_CHUNK_SIZE at a time (values().iterator()) and written
+as Arrow record batches of the same size, so memory stays flat. The output
+is a Hive-style dataset partitioned by shift month:
+
+    <root>/month=2026-01/part-0.parquet
+    <root>/month=2026-02/part-0.parquet
+
+pyarrow.dataset, pandas, DuckDB and Spark read that as one table, with
+`month` as a column. The report pages send it as a zip (stored, since the
+Parquet pages are already zstd-compressed). `manage.py export_parquet`
+writes the directory.
+
+pyarrow is in requirements.txt. Where it isn't installed the writers raise
+ImportError and the views fall back to a message, as they do for openpyxl.
+"""
+import os
+import tempfile
+import zipfile
+
+from django.utils import timezone
+
+from .exports import EXPORT_CHUNK_SIZE, file_response, iterate
+from .reporting import with_attendance_metrics
+
+PARQUET_FIELDS = (
+    "id", "organization_id", "user_id", "user__username", "user__first_name", "user__last_name", "user__email",
+    "shift_id", "shift__title", "shift__role", "shift__location", "shift__date", "shift__start_at", "shift__end_at",
+    "clock_in_at", "clock_out_at", "clock_in_postcode", "clock_out_postcode", "paid_at", "attendance_status",
+    "worked_seconds", "late_minutes", "early_minutes", "status",
+)
+
+
+def _seconds_between(start, end):
+    return int((end - start).total_seconds()) if start and end else None
+
+
+def _full_name(v):
+    return f"{v['user__first_name']} {v['user__last_name']}".strip()
+
+
+def _columns(pa):
+    """(name, arrow type, value getter) for each output column."""
+    ts = pa.timestamp("us", tz="UTC")
+    label = pa.dictionary(pa.int32(), pa.string())
+    secs = pa.duration("s")
+    minutes = pa.int32()
+    return [
+        ("booking_id", pa.int64(), lambda v: v["id"]),
+        ("organization_id", pa.int64(), lambda v: v["organization_id"]),
+        ("user_id", pa.int64(), lambda v: v["user_id"]),
+        ("username", label, lambda v: v["user__username"]),
+        ("full_name", pa.string(), _full_name),
+        ("email", pa.string(), lambda v: v["user__email"]),
+        ("shift_id", pa.int64(), lambda v: v["shift_id"]),
+        ("shift_title", pa.string(), lambda v: v["shift__title"]),
+        ("role", label, lambda v: v["shift__role"]),
+        ("location", label, lambda v: v["shift__location"]),
+        ("shift_date", pa.date32(), lambda v: v["shift__date"]),
+        ("scheduled_start", ts, lambda v: v["shift__start_at"]),
+        ("scheduled_end", ts, lambda v: v["shift__end_at"]),
+        ("scheduled_duration", secs, lambda v: _seconds_between(v["shift__start_at"], v["shift__end_at"])),
+        ("clock_in_at", ts, lambda v: v["clock_in_at"]),
+        ("clock_out_at", ts, lambda v: v["clock_out_at"]),
+        ("worked_duration", secs, lambda v: v["worked_seconds"]),
+        ("late_minutes", minutes, lambda v: v["late_minutes"]),
+        ("early_minutes", minutes, lambda v: v["early_minutes"]),
+        ("status", label, lambda v: v["status"]),
+        ("attendance_status", label, lambda v: v["attendance_status"] or None),
+        ("clock_in_postcode", pa.string(), lambda v: v["clock_in_postcode"]),
+        ("clock_out_postcode", pa.string(), lambda v: v["clock_out_postcode"]),
+        ("paid", pa.bool_(), lambda v: v["paid_at"] is not None),
+        ("paid_at", ts, lambda v: v["paid_at"]),
+    ]
+
+
+def parquet_values(qs, now=None):
+    """values() dicts for `qs` in shift-date order (so months arrive one after another)."""
+    qs = with_attendance_metrics(qs, now or timezone.now()).order_by("shift__date", "id")
+    return iterate(qs, PARQUET_FIELDS)
+
+
+def write_dataset(root: str, values, batch_size: int = EXPORT_CHUNK_SIZE, compression: str = "zstd") -> dict:
+    """
+    Write `values` (from parquet_values) under `root` as month=YYYY-MM/part-0.parquet.
+    Returns {month: rows}. Raises ImportError when pyarrow isn't installed.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = _columns(pa)
+    schema = pa.schema([(name, typ) for name, typ, _ in columns])
+    counts = {}
+    writer, month, pending = None, None, []
+
+    def flush():
+        if pending:
+            arrays = [pa.array([get(v) for v in pending], type=typ) for _, typ, get in columns]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            counts[month] += len(pending)
+            pending.clear()
+
+    try:
+        for v in values:
+            row_month = v["shift__date"].strftime("%Y-%m")
+            if row_month != month:
+                flush()
+                if writer is not None:
+                    writer.close()
+                month = row_month
+                part_dir = os.path.join(root, f"month={month}")
+                os.makedirs(part_dir, exist_ok=True)
+                writer = pq.ParquetWriter(os.path.join(part_dir, "part-0.parquet"), schema, compression=compression)
+                counts[month] = 0
+            pending.append(v)
+            if len(pending) >= batch_size:
+                flush()
+        flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    return counts
+
+
+def write_zip(fh, values) -> dict:
+    """write_dataset() into a temporary directory, then zip it (stored) into `fh`."""
+    with tempfile.TemporaryDirectory(prefix="parquet-") as root:
+        counts = write_dataset(root, values)
+        with zipfile.ZipFile(fh, "w", compression=zipfile.ZIP_STORED) as zf:
+            for month in sorted(counts):
+                name = f"month={month}/part-0.parquet"
+                zf.write(os.path.join(root, name), name)
+    return counts
+
+
+def parquet_response(request, filename: str, qs, now=None):
+    """Zip of the month-partitioned dataset as a download. Raises ImportError without pyarrow."""
+    import pyarrow  # noqa: F401  (fail before creating anything)
+
+    fh = tempfile.TemporaryFile(suffix=".zip")  # removed when closed
+    try:
+        write_zip(fh, parquet_values(qs, now))
+        fh.seek(0)
+    except BaseException:
+        fh.close()
+        raise
+    return file_response(request, fh, filename, "application/zip")
@@ -0,0 +1,232 @@
+# shifts/export_jobs.py
+"""
+Report exports rendered off-request.
+
+When a report is asked for as CSV/XLSX/Parquet over a long range, it is not
+streamed. The view instead calls request_export() and redirects to the job
+page straight away: the request costs a couple of indexed lookups and at
+most one INSERT.
+A long range means more than EXPORT_BACKGROUND_DAYS days, an open-ended
+audit range, or ?background=1.
+
+- Dedupe: the parameters are normalized and hashed (params_hash).
+  - A queued or running job with the same hash is reused. A partial unique
+    constraint backs this, so two racing requests still end up sharing one job.
+  - So is a job that finished less than EXPORT_JOB_REUSE_MINUTES ago.
+- Worker: run_job() claims a queued job with a conditional UPDATE, so two
+  workers can't run it twice. It writes the rows through the same generators
+  as the views into a temporary file, updating rows_written every
+  EXPORT_PROGRESS_ROWS rows. The finished file is saved to the job's
+  FileField, which is tenant-scoped storage under tenants/<org>/exports/.
+- Jobs are rendered by a separate worker process,
+  `manage.py run_export_jobs --loop`, so a year-long XLSX never competes for
+  the GIL with the request handlers. It also expires old files. In-process
+  threads are opt-in (EXPORT_WORKERS > 0, e.g. a single-process dev setup):
+  then a job starts on one once the request's transaction commits.
+- Expiry: finished jobs keep their file for EXPORT_JOB_TTL_HOURS. Then
+  expire_jobs() deletes the file and the row. A job stuck in "running" for
+  longer than EXPORT_JOB_TIMEOUT_MINUTES is marked failed.
+"""
+import hashlib
+import json
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, close_old_connections, transaction
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils import timezone
+
+from .columnar import parquet_values, write_zip
+from .exports import (
+    ATTENDANCE_COLUMNS, AUDIT_COLUMNS, PAID_COLUMNS, attendance_queryset, attendance_rows, audit_queryset,
+    audit_rows, csv_chunks, paid_queryset, paid_rows, write_xlsx,
+)
+from .models import ExportJob, ExportKind, ExportStatus
+
+logger = logging.getLogger(__name__)
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# ---------- What each kind renders ----------
+def _attendance(job):
+    p = job.params
+    qs = attendance_queryset(job.organization, date.fromisoformat(p["start"]), date.fromisoformat(p["end"]),
+                             p.get("include_paid", False))
+    return qs, "Attendance", ATTENDANCE_COLUMNS, attendance_rows(qs, job.created_at), 18
+
+
+def _paid(job):
+    p = job.params
+    qs = paid_queryset(job.organization, date.fromisoformat(p["start"]), date.fromisoformat(p["end"]),
+                       p.get("user_q", ""), p.get("role_q", ""))
+    return qs, "Paid", PAID_COLUMNS, paid_rows(qs, job.created_at), 18
+
+
+def _audit(job):
+    qs = audit_queryset(job.params)
+    return qs, "Audit", AUDIT_COLUMNS, audit_rows(qs), 22
+
+
+SOURCES = {ExportKind.ATTENDANCE: _attendance, ExportKind.PAID: _paid, ExportKind.AUDIT: _audit}
+
+
+_EXTENSIONS = {"csv": "csv", "xlsx": "xlsx", "parquet": "parquet.zip"}
+_MISSING_LIBRARY = {"xlsx": "Excel export requires 'openpyxl'.", "parquet": "Parquet export requires 'pyarrow'."}
+
+
+def _filename(kind, fmt, params) -> str:
+    start, end = params.get("start") or "all", params.get("end") or "all"
+    return f"{kind}_{start}_{end}.{_EXTENSIONS[fmt]}"
+
+
+# ---------- Requesting ----------
+def runs_in_background(request, start, end) -> bool:
+    """Should this export go to a job? (?background=1, an open-ended range, or a long one)"""
+    if request.GET.get("background") == "1":
+        return True
+    if start is None or end is None:
+        return True
+    return (end - start).days + 1 > _setting("EXPORT_BACKGROUND_DAYS", 92)
+
+
+def params_hash(org_id, kind, fmt, params) -> str:
+    key = json.dumps([org_id, str(kind), fmt, params], sort_keys=True, default=str)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def request_export(org, user, kind, fmt: str, params: dict) -> ExportJob:
+    """The job that will produce (or already has) this export; a new one is queued only if needed."""
+    digest = params_hash(org.pk, kind, fmt, params)
+    reuse_after = timezone.now() - timedelta(minutes=_setting("EXPORT_JOB_REUSE_MINUTES", 15))
+    jobs = ExportJob.all_objects.filter(organization=org, params_hash=digest)
+
+    existing = (
+        jobs.filter(status__in=[ExportStatus.QUEUED, ExportStatus.RUNNING]).first()
+        or jobs.filter(status=ExportStatus.DONE, finished_at__gte=reuse_after, expires_at__gt=timezone.now())
+        .order_by("-finished_at").first()
+    )
+    if existing:
+        return existing
+    try:
+        with transaction.atomic():
+            job = ExportJob.all_objects.create(
+                organization=org, requested_by=user if user and user.is_authenticated else None,
+                kind=kind, format=fmt, params=params, params_hash=digest,
+                filename=_filename(kind, fmt, params),
+            )
+    except IntegrityError:
+        # an identical request won the race; share its job (or, if it already finished, look again)
+        live = jobs.filter(status__in=[ExportStatus.QUEUED, ExportStatus.RUNNING]).first()
+        return live or request_export(org, user, kind, fmt, params)
+    transaction.on_commit(lambda: enqueue(job.pk))
+    return job
+
+
+def redirect_to_job(job):
+    return redirect(f"{reverse('admin_export_jobs')}?job={job.pk}")
+
+
+# ---------- Worker ----------
+_executor = None
+
+
+def enqueue(job_id: int) -> None:
+    global _executor
+    workers = _setting("EXPORT_WORKERS", 0)
+    if workers <= 0:
+        return  # left for `manage.py run_export_jobs --loop`
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="exports")
+    _executor.submit(_run, job_id)
+
+
+def _run(job_id: int) -> None:
+    try:
+        run_job(job_id)
+        expire_jobs()
+    except Exception:
+        logger.exception("Export job %s failed", job_id)
+    finally:
+        close_old_connections()
+
+
+def _progress(job_id, rows, every: int):
+    """Pass rows through, recording how many have been written every `every` rows."""
+    n = 0
+    for row in rows:
+        yield row
+        n += 1
+        if n % every == 0:
+            ExportJob.all_objects.filter(pk=job_id).update(rows_written=n)
+
+
+def _write(fh, job, qs, title, columns, rows, width, every):
+    if job.format == "parquet":
+        write_zip(fh, _progress(job.pk, parquet_values(qs, job.created_at), every))
+        return
+    rows = _progress(job.pk, rows, every)
+    if job.format == "xlsx":
+        write_xlsx(fh, title, columns, rows, width=width)
+        return
+    for chunk in csv_chunks(columns, rows):
+        fh.write(chunk.encode("utf-8"))
+
+
+def run_job(job_id: int) -> bool:
+    """Render one queued job. Returns False if it wasn't queued (another worker has it, or it's gone)."""
+    now = timezone.now()
+    claimed = ExportJob.all_objects.filter(pk=job_id, status=ExportStatus.QUEUED).update(
+        status=ExportStatus.RUNNING, started_at=now, rows_written=0,
+    )
+    if not claimed:
+        return False
+    job = ExportJob.all_objects.select_related("organization").get(pk=job_id)
+    try:
+        qs, title, columns, rows, width = SOURCES[job.kind](job)
+        total = qs.count()
+        ExportJob.all_objects.filter(pk=job_id).update(total_rows=total)
+        every = _setting("EXPORT_PROGRESS_ROWS", 2000)
+        with tempfile.TemporaryFile(suffix=f".{job.format}") as fh:
+            _write(fh, job, qs, title, columns, rows, width, every)
+            fh.seek(0)
+            job.file.save(job.filename, File(fh), save=False)
+    except Exception as e:
+        error = _MISSING_LIBRARY.get(job.format, str(e)) if isinstance(e, ImportError) else str(e)[:1000]
+        ExportJob.all_objects.filter(pk=job_id).update(
+            status=ExportStatus.FAILED, error=error, finished_at=timezone.now(),
+            expires_at=timezone.now() + timedelta(hours=_setting("EXPORT_JOB_TTL_HOURS", 24)),
+        )
+        raise
+    finished = timezone.now()
+    ExportJob.all_objects.filter(pk=job_id).update(
+        status=ExportStatus.DONE, file=job.file.name, rows_written=total, finished_at=finished,
+        expires_at=finished + timedelta(hours=_setting("EXPORT_JOB_TTL_HOURS", 24)),
+    )
+    return True
+
+
+def expire_jobs(now=None) -> dict:
+    """Delete expired jobs and their files; fail jobs stuck running. Returns counts."""
+    now = now or timezone.now()
+    stuck = ExportJob.all_objects.filter(
+        status=ExportStatus.RUNNING,
+        started_at__lt=now - timedelta(minutes=_setting("EXPORT_JOB_TIMEOUT_MINUTES", 60)),
+    ).update(
+        status=ExportStatus.FAILED, error="The export worker stopped before finishing.", finished_at=now,
+        expires_at=now + timedelta(hours=_setting("EXPORT_JOB_TTL_HOURS", 24)),
+    )
+    expired = 0
+    for job in ExportJob.all_objects.filter(expires_at__lt=now).exclude(
+            status__in=[ExportStatus.QUEUED, ExportStatus.RUNNING]).iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        expired += 1
+    return {"expired": expired, "stuck": stuck}
@@ -0,0 +1,341 @@
+# shifts/exports.py
+"""
+Streaming report exports (attendance, paid bookings, audit log, admin bookings).
+
+Each export is a list of (header, key) columns plus a row generator. The
+generator reads a values() projection with .iterator(chunk_size=EXPORT_CHUNK_SIZE),
+so no model instances are built and only one chunk of rows is held at a time.
+stream_csv() sends the header straight away and then the body in blocks of
+EXPORT_ROWS_PER_WRITE rows. Memory stays flat however long the date range is.
+
+The views keep their HTML pages and use the same row generators for the rows
+on screen. Worked/late/early minutes and the status are SQL annotations
+(shifts/reporting.py); the generators only format them.
+
+xlsx_response() writes the same rows with an openpyxl write-only workbook
+into a temporary file and returns it as a FileResponse. The rows are never
+held in memory as cells, and the finished file is not copied into the
+response body.
+
+Under ASGI the body is handed over as an async iterator that pulls each block
+through sync_to_async. A plain generator would make Django buffer the whole
+export in a list before sending any of it.
+"""
+import csv
+import json
+import tempfile
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.db.models.functions import TruncMinute
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import AuditAction, AuditLog, ShiftBooking
+from .reporting import with_attendance_metrics
+
+EXPORT_CHUNK_SIZE = getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+EXPORT_ROWS_PER_WRITE = getattr(settings, "EXPORT_ROWS_PER_WRITE", 500)
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_ACTION_LABELS = dict(AuditAction.choices)
+
+
+def _hhmm(t, default=""):
+    return t.strftime("%H:%M") if t else default
+
+
+def _worked(seconds):
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}"
+
+
+def iterate(qs, fields):
+    """values() projection of `qs`, fetched in chunks."""
+    return qs.values(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+# ---------- Attendance ----------
+# worked/late/early/status come from SQL annotations (shifts/reporting.py)
+ATTENDANCE_FIELDS = (
+    "id", "user__username", "shift__date", "shift__start_time", "shift__end_time",
+    "shift__role", "shift__title", "clock_in_time", "clock_out_time",
+    "worked_seconds", "late_minutes", "early_minutes", "status",
+)
+ATTENDANCE_COLUMNS = [
+    ("Date", "date"), ("User", "user"), ("Role", "role"), ("Title", "title"),
+    ("Start", "start"), ("End", "end"), ("Clock In", "clock_in"), ("Clock Out", "clock_out"),
+    ("Worked (HH:MM)", "worked"), ("Late (min)", "late_min"), ("Early Leave (min)", "early_min"),
+    ("Status", "status"),
+]
+
+
+def attendance_row(v) -> dict:
+    return {
+        "date": v["shift__date"].isoformat(),
+        "user": v["user__username"],
+        "role": v["shift__role"],
+        "title": v["shift__title"],
+        "start": _hhmm(v["shift__start_time"], "00:00"),
+        "end": _hhmm(v["shift__end_time"], "23:59"),
+        "clock_in": _hhmm(v["clock_in_time"]),
+        "clock_out": _hhmm(v["clock_out_time"]),
+        "worked": _worked(v["worked_seconds"]),
+        "late_min": v["late_minutes"],
+        "early_min": v["early_minutes"],
+        "status": v["status"],
+    }
+
+
+def attendance_queryset(org, start, end, include_paid: bool = False):
+    """Bookings shown on the attendance report (org + shift date range, unpaid unless include_paid)."""
+    qs = (
+        ShiftBooking.all_objects  # bypass any implicit tenant filtering
+        .filter(organization=org)
+        .filter(shift__date__gte=start, shift__date__lte=end)
+    )
+    if not include_paid:
+        qs = qs.filter(paid_at__isnull=True)
+    return qs.order_by("shift__date", "shift__start_time", "user__username")
+
+
+def attendance_rows(qs, now=None):
+    qs = with_attendance_metrics(qs, now or timezone.now())
+    for v in iterate(qs, ATTENDANCE_FIELDS):
+        yield attendance_row(v)
+
+
+# the report page also shows the clock-out note and signature; exports don't
+_PAGE_FIELDS = ("clock_out_note", "clock_out_supervisor_name", "clock_out_signature", "clock_out_signature_thumb")
+
+
+def attendance_page_rows(qs, now=None):
+    """attendance_row()s plus note, signed_by, signature_url and thumb_url (thumbnail, else the original)."""
+    storage = ShiftBooking._meta.get_field("clock_out_signature").storage
+    thumbs = ShiftBooking._meta.get_field("clock_out_signature_thumb").storage
+    qs = with_attendance_metrics(qs, now or timezone.now())
+    for v in iterate(qs, ATTENDANCE_FIELDS + _PAGE_FIELDS):
+        row = attendance_row(v)
+        signature = storage.url(v["clock_out_signature"]) if v["clock_out_signature"] else ""
+        row.update(
+            note=v["clock_out_note"],
+            signed_by=v["clock_out_supervisor_name"],
+            signature_url=signature,
+            thumb_url=thumbs.url(v["clock_out_signature_thumb"]) if v["clock_out_signature_thumb"] else signature,
+        )
+        yield row
+
+
+# ---------- Paid bookings ----------
+PAID_FIELDS = (
+    "id", "user__username", "shift__date", "shift__start_time", "shift__end_time",
+    "shift__role", "shift__title", "clock_in_time", "clock_out_time", "worked_seconds", "paid_minute",
+)
+PAID_COLUMNS = [
+    ("Date", "date"), ("User", "user"), ("Role", "role"), ("Title", "title"),
+    ("Start", "start"), ("End", "end"), ("Clock In", "clock_in"), ("Clock Out", "clock_out"),
+    ("Worked (HH:MM)", "worked"), ("Paid At", "paid_at"),
+]
+
+
+def paid_row(v) -> dict:
+    return {
+        "date": v["shift__date"].isoformat(),
+        "user": v["user__username"],
+        "role": v["shift__role"],
+        "title": v["shift__title"],
+        "start": _hhmm(v["shift__start_time"], "00:00"),
+        "end": _hhmm(v["shift__end_time"], "23:59"),
+        "clock_in": _hhmm(v["clock_in_time"]),
+        "clock_out": _hhmm(v["clock_out_time"]),
+        "worked": _worked(v["worked_seconds"]),
+        "paid_at": v["paid_minute"].strftime("%Y-%m-%d %H:%M"),
+        "booking_id": v["id"],
+    }
+
+
+def paid_queryset(org, start, end, user_q: str = "", role_q: str = ""):
+    """Paid bookings in the shift date range, optionally narrowed by user text and role."""
+    qs = (
+        ShiftBooking.all_objects                # bypass any tenant manager
+        .filter(organization=org)               # scope to active org
+        .filter(paid_at__isnull=False)
+        .filter(shift__date__gte=start, shift__date__lte=end)
+        .order_by("-paid_at", "-id")
+    )
+    if user_q:
+        qs = qs.filter(
+            Q(user__username__icontains=user_q) |
+            Q(user__first_name__icontains=user_q) |
+            Q(user__last_name__icontains=user_q) |
+            Q(user__email__icontains=user_q)
+        )
+    if role_q:
+        qs = qs.filter(shift__role__iexact=role_q)
+    return qs
+
+
+def paid_rows(qs, now=None):
+    qs = with_attendance_metrics(qs, now or timezone.now()).annotate(paid_minute=TruncMinute("paid_at"))
+    for v in iterate(qs, PAID_FIELDS):
+        yield paid_row(v)
+
+
+# ---------- Audit log ----------
+AUDIT_FIELDS = ("at", "action", "actor__username", "subject__username", "shift__title", "booking_id", "message", "extra")
+AUDIT_COLUMNS = [
+    ("Timestamp", "at"), ("Action", "action"), ("Actor", "actor"), ("Subject", "subject"),
+    ("Shift", "shift"), ("Booking", "booking"), ("Message", "message"), ("Extra JSON", "extra"),
+]
+
+
+AUDIT_FILTERS = ("q", "action", "user", "subject", "shift", "booking", "start", "end")
+
+
+def audit_queryset(filters: dict):
+    """AuditLog rows matching the audit page's filters (AUDIT_FILTERS; empty values are ignored)."""
+    f = {k: (filters.get(k) or "").strip() for k in AUDIT_FILTERS}
+    qs = AuditLog.objects.select_related("actor", "subject", "shift", "booking")
+
+    if f["q"]:
+        qs = qs.filter(
+            Q(message__icontains=f["q"]) |
+            Q(actor__username__icontains=f["q"]) |
+            Q(subject__username__icontains=f["q"])
+        )
+    if f["action"]:
+        qs = qs.filter(action=f["action"])
+    for key, field in (("user", "actor_id"), ("subject", "subject_id"), ("shift", "shift_id"), ("booking", "booking_id")):
+        if f[key].isdigit():
+            qs = qs.filter(**{field: int(f[key])})
+    if f["start"]:
+        qs = qs.filter(at__date__gte=f["start"])
+    if f["end"]:
+        qs = qs.filter(at__date__lte=f["end"])
+    return qs.order_by("-at")
+
+
+def audit_rows(qs):
+    for v in iterate(qs, AUDIT_FIELDS):
+        yield {
+            "at": timezone.localtime(v["at"]).strftime("%Y-%m-%d %H:%M:%S"),
+            "action": _ACTION_LABELS.get(v["action"], v["action"]),
+            "actor": v["actor__username"] or "",
+            "subject": v["subject__username"] or "",
+            "shift": v["shift__title"] or "",
+            "booking": v["booking_id"] or "",
+            "message": (v["message"] or "").replace("\n", " "),
+            "extra": json.dumps(v["extra"] or {}, default=str),
+        }
+
+
+# ---------- Admin: raw bookings ----------
+BOOKING_FIELDS = (
+    "id", "user__username", "shift__title", "shift__date", "shift__start_time", "shift__end_time",
+    "clock_in_at", "clock_in_postcode", "clock_in_lat", "clock_in_lng",
+    "clock_out_at", "clock_out_postcode", "clock_out_lat", "clock_out_lng",
+)
+BOOKING_COLUMNS = [
+    ("ID", "id"), ("User", "user__username"), ("Shift", "shift"), ("Shift date", "shift__date"),
+    ("Start", "shift__start_time"), ("End", "shift__end_time"),
+    ("Clock in at", "clock_in_at"), ("Clock in postcode", "clock_in_postcode"),
+    ("Clock in lat", "clock_in_lat"), ("Clock in lng", "clock_in_lng"),
+    ("Clock out at", "clock_out_at"), ("Clock out postcode", "clock_out_postcode"),
+    ("Clock out lat", "clock_out_lat"), ("Clock out lng", "clock_out_lng"),
+]
+
+
+def booking_rows(qs):
+    for v in iterate(qs, BOOKING_FIELDS):
+        st, et = v["shift__start_time"], v["shift__end_time"]
+        v["shift"] = (f"{v['shift__title']} ({v['shift__date']} "
+                      f"{st.strftime('%H:%M') if st else '--:--'}-{et.strftime('%H:%M') if et else '--:--'})")
+        yield v
+
+
+# ---------- Streaming ----------
+def csv_chunks(columns, rows):
+    """Yield CSV text: the header first, then blocks of EXPORT_ROWS_PER_WRITE rows."""
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([header for header, _ in columns])
+    yield buf.getvalue()
+
+    keys = [key for _, key in columns]
+    pending = 0
+    for row in rows:
+        if pending == 0:
+            buf.seek(0)
+            buf.truncate()
+        writer.writerow(["" if row[k] is None else row[k] for k in keys])
+        pending += 1
+        if pending >= EXPORT_ROWS_PER_WRITE:
+            yield buf.getvalue()
+            pending = 0
+    if pending:
+        yield buf.getvalue()
+
+
+async def _aiterate(chunks):
+    # one thread for the whole export: the DB cursor behind .iterator() stays on its connection
+    step = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await step(chunks, None)) is not None:
+        yield chunk
+
+
+def stream_csv(request, filename: str, columns, rows) -> StreamingHttpResponse:
+    chunks = csv_chunks(columns, rows)
+    content = _aiterate(chunks) if isinstance(request, ASGIRequest) else chunks
+    response = StreamingHttpResponse(content, content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def write_xlsx(fh, title: str, columns, rows, width: int = 18) -> int:
+    """Write rows to `fh` as a one-sheet workbook in write-only mode. Returns the row count."""
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    for i in range(1, len(columns) + 1):
+        ws.column_dimensions[get_column_letter(i)].width = width  # must precede the first row
+    ws.append([header for header, _ in columns])
+
+    keys = [key for _, key in columns]
+    count = 0
+    for row in rows:
+        ws.append([row[k] for k in keys])
+        count += 1
+    wb.save(fh)
+    return count
+
+
+def _read_blocks(fh, block_size: int = 64 * 1024):
+    try:
+        while block := fh.read(block_size):
+            yield block
+    finally:
+        fh.close()
+
+
+def xlsx_response(request, filename: str, title: str, columns, rows, width: int = 18) -> FileResponse:
+    """Raises ImportError when openpyxl isn't installed (callers fall back to CSV)."""
+    fh = tempfile.TemporaryFile(suffix=".xlsx")  # removed when closed
+    try:
+        write_xlsx(fh, title, columns, rows, width=width)
+        fh.seek(0)
+    except BaseException:
+        fh.close()
+        raise
+    return file_response(request, fh, filename, XLSX_CONTENT_TYPE)
+
+
+def file_response(request, fh, filename: str, content_type=None) -> FileResponse:
+    """Download of an open binary file; under ASGI it is read in blocks off the event loop."""
+    response = FileResponse(fh, as_attachment=True, filename=filename, content_type=content_type)
+    if isinstance(request, ASGIRequest):
+        response.streaming_content = _aiterate(_read_blocks(fh))  # headers (length, name) are already set
+    return response
@@ -0,0 +1,264 @@
+# shifts/facts.py
+"""
+DailyAttendanceFact upkeep, and the report queries that read it.
+
+There is one fact row per (organization, user, shift date, role, paid). To
+refresh a key, its bookings are aggregated again (one GROUP BY over that
+user's bookings on that day). Then the rows are upserted, and any row whose
+bookings are gone is deleted. A refresh is idempotent, so a missed or
+repeated trigger never leaves the counts off.
+
+Refreshes are triggered:
+- by the ShiftBooking/Shift signals in shifts/signals.py (clock in/out,
+  edits, mark paid, cancellations, shift date/role/time changes), once the
+  transaction commits
+- explicitly, by the bulk paths that skip post_save (queryset.update() and
+  bulk_update()): close_overdue(), team_punch(), the offline punch sync and
+  the admin "mark as paid" action
+
+The status does not depend on the clock. A booking nobody clocked in to
+stays "pending" until close_overdue_bookings settles it as a no-show.
+
+`manage.py rebuild_attendance_facts` backfills a range, and
+`manage.py check_attendance_facts` compares the rollup with ShiftBooking.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Case, Count, ExpressionWrapper, F, IntegerField, Max, Min, Q, Sum, Value, When,
+)
+from django.db.models.functions import TruncWeek
+
+from .models import AttendanceStatus, DailyAttendanceFact, DailyStatus, Shift, ShiftBooking
+from .reporting import SecondsBetween, punch_metrics
+
+FACT_FIELDS = (
+    "bookings", "present", "no_show", "late",
+    "scheduled_minutes", "worked_minutes", "late_minutes", "early_minutes", "status",
+)
+_RANKS = list(DailyStatus)  # best to worst
+_REFRESH_BATCH = 500
+
+
+def booking_key(booking):
+    """(organization_id, user_id, date, role) of the fact row a booking counts towards, or None."""
+    # read the shift afresh: a cached booking.shift may predate an edit of the shift
+    day_role = Shift.all_objects.filter(pk=booking.shift_id).values_list("date", "role").first()
+    return (booking.organization_id, booking.user_id, *day_role) if day_role else None
+
+
+def keys_for_bookings(booking_ids) -> set:
+    return set(
+        ShiftBooking.all_objects.filter(id__in=list(booking_ids))
+        .values_list("organization_id", "user_id", "shift__date", "shift__role")
+    )
+
+
+def _status_rank():
+    def rank(status):
+        return Value(_RANKS.index(status))
+
+    return Case(
+        When(attendance_status=AttendanceStatus.NO_SHOW, then=rank(DailyStatus.NO_SHOW)),
+        When(attendance_status=AttendanceStatus.AUTO_CLOSED, then=rank(DailyStatus.AUTO_CLOSED)),
+        When(clock_in_at__isnull=True, then=rank(DailyStatus.PENDING)),
+        When(clock_out_at__isnull=True, then=rank(DailyStatus.INCOMPLETE)),
+        default=rank(DailyStatus.PRESENT), output_field=IntegerField(),
+    )
+
+
+def _aggregate(bookings):
+    """One dict per fact key: the key fields plus FACT_FIELDS, computed from `bookings`."""
+    rows = (
+        bookings.order_by()
+        .annotate(
+            **punch_metrics(),
+            scheduled_seconds=Case(
+                When(shift__end_at__gt=F("shift__start_at"),
+                     then=SecondsBetween(F("shift__end_at"), F("shift__start_at"))),
+                default=Value(0), output_field=IntegerField(),
+            ),
+            rank=_status_rank(),
+        )
+        .values(
+            "organization_id", "user_id",
+            fact_date=F("shift__date"), fact_role=F("shift__role"),
+            fact_paid=ExpressionWrapper(Q(paid_at__isnull=False), output_field=BooleanField()),
+        )
+        .annotate(
+            n=Count("id"),
+            n_present=Count("id", filter=Q(rank=_RANKS.index(DailyStatus.PRESENT))),
+            n_no_show=Count("id", filter=Q(rank=_RANKS.index(DailyStatus.NO_SHOW))),
+            n_late=Count("id", filter=Q(late_minutes__gt=0)),
+            scheduled=Sum("scheduled_seconds"),
+            worked=Sum("worked_seconds"),
+            late_total=Sum("late_minutes"),
+            early_total=Sum("early_minutes"),
+            worst=Max("rank"),
+        )
+    )
+    for r in rows:
+        yield {
+            "organization_id": r["organization_id"], "user_id": r["user_id"],
+            "date": r["fact_date"], "role": r["fact_role"], "paid": bool(r["fact_paid"]),
+            "bookings": r["n"], "present": r["n_present"], "no_show": r["n_no_show"], "late": r["n_late"],
+            "scheduled_minutes": (r["scheduled"] + 30) // 60,
+            "worked_minutes": (r["worked"] + 30) // 60,
+            "late_minutes": r["late_total"],
+            "early_minutes": r["early_total"],
+            "status": _RANKS[r["worst"]].value,
+        }
+
+
+def _upsert(rows) -> int:
+    DailyAttendanceFact.all_objects.bulk_create(
+        [DailyAttendanceFact(**row) for row in rows], batch_size=1000,
+        update_conflicts=True, unique_fields=["organization", "user", "date", "role", "paid"],
+        update_fields=[*FACT_FIELDS, "refreshed_at"],
+    )
+    return len(rows)
+
+
+def refresh_facts(keys) -> int:
+    """Recompute the fact rows for `keys` ((org_id, user_id, date, role) tuples). Returns rows written."""
+    by_org = defaultdict(set)
+    for org_id, user_id, day, role in keys:
+        by_org[org_id].add((user_id, day, role))
+
+    written = 0
+    for org_id, org_keys in by_org.items():
+        org_keys = sorted(org_keys, key=lambda k: (k[0], k[1], k[2]))
+        for i in range(0, len(org_keys), _REFRESH_BATCH):
+            chunk = set(org_keys[i:i + _REFRESH_BATCH])
+            users = {k[0] for k in chunk}
+            days = {k[1] for k in chunk}
+            bookings = ShiftBooking.all_objects.filter(organization_id=org_id, user_id__in=users, shift__date__in=days)
+            rows = [r for r in _aggregate(bookings) if (r["user_id"], r["date"], r["role"]) in chunk]
+            live = {(r["user_id"], r["date"], r["role"], r["paid"]) for r in rows}
+            with transaction.atomic():
+                _upsert(rows)
+                existing = (
+                    DailyAttendanceFact.all_objects
+                    .filter(organization_id=org_id, user_id__in=users, date__in=days)
+                    .values_list("id", "user_id", "date", "role", "paid")
+                )
+                stale = [pk for pk, *key in existing if tuple(key[:3]) in chunk and tuple(key) not in live]
+                if stale:
+                    DailyAttendanceFact.all_objects.filter(id__in=stale).delete()
+            written += len(rows)
+    return written
+
+
+def schedule_refresh(keys):
+    """Refresh `keys` once the current transaction commits (right away outside one)."""
+    keys = set(keys)
+    if keys:
+        transaction.on_commit(lambda: refresh_facts(keys))
+
+
+# ---------- Backfill / consistency ----------
+def _windows(start, end, days: int = 31):
+    while start <= end:
+        stop = min(start + timedelta(days=days - 1), end)
+        yield start, stop
+        start = stop + timedelta(days=1)
+
+
+def _date_range(org_id, start, end):
+    """Fill a missing bound from the org's earliest/latest booking or fact date."""
+    if start is None or end is None:
+        bookings = ShiftBooking.all_objects.filter(organization_id=org_id).aggregate(
+            first=Min("shift__date"), last=Max("shift__date"))
+        facts = DailyAttendanceFact.all_objects.filter(organization_id=org_id).aggregate(
+            first=Min("date"), last=Max("date"))
+        firsts = [d for d in (bookings["first"], facts["first"]) if d]
+        lasts = [d for d in (bookings["last"], facts["last"]) if d]
+        start = start or (min(firsts) if firsts else None)
+        end = end or (max(lasts) if lasts else None)
+    return start, end
+
+
+def rebuild_facts(org_id, start=None, end=None) -> int:
+    """Replace the org's fact rows in [start, end] (default: all dates) with fresh aggregates."""
+    start, end = _date_range(org_id, start, end)
+    if start is None or end is None:
+        return 0
+    written = 0
+    for lo, hi in _windows(start, end):
+        with transaction.atomic():
+            DailyAttendanceFact.all_objects.filter(organization_id=org_id, date__range=(lo, hi)).delete()
+            bookings = ShiftBooking.all_objects.filter(organization_id=org_id, shift__date__range=(lo, hi))
+            written += _upsert(list(_aggregate(bookings)))
+    return written
+
+
+def compare_facts(org_id, start=None, end=None):
+    """
+    Yield (key, stored, expected) for every fact row that differs from its
+    bookings. key is (user_id, date, role, paid); stored/expected are dicts of
+    FACT_FIELDS, or None when the row is missing on that side.
+    """
+    start, end = _date_range(org_id, start, end)
+    if start is None or end is None:
+        return
+    for lo, hi in _windows(start, end):
+        expected = {
+            (r["user_id"], r["date"], r["role"], r["paid"]): {f: r[f] for f in FACT_FIELDS}
+            for r in _aggregate(ShiftBooking.all_objects.filter(organization_id=org_id, shift__date__range=(lo, hi)))
+        }
+        stored = {
+            (r["user_id"], r["date"], r["role"], r["paid"]): {f: r[f] for f in FACT_FIELDS}
+            for r in DailyAttendanceFact.all_objects.filter(organization_id=org_id, date__range=(lo, hi))
+            .values("user_id", "date", "role", "paid", *FACT_FIELDS)
+        }
+        for key in sorted(expected.keys() | stored.keys(), key=lambda k: (k[1], k[0], k[2], k[3])):
+            if stored.get(key) != expected.get(key):
+                yield key, stored.get(key), expected.get(key)
+
+
+# ---------- Reads ----------
+def facts_between(org, start, end, paid=None):
+    """Fact rows for `org` with date in [start, end]: a range scan on (organization[, paid], date)."""
+    qs = DailyAttendanceFact.all_objects.filter(organization=org, date__gte=start, date__lte=end)
+    return qs if paid is None else qs.filter(paid=paid)
+
+
+def fact_summary(facts) -> dict:
+    """Totals over `facts` in one aggregate query; avg_late is per late booking."""
+    totals = facts.order_by().aggregate(
+        total=Sum("bookings", default=0),
+        present=Sum("present", default=0),
+        no_show=Sum("no_show", default=0),
+        late=Sum("late", default=0),
+        late_minutes=Sum("late_minutes", default=0),
+        scheduled_minutes=Sum("scheduled_minutes", default=0),
+        worked_minutes=Sum("worked_minutes", default=0),
+    )
+    totals["avg_late"] = totals["late_minutes"] / totals["late"] if totals["late"] else None
+    return totals
+
+
+GROUPINGS = {
+    "user": F("user__username"),
+    "role": F("role"),
+    "week": TruncWeek("date"),
+}
+
+
+def fact_totals(facts, group: str) -> list:
+    """Per-group totals (GROUP BY user, role or ISO week), ordered by the group key."""
+    return list(
+        facts.order_by()
+        .values(key=GROUPINGS[group])
+        .annotate(
+            bookings_total=Sum("bookings"),
+            present_total=Sum("present"),
+            no_show_total=Sum("no_show"),
+            worked_minutes_total=Sum("worked_minutes"),
+            late_minutes_total=Sum("late_minutes"),
+            early_minutes_total=Sum("early_minutes"),
+        )
+        .order_by("key")
+    )
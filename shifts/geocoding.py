@@ -0,0 +1,451 @@
+# shifts/geocoding.py
+"""
+Reverse geocoding for clock-in/clock-out punches.
+
+resolve_postcode() is the blocking variant used by the WSGI views;
+aresolve_postcode() is the non-blocking one used by the async punch views
+(served under ASGI), so a slow geocoder no longer pins a whole worker.
+Both return None on any failure.
+
+Lookups go through the backends listed in settings.POSTCODE_RESOLVER_BACKENDS,
+in order, until one returns a postcode:
+
+  OfflineIndexBackend - nearest centroid from the local grid index
+                        (shifts.postcode_index); microseconds, no network
+  NominatimBackend    - OpenStreetMap Nominatim over HTTP
+
+geocode_postcode() goes the other way (postcode -> site coordinates). A
+shift's site is geocoded once its allowed_postcode is saved and the
+transaction has committed, on SITE_GEOCODE_WORKERS threads, so saving a
+shift never waits on Nominatim. `manage.py geocode_shift_sites` backfills
+shifts that have a postcode but no site yet.
+
+Remote lookups are cached per geohash cell (GEOCODE_CACHE_PRECISION, 7 ~ 150 m),
+so carers punching at the same site share one upstream answer:
+
+  tier 1  per-process LRU            (no network)
+  tier 2  Django's shared cache      (across workers)
+  miss    one upstream call per cell; concurrent misses for the same cell in a
+          process wait on that call instead of firing their own (single-flight)
+
+Failures / "no postcode here" are cached too, for GEOCODE_CACHE_NEGATIVE_TTL.
+Counters and upstream latency are in the "reverse_geocode" stats.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from core.cache import LRUTTLCache, MISSING, get_stats
+from .postcode_index import PostcodeIndex
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+NOMINATIM_REVERSE_URL = getattr(settings, "NOMINATIM_REVERSE_URL", "https://nominatim.openstreetmap.org/reverse")
+NOMINATIM_SEARCH_URL = getattr(settings, "NOMINATIM_SEARCH_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_COUNTRY_CODES = getattr(settings, "NOMINATIM_COUNTRY_CODES", "gb")
+GEOCODER_TIMEOUT = getattr(settings, "GEOCODER_TIMEOUT", 6)
+_HEADERS = {"User-Agent": "ScheduloApp/1.0 (contact: admin@example.com)"}
+
+DEFAULT_BACKENDS = [
+    "shifts.geocoding.OfflineIndexBackend",
+    "shifts.geocoding.NominatimBackend",
+]
+
+geocode_stats = get_stats("geocoder")
+
+
+def canonical_postcode(postcode: str) -> str:
+    """UK display form: outward code, space, 3-char inward code ("SW1A1AA" -> "SW1A 1AA")."""
+    n = "".join(ch for ch in postcode.upper() if ch.isalnum())
+    return f"{n[:-3]} {n[-3:]}" if len(n) > 3 else n
+
+
+class PostcodeBackend(ABC):
+    """A resolver backend. Return None to let the next backend try."""
+    name = "backend"
+    remote = False  # True if a lookup leaves the process (skipped when local_only)
+
+    @abstractmethod
+    def resolve(self, lat: float, lng: float) -> str | None:
+        """Reverse lookup: (lat, lng) -> postcode."""
+
+    def locate(self, postcode: str) -> tuple[float, float] | None:
+        """Forward lookup: postcode -> (lat, lng) centroid."""
+        return None
+
+    async def aresolve(self, lat: float, lng: float) -> str | None:
+        # local backends answer in microseconds; no point hopping threads
+        return self.resolve(lat, lng)
+
+
+class OfflineIndexBackend(PostcodeBackend):
+    name = "offline"
+
+    def __init__(self, path: str | None = None, max_km: float | None = None):
+        self.path = path or getattr(settings, "POSTCODE_INDEX_PATH", "")
+        self.max_km = max_km if max_km is not None else getattr(settings, "POSTCODE_INDEX_MAX_KM", 1.0)
+        self._index = None
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def index(self) -> PostcodeIndex | None:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    if not self.path or not os.path.exists(self.path):
+                        if not self._warned:
+                            logger.info("No postcode index at %s; offline lookups disabled", self.path)
+                            self._warned = True
+                        return None
+                    self._index = PostcodeIndex(self.path)
+        return self._index
+
+    def resolve(self, lat: float, lng: float) -> str | None:
+        idx = self.index()
+        if idx is None:
+            return None
+        hit = idx.nearest(lat, lng, self.max_km)
+        return hit[0] if hit else None
+
+    def locate(self, postcode: str) -> tuple[float, float] | None:
+        idx = self.index()
+        if idx is None:
+            return None
+        # index stores ONS "pcds" form: outward code, space, 3-char inward code
+        return idx.find(canonical_postcode(postcode)) or idx.find(postcode.replace(" ", "").upper())
+
+
+class NominatimBackend(PostcodeBackend):
+    name = "nominatim"
+    remote = True
+
+    def resolve(self, lat: float, lng: float) -> str | None:
+        """Reverse-geocode with OpenStreetMap Nominatim to get a postcode (blocking)."""
+        try:
+            resp = requests.get(NOMINATIM_REVERSE_URL, params=_params(lat, lng), headers=_HEADERS, timeout=GEOCODER_TIMEOUT)
+            if resp.status_code != 200:
+                return None
+            return _postcode_from_payload(resp.json())
+        except Exception:
+            return None
+
+    def locate(self, postcode: str) -> tuple[float, float] | None:
+        try:
+            params = {"format": "jsonv2", "postalcode": canonical_postcode(postcode), "limit": 1}
+            if NOMINATIM_COUNTRY_CODES:
+                params["countrycodes"] = NOMINATIM_COUNTRY_CODES  # a bare postcode matches abroad too
+            resp = requests.get(NOMINATIM_SEARCH_URL, params=params, headers=_HEADERS, timeout=GEOCODER_TIMEOUT)
+            if resp.status_code != 200:
+                return None
+            hits = resp.json()
+            return (float(hits[0]["lat"]), float(hits[0]["lon"])) if hits else None
+        except Exception:
+            return None
+
+    async def aresolve(self, lat: float, lng: float) -> str | None:
+        """Non-blocking reverse geocode; falls back to a worker thread without httpx."""
+        if httpx is None:
+            return await sync_to_async(self.resolve, thread_sensitive=False)(lat, lng)
+        try:
+            resp = await _async_client().get(NOMINATIM_REVERSE_URL, params=_params(lat, lng))
+            if resp.status_code != 200:
+                return None
+            return _postcode_from_payload(resp.json())
+        except Exception:
+            logger.debug("Async reverse geocode failed for %s,%s", lat, lng, exc_info=True)
+            return None
+
+
+def _params(lat: float, lng: float) -> dict:
+    return {"format": "jsonv2", "lat": lat, "lon": lng, "zoom": 18, "addressdetails": 1}
+
+
+def _postcode_from_payload(js: dict) -> str | None:
+    addr = js.get("address") or {}
+    return addr.get("postcode") or addr.get("postal_code") or addr.get("ISO3166-2-lvl4")
+
+
+# One pooled AsyncClient per running event loop (keep-alive across punches).
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(headers=_HEADERS, timeout=GEOCODER_TIMEOUT)
+        _async_clients[loop] = client
+    return client
+
+
+_backends = None
+
+
+def get_backends() -> list[PostcodeBackend]:
+    global _backends
+    if _backends is None:
+        paths = getattr(settings, "POSTCODE_RESOLVER_BACKENDS", DEFAULT_BACKENDS)
+        _backends = [import_string(p)() for p in paths]
+    return _backends
+
+
+# ---------- Remote lookup cache ----------
+GEOCODE_CACHE_PRECISION = getattr(settings, "GEOCODE_CACHE_PRECISION", 7)
+GEOCODE_CACHE_TTL = getattr(settings, "GEOCODE_CACHE_TTL", 7 * 24 * 3600)
+GEOCODE_CACHE_NEGATIVE_TTL = getattr(settings, "GEOCODE_CACHE_NEGATIVE_TTL", 120)
+_NO_POSTCODE = "__none__"
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+_cell_cache = LRUTTLCache(
+    maxsize=getattr(settings, "GEOCODE_CACHE_SIZE", 4096),
+    ttl=getattr(settings, "GEOCODE_CACHE_LOCAL_TTL", 300),
+)
+reverse_stats = get_stats("reverse_geocode")
+
+
+def geohash(lat: float, lng: float, precision: int = GEOCODE_CACHE_PRECISION) -> str:
+    """Standard base32 geohash of a point."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, n_bits, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            bits = bits * 2 + (lng >= mid)
+            lng_lo, lng_hi = (mid, lng_hi) if lng >= mid else (lng_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            bits = bits * 2 + (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        n_bits += 1
+        if n_bits == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = n_bits = 0
+    return "".join(chars)
+
+
+def _cell_key(backend: PostcodeBackend, lat: float, lng: float) -> str:
+    return f"geo:{backend.name}:{geohash(lat, lng)}"
+
+
+def _ttl(pc: str | None) -> int:
+    return GEOCODE_CACHE_TTL if pc else GEOCODE_CACHE_NEGATIVE_TTL
+
+
+def _remember_local(key: str, pc: str | None) -> None:
+    _cell_cache.set(key, pc, ttl=min(_ttl(pc), _cell_cache.ttl))
+
+
+def _from_local(key: str):
+    pc = _cell_cache.get(key)
+    if pc is not MISSING:
+        reverse_stats.incr("local_hit" if pc else "negative_hit")
+    return pc
+
+
+def _from_shared(cached, key: str):
+    if cached is MISSING:
+        return MISSING
+    pc = None if cached == _NO_POSTCODE else cached
+    reverse_stats.incr("shared_hit" if pc else "negative_hit")
+    _remember_local(key, pc)
+    return pc
+
+
+def _record_upstream(started: float, pc: str | None) -> None:
+    ms = int((time.perf_counter() - started) * 1000)
+    reverse_stats.incr("miss")
+    reverse_stats.incr("upstream_ms", ms)
+    reverse_stats.peak("upstream_ms_max", ms)
+    if not pc:
+        reverse_stats.incr("upstream_empty")
+
+
+class _Call:
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _cached_resolve(backend: PostcodeBackend, lat: float, lng: float) -> str | None:
+    key = _cell_key(backend, lat, lng)
+    pc = _from_local(key)
+    if pc is not MISSING:
+        return pc
+    pc = _from_shared(cache.get(key, MISSING), key)
+    if pc is not MISSING:
+        return pc
+
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+    if not leader:
+        reverse_stats.incr("coalesced")
+        call.done.wait(GEOCODER_TIMEOUT + 1)
+        return call.result
+
+    try:
+        started = time.perf_counter()
+        call.result = backend.resolve(lat, lng)
+        _record_upstream(started, call.result)
+        cache.set(key, call.result or _NO_POSTCODE, timeout=_ttl(call.result))
+        _remember_local(key, call.result)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call.done.set()
+    return call.result
+
+
+# Single-flight for the async views: one pending future per cell, per event loop.
+_ainflight = weakref.WeakKeyDictionary()
+# cache.aget/aset hop to the thread-sensitive executor, which the DB work of
+# every other punch is queued on too; the shared cache doesn't need that thread.
+_shared_get = sync_to_async(lambda *a, **kw: cache.get(*a, **kw), thread_sensitive=False)
+_shared_set = sync_to_async(lambda *a, **kw: cache.set(*a, **kw), thread_sensitive=False)
+
+
+async def _acached_resolve(backend: PostcodeBackend, lat: float, lng: float) -> str | None:
+    key = _cell_key(backend, lat, lng)
+    pc = _from_local(key)
+    if pc is not MISSING:
+        return pc
+
+    loop = asyncio.get_running_loop()
+    pending = _ainflight.setdefault(loop, {})
+    fut = pending.get(key)
+    if fut is not None:
+        reverse_stats.incr("coalesced")
+        return await asyncio.shield(fut)
+
+    fut = pending[key] = loop.create_future()
+    pc = None
+    try:
+        pc = _from_shared(await _shared_get(key, MISSING), key)
+        if pc is MISSING:
+            started = time.perf_counter()
+            pc = await backend.aresolve(lat, lng)
+            _record_upstream(started, pc)
+            await _shared_set(key, pc or _NO_POSTCODE, timeout=_ttl(pc))
+            _remember_local(key, pc)
+    finally:
+        pending.pop(key, None)
+        # waiters get None if this call was cancelled or failed; they must not raise
+        fut.set_result(pc if pc is not MISSING else None)
+    return pc
+
+
+def clear_geocode_cache() -> None:
+    """Forget this process's cached cells (shared-cache entries expire on their own)."""
+    _cell_cache.clear()
+
+
+def resolve_postcode(lat: float, lng: float, local_only: bool = False) -> str | None:
+    """Postcode for a punch location from the first backend that knows it (blocking)."""
+    for backend in get_backends():
+        if local_only and backend.remote:
+            continue
+        pc = _cached_resolve(backend, lat, lng) if backend.remote else backend.resolve(lat, lng)
+        geocode_stats.incr(f"{backend.name}_{'hit' if pc else 'miss'}")
+        if pc:
+            return pc
+    return None
+
+
+async def aresolve_postcode(lat: float, lng: float, local_only: bool = False) -> str | None:
+    """Non-blocking resolve_postcode for the async punch views."""
+    for backend in get_backends():
+        if local_only and backend.remote:
+            continue
+        pc = await _acached_resolve(backend, lat, lng) if backend.remote else await backend.aresolve(lat, lng)
+        geocode_stats.incr(f"{backend.name}_{'hit' if pc else 'miss'}")
+        if pc:
+            return pc
+    return None
+
+
+def geocode_postcode(postcode: str) -> tuple[float, float] | None:
+    """Forward geocode a site postcode to its centroid (blocking; see geocode_shift_site)."""
+    if not postcode:
+        return None
+    for backend in get_backends():
+        coords = backend.locate(postcode)
+        if coords:
+            return coords
+    return None
+
+
+# ---------- Shift sites ----------
+_site_executor = None
+
+
+def geocode_shift_site(shift_id: int) -> bool:
+    """
+    Store the site coordinates of a shift that has a postcode but none yet.
+    The write is conditional on the postcode and the empty site, so a lookup
+    that finishes after the shift was edited again changes nothing. Returns
+    True if coordinates were stored.
+    """
+    from .models import Shift
+
+    postcode = (
+        Shift.all_objects.filter(pk=shift_id, site_lat__isnull=True)
+        .exclude(allowed_postcode__isnull=True).exclude(allowed_postcode="")
+        .values_list("allowed_postcode", flat=True).first()
+    )
+    coords = geocode_postcode(postcode) if postcode else None
+    if not coords:
+        return False
+    return bool(
+        Shift.all_objects.filter(pk=shift_id, allowed_postcode=postcode, site_lat__isnull=True)
+        .update(site_lat=coords[0], site_lng=coords[1])
+    )
+
+
+def schedule_site_geocode(shift_id: int) -> None:
+    """Geocode the shift's site once the current transaction commits, off the request thread."""
+    transaction.on_commit(lambda: _enqueue_site(shift_id))
+
+
+def _enqueue_site(shift_id: int) -> None:
+    global _site_executor
+    workers = getattr(settings, "SITE_GEOCODE_WORKERS", 1)
+    if workers <= 0:
+        return  # left for `manage.py geocode_shift_sites`
+    if _site_executor is None:
+        _site_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="site-geocode")
+    _site_executor.submit(_run_site, shift_id)
+
+
+def _run_site(shift_id: int) -> None:
+    try:
+        geocode_shift_site(shift_id)
+    except Exception:
+        logger.exception("Site geocoding failed for shift %s", shift_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,80 @@
+# shifts/geofence.py
+"""
+Distance-based punch geofencing.
+
+A shift with site coordinates (geocoded once from allowed_postcode after the
+shift is saved, see shifts.geocoding.geocode_shift_site) accepts punches within geofence_radius_m of the site, checked
+locally with the haversine formula; no geocoder round-trip per punch.
+
+verify_bookings() re-checks every punch in a queryset in one pass: a single
+query pulls the coordinates as columns and the distances are computed in bulk
+(numpy when installed, plain Python otherwise).
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in metres."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_many(lats1, lngs1, lats2, lngs2) -> list:
+    """Element-wise haversine_m over equal-length sequences (None in -> None out)."""
+    if np is not None:
+        a = np.array([lats1, lngs1, lats2, lngs2], dtype=float)  # None -> nan
+        p1, l1, p2, l2 = np.radians(a)
+        h = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin((l2 - l1) / 2) ** 2
+        d = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+        return [None if math.isnan(x) else x for x in d.tolist()]
+    return [
+        None if None in (a, b, c, d) else haversine_m(a, b, c, d)
+        for a, b, c, d in zip(lats1, lngs1, lats2, lngs2)
+    ]
+
+
+def punch_distance(shift, lat: float, lng: float) -> float | None:
+    """Metres from the shift site, or None if the shift has no geofence."""
+    if not shift.has_geofence:
+        return None
+    return haversine_m(shift.site_lat, shift.site_lng, lat, lng)
+
+
+def verify_bookings(bookings):
+    """
+    Re-verify clock-in/clock-out locations for a ShiftBooking queryset.
+    Returns one dict per punch on a geofenced shift:
+      {booking_id, punch ("in"/"out"), distance_m, radius_m, ok}
+    """
+    rows = list(
+        bookings
+        .filter(shift__site_lat__isnull=False, shift__site_lng__isnull=False)
+        .values_list(
+            "id", "clock_in_lat", "clock_in_lng", "clock_out_lat", "clock_out_lng",
+            "shift__site_lat", "shift__site_lng", "shift__geofence_radius_m",
+        )
+    )
+    if not rows:
+        return []
+    ids, in_lat, in_lng, out_lat, out_lng, site_lat, site_lng, radius = zip(*rows)
+
+    results = []
+    for punch, lats, lngs in (("in", in_lat, in_lng), ("out", out_lat, out_lng)):
+        for booking_id, dist, r in zip(ids, haversine_many(site_lat, site_lng, lats, lngs), radius):
+            if dist is None:
+                continue  # no punch recorded
+            results.append({
+                "booking_id": booking_id, "punch": punch,
+                "distance_m": round(dist, 1), "radius_m": r, "ok": dist <= r,
+            })
+    results.sort(key=lambda row: (row["booking_id"], row["punch"]))
+    return results
@@ -0,0 +1,107 @@
+# shifts/management/commands/benchmark_exports.py
+"""
+Benchmark: XLSX export peak memory and time, in-memory Workbook vs write-only.
+
+Each variant runs in a forked child process so its peak RSS (ru_maxrss) is
+measured on its own. The rows are synthetic attendance rows (same shape as the
+report), so no database is needed:
+
+    python manage.py benchmark_exports --rows 100000
+
+  inmemory   the old path: Workbook() + BytesIO + HttpResponse(bio.getvalue())
+  writeonly  shifts.exports.write_xlsx into a temporary file (what the views use)
+  csv        shifts.exports.csv_chunks, for reference
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shifts.exports import ATTENDANCE_COLUMNS, csv_chunks, write_xlsx
+
+VARIANTS = ("inmemory", "writeonly", "csv")
+
+
+def _rows(n):
+    day = date(2025, 1, 1)
+    for i in range(n):
+        yield {
+            "date": (day + timedelta(days=i % 365)).isoformat(), "user": f"carer{i % 500:03d}",
+            "role": "carer", "title": f"Shift {i % 40}", "start": "09:00", "end": "17:00",
+            "clock_in": "09:07", "clock_out": "16:55", "worked": "07:48",
+            "late_min": 7, "early_min": 5, "status": "Present",
+        }
+
+
+def _inmemory(n):
+    from django.http import HttpResponse
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append([h for h, _ in ATTENDANCE_COLUMNS])
+    keys = [k for _, k in ATTENDANCE_COLUMNS]
+    for r in _rows(n):
+        ws.append([r[k] for k in keys])
+    bio = BytesIO()
+    wb.save(bio)
+    bio.seek(0)
+    return len(HttpResponse(bio.getvalue()).content)
+
+
+def _writeonly(n):
+    with tempfile.TemporaryFile(suffix=".xlsx") as fh:
+        write_xlsx(fh, "Attendance", ATTENDANCE_COLUMNS, _rows(n))
+        return fh.tell()
+
+
+def _csv(n):
+    return sum(len(chunk.encode("utf-8")) for chunk in csv_chunks(ATTENDANCE_COLUMNS, _rows(n)))
+
+
+def _maxrss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KiB elsewhere
+
+
+def _child(variant, n, out):
+    base = _maxrss_mb()
+    t0 = time.perf_counter()
+    size = {"inmemory": _inmemory, "writeonly": _writeonly, "csv": _csv}[variant](n)
+    out.put((variant, time.perf_counter() - t0, _maxrss_mb(), _maxrss_mb() - base, size))
+
+
+class Command(BaseCommand):
+    help = "Compare peak RSS and time of in-memory vs write-only XLSX exports (and CSV)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--only", choices=VARIANTS, action="append", help="Run just these variants")
+
+    def handle(self, *args, **options):
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise CommandError("openpyxl is not installed.")
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("Needs the 'fork' start method (Linux/macOS).")
+
+        ctx = multiprocessing.get_context("fork")
+        n = options["rows"]
+        self.stdout.write(f"{n} rows, {len(ATTENDANCE_COLUMNS)} columns (pid {os.getpid()})")
+        self.stdout.write(f"  {'variant':<10} {'seconds':>8} {'peak RSS MB':>12} {'growth MB':>10} {'output KB':>10}")
+        for variant in options["only"] or VARIANTS:
+            out = ctx.Queue()
+            proc = ctx.Process(target=_child, args=(variant, n, out))
+            proc.start()
+            result = out.get()
+            proc.join()
+            name, secs, peak, growth, size = result
+            self.stdout.write(f"  {name:<10} {secs:>8.2f} {peak:>12.1f} {growth:>10.1f} {size / 1024:>10.0f}")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,69 @@
+# shifts/management/commands/benchmark_postcode_index.py
+"""
+Micro-benchmark: nearest-postcode lookups per second on the offline index.
+
+Uses settings.POSTCODE_INDEX_PATH (or --index). With --synthetic N it builds a
+throwaway index of N random UK-ish centroids first, so it runs anywhere:
+
+    python manage.py benchmark_postcode_index --synthetic 1700000 --lookups 200000
+"""
+import os
+import random
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shifts.postcode_index import PostcodeIndex, build_index
+
+UK_BOUNDS = (49.9, -7.6, 58.7, 1.8)  # lat_min, lng_min, lat_max, lng_max
+
+
+def _synthetic_points(n, rng):
+    lat_min, lng_min, lat_max, lng_max = UK_BOUNDS
+    for i in range(n):
+        yield f"ZZ{i // 10000:d} {i % 10000:04d}"[:8], rng.uniform(lat_min, lat_max), rng.uniform(lng_min, lng_max)
+
+
+class Command(BaseCommand):
+    help = "Measure offline postcode index lookups per second"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", default=getattr(settings, "POSTCODE_INDEX_PATH", ""))
+        parser.add_argument("--synthetic", type=int, default=0, help="Build a random index of N points first")
+        parser.add_argument("--lookups", type=int, default=100000)
+        parser.add_argument("--max-km", type=float, default=getattr(settings, "POSTCODE_INDEX_MAX_KM", 1.0))
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        path, tmpdir = options["index"], None
+        if options["synthetic"]:
+            tmpdir = tempfile.TemporaryDirectory()
+            path = os.path.join(tmpdir.name, "synthetic.idx")
+            t0 = time.perf_counter()
+            build_index(_synthetic_points(options["synthetic"], rng), path)
+            self.stdout.write(f"  built {options['synthetic']} synthetic points in {time.perf_counter() - t0:.1f}s")
+        if not path or not os.path.exists(path):
+            raise CommandError("No index file; build one or pass --synthetic N.")
+
+        idx = PostcodeIndex(path)
+        try:
+            lat_min, lng_min, lat_max, lng_max = idx.bounds()
+            queries = [(rng.uniform(lat_min, lat_max), rng.uniform(lng_min, lng_max)) for _ in range(options["lookups"])]
+            nearest, max_km = idx.nearest, options["max_km"]
+
+            t0 = time.perf_counter()
+            found = sum(1 for lat, lng in queries if nearest(lat, lng, max_km))
+            secs = time.perf_counter() - t0
+        finally:
+            idx.close()
+            if tmpdir:
+                tmpdir.cleanup()
+
+        n = len(queries)
+        self.stdout.write(f"  {idx.size} indexed postcodes, {n} lookups, {found} within {max_km} km")
+        self.stdout.write(self.style.SUCCESS(
+            f"{n / secs:,.0f} lookups/s ({secs / n * 1e6:.1f} µs per lookup)"
+        ))
@@ -0,0 +1,53 @@
+# shifts/management/commands/build_postcode_index.py
+"""
+Build the offline postcode index used by shifts.geocoding.OfflineIndexBackend.
+
+Input is a postcode-centroid CSV with a header row, e.g. the ONS Postcode
+Directory (columns pcds, lat, long; terminated postcodes have doterm set):
+
+    python manage.py build_postcode_index ONSPD_MAY_2025_UK.csv
+    python manage.py build_postcode_index points.csv --postcode-col postcode --lng-col lng
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shifts.postcode_index import PostcodeIndex, build_index, read_centroids
+
+
+class Command(BaseCommand):
+    help = "Build the memory-mapped postcode index from a centroid CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", help="Postcode centroid CSV")
+        parser.add_argument("--output", default=getattr(settings, "POSTCODE_INDEX_PATH", ""),
+                            help="Index file to write (default: settings.POSTCODE_INDEX_PATH)")
+        parser.add_argument("--cell-size", type=float, default=0.005, help="Grid cell size in degrees")
+        parser.add_argument("--postcode-col", default="pcds")
+        parser.add_argument("--lat-col", default="lat")
+        parser.add_argument("--lng-col", default="long")
+
+    def handle(self, *args, **options):
+        src, out = options["csv_path"], options["output"]
+        if not os.path.exists(src):
+            raise CommandError(f"{src} does not exist.")
+        if not out:
+            raise CommandError("No --output given and settings.POSTCODE_INDEX_PATH is empty.")
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+
+        t0 = time.perf_counter()
+        rows = read_centroids(src, options["postcode_col"], options["lat_col"], options["lng_col"])
+        try:
+            n = build_index(rows, out, options["cell_size"])
+        except (KeyError, ValueError) as exc:
+            raise CommandError(f"Could not build index: {exc}")
+
+        idx = PostcodeIndex(out)
+        self.stdout.write(
+            f"  {n} postcodes, {idx.n_rows}x{idx.n_cols} cells, "
+            f"{os.path.getsize(out) / 1e6:.1f} MB, {time.perf_counter() - t0:.1f}s"
+        )
+        idx.close()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {out}. Restart workers to pick it up."))
@@ -0,0 +1,54 @@
+# shifts/management/commands/check_attendance_facts.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Organization
+from shifts.facts import compare_facts, refresh_facts
+
+
+class Command(BaseCommand):
+    help = "Compare DailyAttendanceFact rows with ShiftBooking and report (or --fix) any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", type=str, default="", help="Only check this organization (slug)")
+        parser.add_argument("--start", type=date.fromisoformat, help="First shift date (YYYY-MM-DD); default: earliest")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last shift date (YYYY-MM-DD); default: latest")
+        parser.add_argument("--fix", action="store_true", help="Refresh the drifted rows")
+        parser.add_argument("--limit", type=int, default=50, help="Print at most this many differences")
+
+    def handle(self, *args, **options):
+        orgs = Organization.objects.order_by("pk")
+        if options["org"]:
+            orgs = orgs.filter(slug=options["org"])
+            if not orgs.exists():
+                raise CommandError(f"No organization with slug {options['org']!r}.")
+
+        drifted, shown = 0, 0
+        for org in orgs:
+            keys = set()
+            for (user_id, day, role, paid), stored, expected in compare_facts(org.pk, options["start"], options["end"]):
+                drifted += 1
+                keys.add((org.pk, user_id, day, role))
+                if shown < options["limit"]:
+                    shown += 1
+                    self.stdout.write(f"  {org.slug} user={user_id} {day} {role} paid={paid}: "
+                                      f"{_diff(stored, expected)}")
+            if keys and options["fix"]:
+                refresh_facts(keys)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Attendance facts match the bookings."))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Refreshed {drifted} drifted row(s)."))
+        else:
+            # non-zero exit so cron/monitoring notices
+            raise CommandError(f"{drifted} attendance fact row(s) drifted (run with --fix).")
+
+
+def _diff(stored, expected) -> str:
+    if stored is None:
+        return "missing"
+    if expected is None:
+        return "no bookings left (stray row)"
+    return ", ".join(f"{k} {stored[k]} -> {expected[k]}" for k in expected if stored[k] != expected[k])
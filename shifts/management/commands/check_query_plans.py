@@ -0,0 +1,167 @@
+# shifts/management/commands/check_query_plans.py
+"""
+Query-plan regression check for the hot tenant-scoped querysets.
+
+Seeds a throwaway test database, runs ANALYZE, then EXPLAINs each queryset
+below and fails (non-zero exit) if any table is read with a sequential scan.
+On PostgreSQL sequential scans are disabled for the session first, so a
+"Seq Scan" in the plan means no usable index exists at all.
+
+Run it in CI after touching models.py / migrations:
+    python manage.py check_query_plans
+    python manage.py check_query_plans --verbose
+"""
+import re
+from datetime import time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from shifts.models import (
+    AuditAction, AuditLog, HolidayRequest, Shift, ShiftBooking, UserAvailability, shift_bounds,
+)
+
+SEQ_SCAN_PATTERNS = {
+    # "SCAN t" is a full table read; "SCAN t USING [COVERING] INDEX" walks an index
+    "sqlite": re.compile(r"\bSCAN (\w+)\b(?! USING)"),
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+}
+
+
+def hot_querysets(org, user, today):
+    """(label, queryset) pairs mirroring the view queries that run on every page load."""
+    month_start = today.replace(day=1)
+    month_end = month_start + timedelta(days=31)
+    now = timezone.now()
+    return [
+        ("upcoming shifts", Shift.all_objects.upcoming(org, now).order_by("date", "start_time")),
+        ("shifts on a day", Shift.all_objects.filter(organization=org, date=today)),
+        ("my bookings", ShiftBooking.all_objects.select_related("shift").filter(user=user, organization=org)),
+        ("completed, unpaid", ShiftBooking.all_objects.filter(
+            user=user, organization=org, clock_in_at__isnull=False,
+            clock_out_at__isnull=False, paid_at__isnull=True,
+        )),
+        ("open punches", ShiftBooking.all_objects.filter(
+            organization=org, clock_in_at__isnull=False, clock_out_at__isnull=True,
+        )),
+        ("timesheet range", ShiftBooking.all_objects.select_related("user", "shift").filter(
+            organization=org, shift__date__gte=month_start, shift__date__lte=month_end,
+        )),
+        ("payroll (paid)", ShiftBooking.all_objects.filter(
+            organization=org, paid_at__isnull=False,
+        ).order_by("-paid_at")),
+        ("my availability", UserAvailability.all_objects.filter(
+            organization=org, user=user, date__gte=month_start, date__lte=month_end,
+        )),
+        ("availability admin", UserAvailability.all_objects.filter(
+            organization=org, date__gte=month_start,
+        )),
+        ("pending holidays", HolidayRequest.all_objects.filter(organization=org, status="pending")),
+        ("my holidays", HolidayRequest.all_objects.filter(organization=org, user=user)),
+        ("audit by action", AuditLog.objects.filter(action=AuditAction.CLOCK_IN).order_by("-at")[:100]),
+    ]
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot querysets on seeded data and fail if any regress to a sequential scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orgs", type=int, default=4, help="Organizations to seed")
+        parser.add_argument("--users", type=int, default=40, help="Users per organization")
+        parser.add_argument("--shifts", type=int, default=300, help="Shifts per organization")
+        parser.add_argument("--verbose", action="store_true", help="Print every plan")
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f"Query-plan checks are not supported on {connection.vendor}.")
+
+        setup_test_environment()
+        old_db = connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            org, user = self._seed(options["orgs"], options["users"], options["shifts"])
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+                if connection.vendor == "postgresql":
+                    cursor.execute("SET enable_seqscan = off")
+            failures = self._check(pattern, org, user, options["verbose"])
+        finally:
+            connection.creation.destroy_test_db(old_db, verbosity=0)
+            teardown_test_environment()
+
+        if failures:
+            for label, tables in failures:
+                self.stderr.write(f"  {label}: sequential scan on {', '.join(tables)}")
+            raise CommandError(f"{len(failures)} queryset(s) regressed to a sequential scan.")
+        self.stdout.write(self.style.SUCCESS("All hot querysets use an index."))
+
+    def _check(self, pattern, org, user, verbose):
+        failures = []
+        for label, qs in hot_querysets(org, user, timezone.localdate()):
+            plan = qs.explain()
+            tables = sorted(set(pattern.findall(plan)))
+            if verbose:
+                self.stdout.write(f"-- {label}\n{plan}\n")
+            if tables:
+                failures.append((label, tables))
+            else:
+                self.stdout.write(f"  ok  {label}")
+        return failures
+
+    def _seed(self, n_orgs, n_users, n_shifts):
+        from core.models import Organization
+
+        User = get_user_model()
+        today = timezone.localdate()
+        now = timezone.now()
+        first_org = first_user = None
+        for o in range(n_orgs):
+            org = Organization.objects.create(name=f"Plan check {o}", slug=f"plan-check-{o}")
+            users = [User.objects.create_user(f"plan{o}_{u}") for u in range(n_users)]
+
+            shifts = []
+            for i in range(n_shifts):
+                day = today + timedelta(days=i % 120 - 60)
+                start, end = time(8 + i % 8, 0), time(16 + i % 6, 0)
+                start_at, end_at = shift_bounds(day, start, end)  # bulk_create skips save()
+                shifts.append(Shift(
+                    organization=org, title=f"Shift {i}", date=day, start_time=start, end_time=end,
+                    role="Care", location="Site", max_staff=5, booked_count=1,
+                    start_at=start_at, end_at=end_at,
+                ))
+            shifts = Shift.all_objects.bulk_create(shifts)
+
+            bookings = []
+            for i, sh in enumerate(shifts):
+                done = sh.date < today
+                bookings.append(ShiftBooking(
+                    organization=org, user=users[i % n_users], shift=sh,
+                    clock_in_at=now if done or i % 50 == 0 else None,
+                    clock_out_at=now if done else None,
+                    paid_at=now if done and i % 3 == 0 else None,
+                ))
+            bookings = ShiftBooking.all_objects.bulk_create(bookings)
+
+            UserAvailability.all_objects.bulk_create([
+                UserAvailability(organization=org, user=users[u], date=today + timedelta(days=d))
+                for u in range(n_users) for d in range(0, 60, 3)
+            ])
+            HolidayRequest.all_objects.bulk_create([
+                HolidayRequest(
+                    organization=org, user=users[u], start_date=today + timedelta(days=u),
+                    end_date=today + timedelta(days=u + 2), reason="-",
+                    status=("pending", "approved", "rejected")[u % 3],
+                )
+                for u in range(n_users)
+            ])
+            AuditLog.objects.bulk_create([
+                AuditLog(actor=b.user, action=(AuditAction.CLOCK_IN, AuditAction.BOOKING_CREATED)[i % 2],
+                         shift_id=b.shift_id, booking=b, at=now - timedelta(minutes=i))
+                for i, b in enumerate(bookings)
+            ])
+            if first_org is None:
+                first_org, first_user = org, users[0]
+        return first_org, first_user
@@ -0,0 +1,34 @@
+# shifts/management/commands/close_overdue_bookings.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Organization
+from shifts.attendance import close_overdue, overdue_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Settle bookings whose shift ended more than AUTO_CLOSE_GRACE_HOURS ago: "
+        "auto clock-out at the scheduled end if the carer never clocked out, "
+        "no-show if they never clocked in. Run from cron (e.g. hourly)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would change")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        result = close_overdue(now=now, dry_run=options["dry_run"])
+        slugs = dict(Organization.objects.filter(pk__in=result).values_list("pk", "slug"))
+
+        verb = "would be" if options["dry_run"] else "were"
+        total_closed = total_no_show = 0
+        for org_id, counts in sorted(result.items()):
+            closed, no_show = counts["auto_closed"], counts["no_show"]
+            total_closed += closed
+            total_no_show += no_show
+            self.stdout.write(f"  {slugs.get(org_id, org_id)}: {closed} auto clocked out, {no_show} no-show")
+
+        msg = (f"Shifts ended before {timezone.localtime(overdue_cutoff(now)):%Y-%m-%d %H:%M}: "
+               f"{total_closed} booking(s) {verb} auto clocked out, {total_no_show} {verb} marked no-show.")
+        self.stdout.write(self.style.SUCCESS(msg))
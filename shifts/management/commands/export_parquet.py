@@ -0,0 +1,59 @@
+# shifts/management/commands/export_parquet.py
+"""
+Write an organization's bookings (joined with shift and user) as a
+month-partitioned Parquet dataset for payroll analytics:
+
+    python manage.py export_parquet --org acme --start 2025-01-01 --end 2025-12-31 --out /data/bookings
+
+    /data/bookings/month=2025-01/part-0.parquet
+    /data/bookings/month=2025-02/part-0.parquet
+    ...
+
+Columns and types are described in shifts/columnar.py. Needs pyarrow.
+"""
+import os
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Organization
+from shifts.columnar import parquet_values, write_dataset
+from shifts.models import ShiftBooking
+
+
+class Command(BaseCommand):
+    help = "Export bookings as a month-partitioned Parquet dataset (needs pyarrow)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", type=str, required=True, help="Organization slug")
+        parser.add_argument("--start", type=date.fromisoformat, help="First shift date (YYYY-MM-DD)")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last shift date (YYYY-MM-DD)")
+        parser.add_argument("--paid", choices=("any", "yes", "no"), default="any", help="Filter on paid status")
+        parser.add_argument("--out", type=str, required=True, help="Output directory (must be empty or new)")
+
+    def handle(self, *args, **options):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise CommandError("pyarrow is not installed.")
+
+        org = Organization.objects.filter(slug=options["org"]).first()
+        if org is None:
+            raise CommandError(f"No organization with slug {options['org']!r}.")
+        out = options["out"]
+        if os.path.isdir(out) and os.listdir(out):
+            raise CommandError(f"{out} is not empty.")
+
+        qs = ShiftBooking.all_objects.filter(organization=org)
+        if options["start"]:
+            qs = qs.filter(shift__date__gte=options["start"])
+        if options["end"]:
+            qs = qs.filter(shift__date__lte=options["end"])
+        if options["paid"] != "any":
+            qs = qs.filter(paid_at__isnull=options["paid"] == "no")
+
+        os.makedirs(out, exist_ok=True)
+        counts = write_dataset(out, parquet_values(qs))
+        for month, rows in sorted(counts.items()):
+            self.stdout.write(f"  month={month}: {rows} row(s)")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {sum(counts.values())} booking(s) in {len(counts)} partition(s) to {out}."))
@@ -0,0 +1,53 @@
+# shifts/management/commands/geocode_shift_sites.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shifts.geocoding import geocode_postcode
+from shifts.models import Shift
+
+
+class Command(BaseCommand):
+    help = (
+        "Geocode the site of shifts that have an allowed_postcode but no coordinates "
+        "(shifts created before geofencing, failed lookups, SITE_GEOCODE_WORKERS=0). "
+        "Each distinct postcode is looked up once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", type=str, default="", help="Only this organization (slug)")
+        parser.add_argument("--upcoming", action="store_true", help="Only shifts that haven't ended yet")
+        parser.add_argument("--redo", action="store_true",
+                            help="Clear and look up again shifts that already have coordinates (fixes bad sites)")
+        parser.add_argument("--limit", type=int, default=0, help="Stop after this many postcodes")
+        parser.add_argument("--delay", type=float, default=1.0,
+                            help="Seconds between lookups (Nominatim allows ~1 request/s)")
+
+    def handle(self, *args, **options):
+        shifts = Shift.all_objects.exclude(allowed_postcode__isnull=True).exclude(allowed_postcode="")
+        if options["org"]:
+            shifts = shifts.filter(organization__slug=options["org"])
+        if options["upcoming"]:
+            shifts = shifts.filter(end_at__gt=timezone.now())
+        if not options["redo"]:
+            shifts = shifts.filter(site_lat__isnull=True)
+
+        postcodes = shifts.order_by("allowed_postcode").values_list("allowed_postcode", flat=True).distinct()
+        if options["limit"]:
+            postcodes = postcodes[:options["limit"]]
+
+        located = missing = updated = 0
+        for i, postcode in enumerate(list(postcodes)):
+            if i and options["delay"]:
+                time.sleep(options["delay"])
+            coords = geocode_postcode(postcode)
+            if not coords:
+                missing += 1
+                self.stderr.write(f"  {postcode}: not found")
+                continue
+            located += 1
+            updated += shifts.filter(allowed_postcode=postcode).update(site_lat=coords[0], site_lng=coords[1])
+
+        msg = f"Located {located} postcode(s) ({updated} shift(s) updated), {missing} not found."
+        self.stdout.write(self.style.WARNING(msg) if missing else self.style.SUCCESS(msg))
@@ -0,0 +1,159 @@
+# shifts/management/commands/loadtest_punches.py
+"""
+Load test: how many concurrent clock-ins can ONE worker serve while the
+geocoder is slow?
+
+Runs against a throwaway test database and a local fake Nominatim that sleeps
+--geocode-delay seconds per request, then fires --punches clock-ins at:
+
+  sync  - the WSGI view; a gunicorn sync worker serves one request at a time
+  async - the async view through Django's ASGI handler, all punches in flight
+
+Example:
+    python manage.py loadtest_punches --punches 100 --geocode-delay 0.5
+"""
+import asyncio
+import json
+import threading
+import time as _time
+from datetime import datetime, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import path
+from django.utils import timezone
+
+from shifts import geocoding, views
+
+FAKE_POSTCODE = "AB1 2CD"
+
+# URLconf used while the command runs (both variants side by side)
+urlpatterns = [
+    path("sync/<int:booking_id>/", views.clock_in),
+    path("async/<int:booking_id>/", views.clock_in_async),
+]
+
+
+def _fake_geocoder(delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            _time.sleep(delay)
+            body = json.dumps({"address": {"postcode": FAKE_POSTCODE}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 256  # default 5 drops SYNs when every punch connects at once
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _body(i, label):
+    # a separate geohash cell per punch, so every punch really waits on the geocoder
+    lng = -0.1 if label == "sync" else -0.2
+    return json.dumps({"lat": 51.5 + i * 0.01, "lng": lng})
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent clock-ins per worker for the sync vs async punch views"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--punches", type=int, default=50, help="Punches per run")
+        parser.add_argument("--geocode-delay", type=float, default=0.5, help="Fake geocoder latency (seconds)")
+
+    def handle(self, *args, **options):
+        n = options["punches"]
+        delay = options["geocode_delay"]
+
+        server = _fake_geocoder(delay)
+        old_urls = geocoding.NOMINATIM_REVERSE_URL, geocoding.NOMINATIM_SEARCH_URL
+        geocoding.NOMINATIM_REVERSE_URL = f"http://127.0.0.1:{server.server_port}/reverse"
+        geocoding.NOMINATIM_SEARCH_URL = f"http://127.0.0.1:{server.server_port}/search"
+
+        setup_test_environment()
+        old_db = connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            with override_settings(ROOT_URLCONF=__name__, ALLOWED_HOSTS=["*"]):
+                sync_ids = self._seed(n, "sync")
+                async_ids = self._seed(n, "async")
+                geocoding.clear_geocode_cache()
+                sync_ok, sync_s = self._run_sync(sync_ids)
+                geocoding.clear_geocode_cache()
+                async_ok, async_s = self._run_async(async_ids)
+        finally:
+            connection.creation.destroy_test_db(old_db, verbosity=0)
+            teardown_test_environment()
+            geocoding.NOMINATIM_REVERSE_URL, geocoding.NOMINATIM_SEARCH_URL = old_urls
+            server.shutdown()
+
+        self.stdout.write(f"Punches per run: {n}, geocoder latency: {delay * 1000:.0f} ms")
+        for label, ok, secs in (("sync  (1 WSGI worker)", sync_ok, sync_s), ("async (1 ASGI worker)", async_ok, async_s)):
+            self.stdout.write(f"  {label}: {ok}/{n} ok in {secs:.2f}s -> {n / secs:.1f} punches/s")
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {sync_s / async_s:.1f}x"))
+
+    def _seed(self, n, label):
+        from core.models import Organization
+        from shifts.models import Shift, ShiftBooking
+
+        User = get_user_model()
+        org, _ = Organization.objects.get_or_create(slug="loadtest", defaults={"name": "Load test"})
+        now = timezone.localtime()
+        start = now - timedelta(minutes=5)
+        end_of_day = datetime.combine(start.date(), time(23, 59), tzinfo=start.tzinfo)
+        shift = Shift.all_objects.create(
+            organization=org, title=f"Load test ({label})", date=start.date(),
+            start_time=start.time(), end_time=min(start + timedelta(hours=8), end_of_day).time(),
+            role="Care", location="Site", max_staff=n, allowed_postcode=FAKE_POSTCODE,
+            geofence_radius_m=0,  # measure the reverse-geocode path, not the local geofence
+        )
+        ids = []
+        for i in range(n):
+            user = User.objects.create_user(f"{label}{i}", password="x")
+            user.profile.organization = org
+            user.profile.save()
+            booking = ShiftBooking.all_objects.create(organization=org, user=user, shift=shift)
+            ids.append((user, booking.id))
+        return ids
+
+    def _run_sync(self, ids):
+        clients = []
+        for user, booking_id in ids:
+            c = Client()
+            c.force_login(user)
+            clients.append((c, booking_id))
+        t0 = _time.perf_counter()
+        ok = sum(
+            c.post(f"/sync/{bid}/", _body(i, "sync"), content_type="application/json").status_code == 200
+            for i, (c, bid) in enumerate(clients)
+        )
+        return ok, _time.perf_counter() - t0
+
+    def _run_async(self, ids):
+        clients = []
+        for user, booking_id in ids:
+            c = AsyncClient()
+            c.force_login(user)
+            clients.append((c, booking_id))
+
+        async def _go():
+            t0 = _time.perf_counter()
+            responses = await asyncio.gather(*[
+                c.post(f"/async/{bid}/", _body(i, "async"), content_type="application/json")
+                for i, (c, bid) in enumerate(clients)
+            ])
+            return sum(r.status_code == 200 for r in responses), _time.perf_counter() - t0
+
+        return asyncio.run(_go())
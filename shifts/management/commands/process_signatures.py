@@ -0,0 +1,39 @@
+# shifts/management/commands/process_signatures.py
+from django.core.management.base import BaseCommand
+
+from shifts.models import ShiftBooking
+from shifts.signatures import process_signature
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompress clock-out signatures and build their thumbnails for bookings the "
+        "in-process workers haven't handled (restarts, SIGNATURE_WORKERS=0)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=0, help="Stop after this many bookings")
+
+    def handle(self, *args, **options):
+        todo = (
+            ShiftBooking.all_objects
+            .filter(signature_processed_at__isnull=True)
+            .exclude(clock_out_signature="")
+            .exclude(clock_out_signature__isnull=True)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        if options["limit"]:
+            todo = todo[:options["limit"]]
+
+        done = failed = 0
+        for booking_id in todo.iterator():
+            try:
+                if process_signature(booking_id):
+                    done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"  booking #{booking_id}: {e}")
+
+        msg = f"Processed {done} signature(s), {failed} failed."
+        self.stdout.write(self.style.WARNING(msg) if failed else self.style.SUCCESS(msg))
@@ -0,0 +1,33 @@
+# shifts/management/commands/rebuild_attendance_facts.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Organization
+from shifts.facts import rebuild_facts
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild DailyAttendanceFact rows from ShiftBooking (first deploy, backfills, "
+        "or after fixing data with raw SQL). Works in 31-day windows, one transaction each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", type=str, default="", help="Only rebuild this organization (slug)")
+        parser.add_argument("--start", type=date.fromisoformat, help="First shift date (YYYY-MM-DD); default: earliest")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last shift date (YYYY-MM-DD); default: latest")
+
+    def handle(self, *args, **options):
+        orgs = Organization.objects.order_by("pk")
+        if options["org"]:
+            orgs = orgs.filter(slug=options["org"])
+            if not orgs.exists():
+                raise CommandError(f"No organization with slug {options['org']!r}.")
+
+        total = 0
+        for org in orgs:
+            written = rebuild_facts(org.pk, options["start"], options["end"])
+            total += written
+            self.stdout.write(f"  {org.slug}: {written} row(s)")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} attendance fact row(s)."))
@@ -0,0 +1,44 @@
+# shifts/management/commands/reconcile_booked_counts.py
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from shifts.models import Shift, ShiftBooking
+
+
+class Command(BaseCommand):
+    help = "Repair drift between Shift.booked_count and the actual number of bookings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", type=str, default="", help="Only reconcile this organization (slug)")
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without fixing it")
+
+    def handle(self, *args, **options):
+        per_shift = (
+            ShiftBooking.all_objects.filter(shift=OuterRef("pk"))
+            .order_by().values("shift").annotate(c=Count("pk")).values("c")
+        )
+        actual = Coalesce(Subquery(per_shift), 0)
+
+        shifts = Shift.all_objects.all()
+        if options["org"]:
+            shifts = shifts.filter(organization__slug=options["org"])
+
+        drifted = list(
+            shifts.annotate(actual=actual)
+            .exclude(booked_count=F("actual"))
+            .values_list("pk", "title", "date", "booked_count", "actual")
+        )
+        for pk, title, day, stored, real in drifted:
+            self.stdout.write(f"  #{pk} {title} ({day}): stored={stored} actual={real}")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All booked counts are consistent."))
+            return
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} shift(s) drifted (dry run, nothing changed)."))
+            return
+
+        # recompute inside the UPDATE so bookings made meanwhile are counted too
+        fixed = Shift.all_objects.filter(pk__in=[row[0] for row in drifted]).update(booked_count=actual)
+        self.stdout.write(self.style.SUCCESS(f"Repaired {fixed} shift(s)."))
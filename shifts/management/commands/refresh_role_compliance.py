@@ -0,0 +1,37 @@
+# shifts/management/commands/refresh_role_compliance.py
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from shifts.models import UserRoleCompliance
+from shifts.utils import refresh_role_compliance
+
+
+class Command(BaseCommand):
+    help = (
+        "Daily sweep: recompute UserRoleCompliance rows whose valid_until has passed. "
+        "Use --all for a full rebuild (first deploy, or after editing ROLE_DOC_RULES)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Rebuild rows for every user")
+
+    def handle(self, *args, **options):
+        today = date.today()
+        if options["all"]:
+            written = refresh_role_compliance(today=today)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} compliance row(s)."))
+            return
+
+        user_ids = (
+            UserRoleCompliance.objects
+            .filter(valid_until__lt=today)
+            .values_list("user_id", flat=True)
+            .distinct()
+        )
+        user_ids = list(user_ids)
+        if not user_ids:
+            self.stdout.write(self.style.SUCCESS("No expired compliance rows."))
+            return
+        written = refresh_role_compliance(user_ids, today=today)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {written} row(s) for {len(user_ids)} user(s)."))
@@ -0,0 +1,49 @@
+# shifts/management/commands/run_export_jobs.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shifts.export_jobs import expire_jobs, run_job
+from shifts.models import ExportJob, ExportStatus
+
+
+class Command(BaseCommand):
+    help = (
+        "Render queued report exports, then delete expired export files. Run with --loop as the "
+        "export worker process (the default setup, EXPORT_WORKERS=0), or once from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=0, help="Stop after this many jobs per pass")
+        parser.add_argument("--expire-only", action="store_true", help="Only clean up expired/stuck jobs")
+        parser.add_argument("--loop", action="store_true", help="Keep polling for new jobs")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            done = failed = 0
+            if not options["expire_only"]:
+                queued = (
+                    ExportJob.all_objects.filter(status=ExportStatus.QUEUED)
+                    .order_by("created_at").values_list("id", flat=True)
+                )
+                if options["limit"]:
+                    queued = queued[:options["limit"]]
+                for job_id in list(queued):
+                    try:
+                        if run_job(job_id):
+                            done += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f"  export #{job_id}: {e}")
+
+            cleaned = expire_jobs()
+            if done or failed or cleaned["expired"] or cleaned["stuck"] or not options["loop"]:
+                msg = (f"Rendered {done} export(s), {failed} failed; "
+                       f"removed {cleaned['expired']} expired, marked {cleaned['stuck']} stuck as failed.")
+                self.stdout.write(self.style.WARNING(msg) if failed else self.style.SUCCESS(msg))
+            if not options["loop"]:
+                return
+            close_old_connections()
+            time.sleep(options["interval"])
@@ -0,0 +1,41 @@
+# shifts/management/commands/verify_pending_punches.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shifts.verification import verify_pending_punches
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify punches saved with PUNCH_VERIFICATION_DEFERRED (pending -> verified / mismatched). "
+        "Run once from cron, or with --loop as a long-lived worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=0, help="Bookings per batch (default PUNCH_VERIFICATION_BATCH)")
+        parser.add_argument("--workers", type=int, default=0, help="Parallel geocoder lookups (default PUNCH_VERIFICATION_WORKERS)")
+        parser.add_argument("--loop", action="store_true", help="Keep polling for new pending punches")
+        parser.add_argument("--interval", type=float, default=15, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            totals = {"checked": 0, "verified": 0, "mismatched": 0, "retry": 0}
+            last_id = 0
+            while last_id is not None:
+                counts = verify_pending_punches(
+                    limit=options["batch"] or None, workers=options["workers"] or None, after_id=last_id,
+                )
+                last_id = counts.pop("last_id")
+                for k, v in counts.items():
+                    totals[k] += v
+
+            if totals["checked"] or not options["loop"]:
+                msg = (f"{totals['checked']} punch(es) checked: {totals['verified']} verified, "
+                       f"{totals['mismatched']} mismatched, {totals['retry']} left pending.")
+                self.stdout.write(self.style.WARNING(msg) if totals["mismatched"] else self.style.SUCCESS(msg))
+            if not options["loop"]:
+                return
+            close_old_connections()
+            time.sleep(options["interval"])
@@ -0,0 +1,40 @@
+# shifts/management/commands/verify_punch_locations.py
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shifts.geofence import verify_bookings
+from shifts.models import ShiftBooking
+
+
+class Command(BaseCommand):
+    help = "Re-verify clock-in/out locations against shift geofences for a date range (one batch pass)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=str, default="", help="First shift date (YYYY-MM-DD), default 7 days ago")
+        parser.add_argument("--end", type=str, default="", help="Last shift date (YYYY-MM-DD), default today")
+        parser.add_argument("--org", type=str, default="", help="Only this organization (slug)")
+        parser.add_argument("--all", action="store_true", help="List passing punches too")
+
+    def handle(self, *args, **options):
+        try:
+            end = date.fromisoformat(options["end"]) if options["end"] else date.today()
+            start = date.fromisoformat(options["start"]) if options["start"] else end - timedelta(days=7)
+        except ValueError:
+            raise CommandError("Dates must be YYYY-MM-DD.")
+
+        bookings = ShiftBooking.all_objects.filter(shift__date__gte=start, shift__date__lte=end)
+        if options["org"]:
+            bookings = bookings.filter(organization__slug=options["org"])
+
+        rows = verify_bookings(bookings)
+        failed = [r for r in rows if not r["ok"]]
+        for r in rows if options["all"] else failed:
+            mark = "ok " if r["ok"] else "OUT"
+            self.stdout.write(
+                f"  {mark} booking #{r['booking_id']} clock-{r['punch']}: "
+                f"{r['distance_m']:.0f} m (radius {r['radius_m']} m)"
+            )
+
+        summary = f"{len(rows)} punch(es) checked for {start}..{end}, {len(failed)} outside the geofence."
+        self.stdout.write(self.style.WARNING(summary) if failed else self.style.SUCCESS(summary))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_booked_count(apps, schema_editor):
+    Shift = apps.get_model("shifts", "Shift")
+    ShiftBooking = apps.get_model("shifts", "ShiftBooking")
+    per_shift = (
+        ShiftBooking.all_objects.filter(shift=OuterRef("pk"))
+        .order_by().values("shift").annotate(c=Count("pk")).values("c")
+    )
+    Shift.all_objects.update(booked_count=Coalesce(Subquery(per_shift), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifts', '0014_holidayrequest_useravailability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shift',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_booked_count, migrations.RunPython.noop),
+    ]
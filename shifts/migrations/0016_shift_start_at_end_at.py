@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:13
+
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_bounds(apps, schema_editor):
+    # Frozen copy of shifts.models.shift_bounds (migrations must not import app code)
+    Shift = apps.get_model("shifts", "Shift")
+    tz = timezone.get_default_timezone()
+    batch = []
+    for sh in Shift.all_objects.only("id", "date", "start_time", "end_time").iterator(chunk_size=1000):
+        start = datetime.combine(sh.date, sh.start_time or time(0, 0, 0))
+        end = datetime.combine(sh.date, sh.end_time or sh.start_time or time(23, 59, 59))
+        if sh.start_time and sh.end_time and sh.end_time <= sh.start_time:
+            end += timedelta(days=1)
+        sh.start_at = timezone.make_aware(start, tz)
+        sh.end_at = timezone.make_aware(end, tz)
+        batch.append(sh)
+        if len(batch) >= 1000:
+            Shift.all_objects.bulk_update(batch, ["start_at", "end_at"])
+            batch = []
+    if batch:
+        Shift.all_objects.bulk_update(batch, ["start_at", "end_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_organization_email_display_name_and_more'),
+        ('shifts', '0015_shift_booked_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shift',
+            name='end_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='start_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_bounds, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['organization', 'end_at'], name='shift_org_end_at_idx'),
+        ),
+    ]
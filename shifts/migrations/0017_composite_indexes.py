@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_organization_email_display_name_and_more'),
+        ('shifts', '0016_shift_start_at_end_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['action', '-at'], name='audit_action_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='holidayrequest',
+            index=models.Index(fields=['organization', 'status'], name='holiday_org_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='holidayrequest',
+            index=models.Index(fields=['organization', 'user'], name='holiday_org_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['organization', 'date'], name='shift_org_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shiftbooking',
+            index=models.Index(fields=['organization', 'user'], name='booking_org_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shiftbooking',
+            index=models.Index(fields=['organization', 'paid_at'], name='booking_org_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shiftbooking',
+            index=models.Index(condition=models.Q(('clock_in_at__isnull', False), ('clock_out_at__isnull', True)), fields=['organization', 'clock_in_at'], name='booking_open_punch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useravailability',
+            index=models.Index(fields=['organization', 'date'], name='avail_org_date_idx'),
+        ),
+    ]
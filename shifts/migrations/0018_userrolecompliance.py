@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifts', '0017_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRoleCompliance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(max_length=20)),
+                ('is_compliant', models.BooleanField(default=False)),
+                ('valid_until', models.DateField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='role_compliance', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['role', 'is_compliant', 'valid_until'], name='role_compliance_idx'), models.Index(fields=['valid_until'], name='role_compliance_until_idx')],
+                'unique_together': {('user', 'role')},
+            },
+        ),
+    ]
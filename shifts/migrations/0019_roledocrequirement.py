@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:17
+
+import django.db.models.deletion
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_organization_email_display_name_and_more'),
+        ('shifts', '0018_userrolecompliance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userrolecompliance',
+            name='organization',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.organization'),
+        ),
+        migrations.CreateModel(
+            name='RoleDocRequirement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(max_length=20)),
+                ('doc_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='role_requirements', to='shifts.compliancedoctype')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to='core.organization')),
+            ],
+            options={
+                'ordering': ['role', 'doc_type__name'],
+                'unique_together': {('organization', 'role', 'doc_type')},
+            },
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifts', '0019_roledocrequirement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shift',
+            name='geofence_radius_m',
+            field=models.PositiveIntegerField(default=250, help_text='Punch radius around the site (metres).'),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='site_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='site_lng',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
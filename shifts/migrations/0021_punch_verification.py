@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_organization_email_display_name_and_more'),
+        ('shifts', '0020_shift_geofence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shiftbooking',
+            name='clock_in_verification',
+            field=models.CharField(blank=True, choices=[('', 'Checked at punch'), ('pending', 'Pending'), ('verified', 'Verified'), ('mismatched', 'Mismatched')], default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='shiftbooking',
+            name='clock_out_verification',
+            field=models.CharField(blank=True, choices=[('', 'Checked at punch'), ('pending', 'Pending'), ('verified', 'Verified'), ('mismatched', 'Mismatched')], default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='shiftbooking',
+            name='verification_note',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('shift_created', 'Shift created'), ('shift_updated', 'Shift updated'), ('shift_deleted', 'Shift deleted'), ('booking_created', 'Booking created'), ('booking_cancelled', 'Booking cancelled'), ('booking_no_show', 'Marked as no-show'), ('clock_in', 'Clock in'), ('clock_out', 'Clock out'), ('punch_mismatch', 'Punch location mismatch'), ('status_override', 'Status override'), ('notes_updated', 'Notes updated')], db_index=True, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='shiftbooking',
+            index=models.Index(condition=models.Q(('clock_in_verification__in', ['pending', 'mismatched']), ('clock_out_verification__in', ['pending', 'mismatched']), _connector='OR'), fields=['organization', 'id'], name='booking_verify_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:36
+
+import utils.storage
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_organization_email_display_name_and_more'),
+        ('shifts', '0021_punch_verification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shiftbooking',
+            name='clock_out_signature_thumb',
+            field=models.ImageField(blank=True, null=True, upload_to=utils.storage.TenantUploadTo('signatures/thumbs')),
+        ),
+        migrations.AddField(
+            model_name='shiftbooking',
+            name='signature_processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='shiftbooking',
+            name='clock_out_signature',
+            field=models.ImageField(blank=True, null=True, upload_to=utils.storage.TenantUploadTo('signatures')),
+        ),
+        migrations.AddIndex(
+            model_name='shiftbooking',
+            index=models.Index(condition=models.Q(('signature_processed_at__isnull', True), models.Q(('clock_out_signature', ''), _negated=True)), fields=['id'], name='booking_sig_todo_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_organization_email_display_name_and_more'),
+        ('shifts', '0022_signature_processing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shiftbooking',
+            name='attendance_status',
+            field=models.CharField(blank=True, choices=[('', 'Open'), ('no_show', 'No show'), ('auto_closed', 'Auto clocked out')], default='', max_length=12),
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('shift_created', 'Shift created'), ('shift_updated', 'Shift updated'), ('shift_deleted', 'Shift deleted'), ('booking_created', 'Booking created'), ('booking_cancelled', 'Booking cancelled'), ('booking_no_show', 'Marked as no-show'), ('clock_in', 'Clock in'), ('clock_out', 'Clock out'), ('punch_mismatch', 'Punch location mismatch'), ('auto_clock_out', 'Auto clock-out'), ('status_override', 'Status override'), ('notes_updated', 'Notes updated')], db_index=True, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='shiftbooking',
+            index=models.Index(condition=models.Q(('attendance_status', ''), ('clock_in_at__isnull', True)), fields=['organization', 'shift'], name='booking_noshow_scan_idx'),
+        ),
+    ]
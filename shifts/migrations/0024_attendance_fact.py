@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_organization_email_display_name_and_more'),
+        ('shifts', '0023_attendance_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendanceFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('role', models.CharField(max_length=20)),
+                ('paid', models.BooleanField(default=False)),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('present', models.PositiveIntegerField(default=0)),
+                ('no_show', models.PositiveIntegerField(default=0)),
+                ('late', models.PositiveIntegerField(default=0)),
+                ('scheduled_minutes', models.PositiveIntegerField(default=0)),
+                ('worked_minutes', models.PositiveIntegerField(default=0)),
+                ('late_minutes', models.PositiveIntegerField(default=0)),
+                ('early_minutes', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('present', 'Present'), ('pending', 'Pending'), ('incomplete', 'Incomplete'), ('auto_closed', 'Auto clocked out'), ('no_show', 'No show')], default='pending', max_length=12)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to='core.organization')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_facts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization', 'date'], name='fact_org_date_idx'), models.Index(fields=['organization', 'paid', 'date'], name='fact_org_paid_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('organization', 'user', 'date', 'role', 'paid'), name='attendance_fact_key')],
+            },
+        ),
+    ]
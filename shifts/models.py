@@ -7,7 +7,8 @@ from datetime import datetime, time as dtime, timedelta
 from datetime import datetime as dt, time as dtime
 from django.utils import timezone
 from core.models import TenantOwned
-from core.managers import TenantManager
+from core.managers import TenantManager, TenantQuerySet
+from utils.storage import tenant_upload_to
 
 User = settings.AUTH_USER_MODEL
 
@@ -18,6 +19,26 @@ def _normalize_postcode(pc: str | None) -> str | None:
     return pc.replace(" ", "").upper()
 
 
+def shift_bounds(date, start_time, end_time, tz=None):
+    """
+    Aware (start_at, end_at) for a shift. A missing end falls back to the start
+    (or end of day), and an end at/before the start rolls over to the next day.
+    """
+    tz = tz or timezone.get_default_timezone()
+    start_naive = dt.combine(date, start_time or dtime(0, 0, 0))
+    end_naive = dt.combine(date, end_time or start_time or dtime(23, 59, 59))
+    if start_time and end_time and end_time <= start_time:
+        end_naive += timedelta(days=1)  # overnight shift
+    return timezone.make_aware(start_naive, tz), timezone.make_aware(end_naive, tz)
+
+
+class ShiftQuerySet(TenantQuerySet):
+    def upcoming(self, org=None, now=None):
+        """Shifts that haven't finished yet: one range scan on (organization, end_at)."""
+        qs = self.filter(end_at__gt=now or timezone.now())
+        return qs.filter(organization=org) if org is not None else qs
+
+
 class Shift(TenantOwned):
     ROLE_CHOICES = [('Care','Care'),('Cleaning','Cleaning')]
     title = models.CharField(max_length=200, default="Untitled Shift")
@@ -28,10 +49,22 @@ class Shift(TenantOwned):
     location = models.CharField(max_length=255)
     max_staff = models.IntegerField()
     allowed_postcode = models.CharField(max_length=16, null=True, blank=True)
+    # Punch geofence. The site is geocoded once from allowed_postcode (see save());
+    # punches are then checked by distance locally instead of by postcode.
+    site_lat = models.FloatField(null=True, blank=True)
+    site_lng = models.FloatField(null=True, blank=True)
+    geofence_radius_m = models.PositiveIntegerField(default=250, help_text="Punch radius around the site (metres).")
+    # Denormalized seat counter. Only moved by conditional UPDATEs (see
+    # shifts.utils.create_booking and the ShiftBooking signals); repair drift
+    # with `manage.py reconcile_booked_counts`.
+    booked_count = models.PositiveIntegerField(default=0, editable=False)
+    # Derived from date/start_time/end_time in save(); "upcoming" filters use end_at.
+    start_at = models.DateTimeField(null=True, editable=False)
+    end_at = models.DateTimeField(null=True, editable=False)
 
     # 👇 managers
-    all_objects = models.Manager()     # unfiltered (for admin, debugging)
-    objects = TenantManager()          # tenant-scoped (for your app)
+    all_objects = models.Manager.from_queryset(ShiftQuerySet)()     # unfiltered (for admin, debugging)
+    objects = TenantManager.from_queryset(ShiftQuerySet)()          # tenant-scoped (for your app)
 
     def __str__(self):
         st = self.start_time.strftime("%H:%M") if self.start_time else "--:--"
@@ -39,37 +72,80 @@ class Shift(TenantOwned):
         return f"{self.title} ({self.date} {st}-{et})"
 
     # ---- Capacity helpers ----
-    def booked_count(self) -> int:
-        return self.bookings.count()
-
     @property
     def has_space(self) -> bool:
-        return self.booked_count() < self.max_staff
+        return self.booked_count < self.max_staff
+
+    @property
+    def has_geofence(self) -> bool:
+        return self.site_lat is not None and self.site_lng is not None and self.geofence_radius_m > 0
 
     # ---- Time helpers ----
     def _end_dt(self):
-        t = self.end_time or self.start_time or dtime(23, 59, 59)
-        naive = dt.combine(self.date, t)
-        return timezone.make_aware(naive, timezone.get_current_timezone()) \
-            if timezone.is_naive(naive) else naive
+        return shift_bounds(self.date, self.start_time, self.end_time)[1]
 
     @property
     def is_past(self) -> bool:
         return self._end_dt() <= timezone.now()
 
     def start_dt(self):
-        t = self.start_time or dtime(0, 0, 0)
-        naive = dt.combine(self.date, t)
-        return timezone.make_aware(naive, timezone.get_current_timezone()) \
-            if timezone.is_naive(naive) else naive
+        return shift_bounds(self.date, self.start_time, self.end_time)[0]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_postcode = instance.__dict__.get("allowed_postcode")
+        return instance
 
     def save(self, *args, **kwargs):
         self.allowed_postcode = _normalize_postcode(self.allowed_postcode)
+        update_fields = kwargs.get("update_fields")
+        # re-geocode only when the postcode actually changed (new shift or edit),
+        # and never over coordinates given explicitly for a new shift. The old
+        # site no longer applies; the new one is looked up after commit
+        # (shifts.geocoding.schedule_site_geocode), not inside this save.
+        geocode = self.allowed_postcode != getattr(self, "_loaded_postcode", None) and (
+            update_fields is None or "allowed_postcode" in update_fields
+        ) and not (self._state.adding and self.site_lat is not None)
+        if geocode:
+            self.site_lat = self.site_lng = None
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "site_lat", "site_lng"}
+        # accept "YYYY-MM-DD" / "HH:MM" strings like the DB would
+        for name in ("date", "start_time", "end_time"):
+            setattr(self, name, self._meta.get_field(name).to_python(getattr(self, name)))
+        self.start_at, self.end_at = shift_bounds(self.date, self.start_time, self.end_time)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"date", "start_time", "end_time"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "start_at", "end_at"}
         super().save(*args, **kwargs)
+        self._loaded_postcode = self.allowed_postcode
+        if geocode and self.allowed_postcode:
+            from .geocoding import schedule_site_geocode
+
+            schedule_site_geocode(self.pk)
 
     class Meta:
         ordering = ("date", "start_time", "title")
+        indexes = [
+            models.Index(fields=["organization", "end_at"], name="shift_org_end_at_idx"),
+            # date-range reports (timesheets, payroll, calendar) join bookings through this
+            models.Index(fields=["organization", "date"], name="shift_org_date_idx"),
+        ]
+
+
 
+class PunchVerification(models.TextChoices):
+    INLINE      = "", "Checked at punch"
+    PENDING     = "pending", "Pending"          # saved with raw coordinates; see shifts/verification.py
+    VERIFIED    = "verified", "Verified"
+    MISMATCHED  = "mismatched", "Mismatched"
+
+
+class AttendanceStatus(models.TextChoices):
+    OPEN         = "", "Open"                       # derived live in reports
+    NO_SHOW      = "no_show", "No show"
+    AUTO_CLOSED  = "auto_closed", "Auto clocked out"  # see close_overdue_bookings
 
 
 class ShiftBooking(TenantOwned):
@@ -92,7 +168,18 @@ class ShiftBooking(TenantOwned):
     # NEW: optional extras at clock-out
     clock_out_note = models.TextField(blank=True, default="")
     clock_out_supervisor_name = models.CharField(max_length=100, blank=True, default="")
-    clock_out_signature = models.ImageField(upload_to="signatures/", null=True, blank=True)
+    clock_out_signature = models.ImageField(upload_to=tenant_upload_to("signatures"), null=True, blank=True)
+    # filled in off-request by shifts/signatures.py (recompressed original + small preview)
+    clock_out_signature_thumb = models.ImageField(upload_to=tenant_upload_to("signatures/thumbs"), null=True, blank=True)
+    signature_processed_at = models.DateTimeField(null=True, blank=True)
+
+    # Deferred location checks (PUNCH_VERIFICATION_DEFERRED): one state per punch
+    clock_in_verification = models.CharField(max_length=12, choices=PunchVerification.choices, blank=True, default="")
+    clock_out_verification = models.CharField(max_length=12, choices=PunchVerification.choices, blank=True, default="")
+    verification_note = models.CharField(max_length=255, blank=True, default="")
+
+    # settled by `manage.py close_overdue_bookings` once the shift is long over
+    attendance_status = models.CharField(max_length=12, choices=AttendanceStatus.choices, blank=True, default="")
     
     paid_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
@@ -109,6 +196,15 @@ class ShiftBooking(TenantOwned):
     @property
     def is_paid(self) -> bool:
         return self.paid_at is not None
+
+    @property
+    def verification_state(self) -> str:
+        """Worst state of the two punches: mismatched > pending > verified > checked inline."""
+        states = {self.clock_in_verification, self.clock_out_verification}
+        for state in (PunchVerification.MISMATCHED, PunchVerification.PENDING, PunchVerification.VERIFIED):
+            if state in states:
+                return state
+        return PunchVerification.INLINE
     
     def mark_paid(self):
         if not self.paid_at:
@@ -117,6 +213,31 @@ class ShiftBooking(TenantOwned):
 
     class Meta:
         unique_together = ('user', 'shift')  # Prevent double bookings
+        indexes = [
+            models.Index(fields=["organization", "user"], name="booking_org_user_idx"),
+            models.Index(fields=["organization", "paid_at"], name="booking_org_paid_idx"),
+            # "clocked in but not clocked out": tiny, only open punches live here
+            models.Index(
+                fields=["organization", "clock_in_at"], name="booking_open_punch_idx",
+                condition=models.Q(clock_in_at__isnull=False, clock_out_at__isnull=True),
+            ),
+            # background verifier / admin mismatch queue: only unsettled punches live here
+            models.Index(
+                fields=["organization", "id"], name="booking_verify_queue_idx",
+                condition=models.Q(clock_in_verification__in=["pending", "mismatched"])
+                | models.Q(clock_out_verification__in=["pending", "mismatched"]),
+            ),
+            # never clocked in and not settled yet: the no-show sweep reads only these
+            models.Index(
+                fields=["organization", "shift"], name="booking_noshow_scan_idx",
+                condition=models.Q(clock_in_at__isnull=True, attendance_status=""),
+            ),
+            # signatures still waiting for recompression (see shifts/signatures.py)
+            models.Index(
+                fields=["id"], name="booking_sig_todo_idx",
+                condition=models.Q(signature_processed_at__isnull=True) & ~models.Q(clock_out_signature=""),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} booked {self.shift}"
@@ -154,7 +275,56 @@ class ShiftBooking(TenantOwned):
 
         # If no end time, allow any time after clock-in on the same day
         return now >= self.clock_in_at
-    
+
+
+class DailyStatus(models.TextChoices):
+    # best to worst: a day's status is the worst among its bookings
+    PRESENT      = "present", "Present"
+    PENDING      = "pending", "Pending"             # not clocked in, not settled yet
+    INCOMPLETE   = "incomplete", "Incomplete"       # clocked in, not out
+    AUTO_CLOSED  = "auto_closed", "Auto clocked out"
+    NO_SHOW      = "no_show", "No show"
+
+
+class DailyAttendanceFact(TenantOwned):
+    """
+    Rollup of ShiftBooking per (user, shift date, role, paid flag), so reports
+    and dashboards range-scan (organization, date) instead of aggregating
+    bookings. Kept current by shifts/facts.py (booking/shift signals plus the
+    bulk paths); `manage.py rebuild_attendance_facts` backfills and
+    `manage.py check_attendance_facts` compares against ShiftBooking.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="attendance_facts")
+    date = models.DateField()
+    role = models.CharField(max_length=20)
+    paid = models.BooleanField(default=False)
+
+    bookings = models.PositiveIntegerField(default=0)
+    present = models.PositiveIntegerField(default=0)
+    no_show = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)     # bookings clocked in after the start
+
+    scheduled_minutes = models.PositiveIntegerField(default=0)
+    worked_minutes = models.PositiveIntegerField(default=0)
+    late_minutes = models.PositiveIntegerField(default=0)
+    early_minutes = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=12, choices=DailyStatus.choices, default=DailyStatus.PENDING)
+
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["organization", "user", "date", "role", "paid"], name="attendance_fact_key"),
+        ]
+        indexes = [
+            models.Index(fields=["organization", "date"], name="fact_org_date_idx"),
+            models.Index(fields=["organization", "paid", "date"], name="fact_org_paid_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.date} {self.role}: {self.get_status_display()}"
+
+
 # Compliance
 class ComplianceDocType(models.Model):
     name = models.CharField(max_length=120, unique=True)
@@ -207,6 +377,53 @@ class ComplianceDocument(models.Model):
             return None
         return (self.expiry_date - timezone.localdate()).days
     
+class RoleDocRequirement(TenantOwned):
+    """
+    Per-organization override of the documents a role requires. Roles with no
+    rows for an organization use the defaults in shifts.utils.ROLE_DOC_RULES.
+    """
+    role = models.CharField(max_length=20)
+    doc_type = models.ForeignKey(ComplianceDocType, on_delete=models.CASCADE, related_name="role_requirements")
+
+    all_objects = models.Manager()     # unfiltered (for admin, debugging)
+    objects = TenantManager()
+
+    class Meta:
+        unique_together = ("organization", "role", "doc_type")
+        ordering = ["role", "doc_type__name"]
+
+    def __str__(self):
+        return f"{self.role} requires {self.doc_type.name}"
+
+
+class UserRoleCompliance(models.Model):
+    """
+    Materialized answer to "is this user compliant for this role?".
+    Kept current by the ComplianceDocument/ComplianceDocType signals; rows whose
+    valid_until has passed are flipped by `manage.py refresh_role_compliance`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="role_compliance")
+    role = models.CharField(max_length=20)
+    # org whose rules were applied; a row for another org is treated as missing
+    organization = models.ForeignKey("core.Organization", null=True, blank=True, on_delete=models.CASCADE)
+    is_compliant = models.BooleanField(default=False)
+    # last day the current status holds (earliest expiry among the required docs);
+    # null = holds until a document changes
+    valid_until = models.DateField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "role")
+        indexes = [
+            models.Index(fields=["role", "is_compliant", "valid_until"], name="role_compliance_idx"),
+            models.Index(fields=["valid_until"], name="role_compliance_until_idx"),
+        ]
+
+    def __str__(self):
+        state = "compliant" if self.is_compliant else "not compliant"
+        return f"{self.user} – {self.role}: {state}"
+
+
 # Audit trail could be added here if desired
 
 class AuditAction(models.TextChoices):
@@ -220,6 +437,8 @@ class AuditAction(models.TextChoices):
 
     CLOCK_IN            = "clock_in", "Clock in"
     CLOCK_OUT           = "clock_out", "Clock out"
+    PUNCH_MISMATCH      = "punch_mismatch", "Punch location mismatch"   # deferred verification failed
+    AUTO_CLOCK_OUT      = "auto_clock_out", "Auto clock-out"            # forgot to clock out; closed at scheduled end
 
     STATUS_OVERRIDE     = "status_override", "Status override"          # admin forced clock in/out etc.
     NOTES_UPDATED       = "notes_updated", "Notes updated"
@@ -251,12 +470,84 @@ class AuditLog(models.Model):
 
     class Meta:
         ordering = ["-at"]
+        indexes = [
+            models.Index(fields=["action", "-at"], name="audit_action_at_idx"),
+        ]
 
     def __str__(self):
         target = self.booking or self.shift or "-"
         who = self.actor or "system"
         return f"[{self.at:%Y-%m-%d %H:%M}] {who} {self.action} {target}"
 
+
+class ExportKind(models.TextChoices):
+    ATTENDANCE = "attendance", "Attendance report"
+    PAID       = "paid", "Paid bookings"
+    AUDIT      = "audit", "Audit log"
+
+
+class ExportStatus(models.TextChoices):
+    QUEUED  = "queued", "Queued"
+    RUNNING = "running", "Running"
+    DONE    = "done", "Ready"
+    FAILED  = "failed", "Failed"
+
+
+class ExportJob(TenantOwned):
+    """
+    A report export rendered off-request (shifts/export_jobs.py). Identical
+    requests share one job through params_hash; finished files are deleted
+    once expires_at passes.
+    """
+    requested_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="export_jobs")
+    kind = models.CharField(max_length=12, choices=ExportKind.choices)
+    format = models.CharField(max_length=8)                       # "csv" | "xlsx" | "parquet"
+    params = models.JSONField(default=dict, blank=True)           # normalized report filters
+    params_hash = models.CharField(max_length=64)                 # sha256 of org + kind + format + params
+
+    status = models.CharField(max_length=8, choices=ExportStatus.choices, default=ExportStatus.QUEUED)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    rows_written = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+
+    filename = models.CharField(max_length=120)
+    file = models.FileField(upload_to=tenant_upload_to("exports"), null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            # one live job per set of parameters; a racing duplicate hits this and joins it
+            models.UniqueConstraint(
+                fields=["organization", "params_hash"], name="export_job_live_dedupe",
+                condition=models.Q(status__in=["queued", "running"]),
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["organization", "params_hash", "-finished_at"], name="export_job_lookup_idx"),
+            models.Index(fields=["status", "created_at"], name="export_job_queue_idx"),
+            models.Index(fields=["expires_at"], name="export_job_expiry_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.format} ({self.get_status_display()})"
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (ExportStatus.QUEUED, ExportStatus.RUNNING)
+
+    @property
+    def percent(self) -> int:
+        if self.status == ExportStatus.DONE:
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, self.rows_written * 100 // self.total_rows)
+
 # User Availability and Holiday Models
 class UserAvailability(TenantOwned):
     """User availability for specific days/times"""
@@ -281,6 +572,10 @@ class UserAvailability(TenantOwned):
     class Meta:
         unique_together = ('user', 'date', 'start_time', 'end_time')
         ordering = ['date', 'start_time']
+        # (user, date, ...) lookups are already served by the unique_together index
+        indexes = [
+            models.Index(fields=["organization", "date"], name="avail_org_date_idx"),
+        ]
     
     def __str__(self):
         time_str = ""
@@ -336,6 +631,10 @@ class HolidayRequest(TenantOwned):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=["organization", "status"], name="holiday_org_status_idx"),
+            models.Index(fields=["organization", "user"], name="holiday_org_user_idx"),
+        ]
     
     def __str__(self):
         return f"{self.user} - {self.get_holiday_type_display()} ({self.start_date} to {self.end_date}) - {self.get_status_display()}"
@@ -0,0 +1,180 @@
+# shifts/postcode_index.py
+"""
+Offline nearest-postcode lookup over a memory-mapped grid index.
+
+The index file is built once from a postcode-centroid CSV (ONS Postcode
+Directory style: pcds, lat, long) by `manage.py build_postcode_index`.
+Points are bucketed into a regular lat/lng grid and stored cell by cell:
+
+    header   magic, version, n_points, cell_deg, lat0, lng0, n_rows, n_cols
+    offsets  uint32[n_rows * n_cols + 1]   start of each cell in the arrays
+    lats     float64[n_points]
+    lngs     float64[n_points]
+    codes    char[8][n_points]             postcode, NUL padded
+
+Nothing is parsed on load: the arrays are zero-copy memoryviews over the
+mmap, so every worker shares the same page cache and a lookup only touches
+the few cells around the query point.
+"""
+import csv
+import math
+import mmap
+import os
+import struct
+from array import array
+
+MAGIC = b"SPCIDX\x00\x01"
+VERSION = 1
+HEADER = struct.Struct("<8sIIdddII")
+CODE_WIDTH = 8
+KM_PER_DEG = 111.195
+
+# ONS marks postcodes with no grid reference with this latitude
+_NO_LOCATION_LAT = 99.999999
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class PostcodeIndex:
+    """Read-only view over an index file; safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, cell, lat0, lng0, rows, cols = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a postcode index (v{VERSION})")
+        self.size, self.cell_deg = n, cell
+        self.lat0, self.lng0, self.n_rows, self.n_cols = lat0, lng0, rows, cols
+
+        view = memoryview(self._mm)
+        pos = HEADER.size
+        n_cells = rows * cols + 1
+        self._offsets = view[pos:pos + 4 * n_cells].cast("I")
+        pos = _pad8(pos + 4 * n_cells)
+        self._lats = view[pos:pos + 8 * n].cast("d")
+        pos += 8 * n
+        self._lngs = view[pos:pos + 8 * n].cast("d")
+        pos += 8 * n
+        self._codes_pos = pos
+        self._codes = view[pos:pos + CODE_WIDTH * n]
+
+    def close(self):
+        for v in (self._offsets, self._lats, self._lngs, self._codes):
+            v.release()
+        self._mm.close()
+
+    def bounds(self):
+        return (self.lat0, self.lng0,
+                self.lat0 + self.n_rows * self.cell_deg, self.lng0 + self.n_cols * self.cell_deg)
+
+    def code(self, i: int) -> str:
+        start = i * CODE_WIDTH
+        return bytes(self._codes[start:start + CODE_WIDTH]).rstrip(b"\x00").decode("ascii")
+
+    def find(self, postcode: str):
+        """(lat, lng) of an exact postcode, else None. Linear scan, but in C (mmap.find)."""
+        needle = postcode.strip().upper().encode("ascii", "ignore")[:CODE_WIDTH].ljust(CODE_WIDTH, b"\x00")
+        start, end = self._codes_pos, self._codes_pos + CODE_WIDTH * self.size
+        pos = self._mm.find(needle, start, end)
+        while pos != -1 and (pos - start) % CODE_WIDTH:
+            pos = self._mm.find(needle, pos + 1, end)  # matched across a record boundary
+        if pos == -1:
+            return None
+        i = (pos - start) // CODE_WIDTH
+        return self._lats[i], self._lngs[i]
+
+    def nearest(self, lat: float, lng: float, max_km: float = 1.0):
+        """(postcode, distance_km) of the closest centroid within max_km, else None."""
+        cell = self.cell_deg
+        row = int((lat - self.lat0) // cell)
+        col = int((lng - self.lng0) // cell)
+        n_rows, n_cols = self.n_rows, self.n_cols
+        offsets, lats, lngs = self._offsets, self._lats, self._lngs
+
+        # equirectangular distance is plenty at postcode scale
+        kx = KM_PER_DEG * math.cos(math.radians(lat))
+        ky = KM_PER_DEG
+        cell_km = cell * min(kx, ky)
+        max_ring = int(max_km / cell_km) + 1 if cell_km > 0 else 0
+
+        best_i, best_d2 = -1, max_km * max_km
+        for ring in range(max_ring + 1):
+            r0, r1 = row - ring, row + ring
+            for r in range(max(r0, 0), min(r1, n_rows - 1) + 1):
+                edge = r == r0 or r == r1
+                step = 1 if edge else 2 * ring
+                c = col - ring
+                while c <= col + ring:
+                    if 0 <= c < n_cols:
+                        k = r * n_cols + c
+                        for i in range(offsets[k], offsets[k + 1]):
+                            dx = (lngs[i] - lng) * kx
+                            dy = (lats[i] - lat) * ky
+                            d2 = dx * dx + dy * dy
+                            if d2 < best_d2:
+                                best_i, best_d2 = i, d2
+                    c += step if step else 1
+            # anything in a further ring is at least ring * cell_km away
+            if best_i >= 0 and best_d2 <= (ring * cell_km) ** 2:
+                break
+        if best_i < 0:
+            return None
+        return self.code(best_i), math.sqrt(best_d2)
+
+
+def read_centroids(path: str, postcode_col="pcds", lat_col="lat", lng_col="long", terminated_col="doterm"):
+    """Yield (postcode, lat, lng) from a centroid CSV, skipping terminated/unlocated rows."""
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        reader = csv.DictReader(fh)
+        for rec in reader:
+            if terminated_col in rec and (rec[terminated_col] or "").strip():
+                continue
+            try:
+                lat, lng = float(rec[lat_col]), float(rec[lng_col])
+            except (TypeError, ValueError):
+                continue
+            if lat >= _NO_LOCATION_LAT:
+                continue
+            pc = (rec[postcode_col] or "").strip().upper()
+            if pc:
+                yield pc, lat, lng
+
+
+def build_index(points, path: str, cell_deg: float = 0.005) -> int:
+    """Write an index file for an iterable of (postcode, lat, lng); returns the point count."""
+    pts = []
+    for pc, lat, lng in points:
+        code = pc.encode("ascii", "ignore")[:CODE_WIDTH]
+        pts.append((lat, lng, code))
+    if not pts:
+        raise ValueError("no postcode centroids to index")
+
+    lat0 = math.floor(min(p[0] for p in pts) / cell_deg) * cell_deg
+    lng0 = math.floor(min(p[1] for p in pts) / cell_deg) * cell_deg
+    n_rows = int((max(p[0] for p in pts) - lat0) // cell_deg) + 1
+    n_cols = int((max(p[1] for p in pts) - lng0) // cell_deg) + 1
+
+    def cell_of(p):
+        return int((p[0] - lat0) // cell_deg) * n_cols + int((p[1] - lng0) // cell_deg)
+
+    pts.sort(key=cell_of)
+    counts = array("I", [0]) * (n_rows * n_cols + 1)
+    for p in pts:
+        counts[cell_of(p) + 1] += 1
+    for k in range(1, len(counts)):
+        counts[k] += counts[k - 1]
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, VERSION, len(pts), cell_deg, lat0, lng0, n_rows, n_cols))
+        counts.tofile(fh)
+        fh.write(b"\x00" * (_pad8(fh.tell()) - fh.tell()))
+        array("d", (p[0] for p in pts)).tofile(fh)
+        array("d", (p[1] for p in pts)).tofile(fh)
+        fh.write(b"".join(p[2].ljust(CODE_WIDTH, b"\x00") for p in pts))
+    os.replace(tmp, path)  # atomic swap; running workers keep their old mmap
+    return len(pts)
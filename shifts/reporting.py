@@ -0,0 +1,86 @@
+# shifts/reporting.py
+"""
+Attendance figures computed by the database.
+
+with_attendance_metrics() annotates a ShiftBooking queryset with:
+- worked_seconds: clock-out minus clock-in, 0 if either punch is missing
+- late_minutes / early_minutes: measured against the shift's start_at/end_at,
+  rounded to the nearest minute
+- status: "Present", "No show", "Incomplete", "Pending", or the stored
+  attendance_status label
+- clock_in_time / clock_out_time: local wall-clock time of each punch
+
+The report pages and exports read these straight from values(). The stat
+cards and per user / role / week totals come from the DailyAttendanceFact
+rollup (shifts/facts.py), which is built from the same punch_metrics().
+"""
+from django.db.models import Case, CharField, ExpressionWrapper, F, Func, IntegerField, Value, When
+from django.db.models.functions import TruncTime
+
+from .models import AttendanceStatus
+
+
+class SecondsBetween(Func):
+    """Whole seconds from `start` to `end` (both datetime expressions)."""
+
+    output_field = IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+    def _compile_args(self, compiler):
+        end_sql, end_params = compiler.compile(self.source_expressions[0])
+        start_sql, start_params = compiler.compile(self.source_expressions[1])
+        return end_sql, start_sql, (*end_params, *start_params)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL: interval arithmetic
+        end_sql, start_sql, params = self._compile_args(compiler)
+        return f"CAST(FLOOR(EXTRACT(EPOCH FROM ({end_sql} - {start_sql}))) AS integer)", params
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # julianday() keeps sub-second precision; go through milliseconds to avoid float noise
+        end_sql, start_sql, params = self._compile_args(compiler)
+        return f"(CAST(ROUND((julianday({end_sql}) - julianday({start_sql})) * 86400000) AS integer) / 1000)", params
+
+
+def _round_minutes(seconds):
+    return ExpressionWrapper((seconds + 30) / 60, output_field=IntegerField())
+
+
+def punch_metrics() -> dict:
+    """worked_seconds / late_minutes / early_minutes expressions for a ShiftBooking queryset."""
+    ci, co = F("clock_in_at"), F("clock_out_at")
+    start, end = F("shift__start_at"), F("shift__end_at")
+    return {
+        "worked_seconds": Case(
+            When(clock_in_at__isnull=False, clock_out_at__gte=ci, then=SecondsBetween(co, ci)),
+            default=Value(0), output_field=IntegerField(),
+        ),
+        "late_minutes": Case(
+            When(clock_in_at__gt=start, then=_round_minutes(SecondsBetween(ci, start))),
+            default=Value(0), output_field=IntegerField(),
+        ),
+        "early_minutes": Case(
+            When(clock_out_at__lt=end, then=_round_minutes(SecondsBetween(end, co))),
+            default=Value(0), output_field=IntegerField(),
+        ),
+    }
+
+
+def with_attendance_metrics(qs, now):
+    """Annotate bookings with worked/late/early figures and a status label (see module docstring)."""
+    labels = dict(AttendanceStatus.choices)
+    return qs.annotate(
+        **punch_metrics(),
+        status=Case(
+            *[When(attendance_status=code, then=Value(labels[code]))
+              for code in (AttendanceStatus.NO_SHOW, AttendanceStatus.AUTO_CLOSED)],
+            When(clock_in_at__isnull=True, shift__end_at__lt=now, then=Value("No show")),
+            When(clock_in_at__isnull=False, clock_out_at__isnull=True, shift__end_at__lt=now, then=Value("Incomplete")),
+            When(clock_in_at__isnull=False, clock_out_at__isnull=False, then=Value("Present")),
+            default=Value("Pending"), output_field=CharField(),
+        ),
+        clock_in_time=TruncTime("clock_in_at"),
+        clock_out_time=TruncTime("clock_out_at"),
+    )
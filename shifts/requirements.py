@@ -0,0 +1,80 @@
+# shifts/requirements.py
+"""
+Role -> required ComplianceDocType ids, compiled once per organization.
+
+Organizations can override the requirements for a role with RoleDocRequirement
+rows; roles without rows fall back to utils.ROLE_DOC_RULES (matched by doc type
+name). The compiled registry is a plain dict of frozensets, cached in-process
+and keyed by a shared version stamp that signals bump (once the change
+commits) whenever a rule or doc type changes. The version is re-read from the
+shared cache at most every CACHE_VERSION_LOCAL_TTL seconds, so other workers
+recompile within that window.
+"""
+from django.conf import settings
+
+from core.cache import LRUTTLCache, MISSING, bump_version_on_commit, get_local_version, get_stats
+from core.multitenancy import get_current_tenant
+
+ROLE_RULES_NAMESPACE = "role-rules"
+DEFAULT_ROLE = "_DEFAULT"
+
+_registry_cache = LRUTTLCache(
+    maxsize=getattr(settings, "ROLE_RULES_CACHE_SIZE", 256),
+    ttl=getattr(settings, "ROLE_RULES_CACHE_TTL", 300),
+)
+registry_stats = get_stats("role_rules")
+
+
+def _compile(org_id) -> dict:
+    from .models import ComplianceDocType, RoleDocRequirement
+    from .utils import ROLE_DOC_RULES
+
+    active = dict(ComplianceDocType.objects.filter(is_active=True).values_list("name", "id"))
+    registry = {
+        role: frozenset(active[n] for n in names if n in active)
+        for role, names in ROLE_DOC_RULES.items()
+    }
+    if org_id is not None:
+        overrides = {}
+        rows = (
+            RoleDocRequirement.all_objects
+            .filter(organization_id=org_id, doc_type__is_active=True)
+            .values_list("role", "doc_type_id")
+        )
+        for role, type_id in rows:
+            overrides.setdefault(role, set()).add(type_id)
+        registry.update({role: frozenset(ids) for role, ids in overrides.items()})
+    return registry
+
+
+def get_role_registry(org=None) -> dict:
+    """{role: frozenset(doc type ids)} for `org` (an Organization, its pk, or None)."""
+    org_id = getattr(org, "pk", org)
+    key = (get_local_version(ROLE_RULES_NAMESPACE), org_id)
+    registry = _registry_cache.get(key)
+    if registry is MISSING:
+        registry_stats.incr("miss")
+        registry = _compile(org_id)
+        _registry_cache.set(key, registry)
+    else:
+        registry_stats.incr("hit")
+    return registry
+
+
+def role_requirements(registry: dict, role: str) -> frozenset:
+    """Look `role` up in a compiled registry, falling back to the default rule."""
+    if role in registry:
+        return registry[role]
+    return registry.get(DEFAULT_ROLE, frozenset())
+
+
+def required_type_ids(role: str, org=None) -> frozenset:
+    """Doc type ids required for `role` in `org` (defaults to the current tenant)."""
+    if org is None:
+        org = get_current_tenant()
+    return role_requirements(get_role_registry(org), role)
+
+
+def invalidate_role_registry():
+    """Force every process to recompile on its next lookup after the current transaction commits."""
+    bump_version_on_commit(ROLE_RULES_NAMESPACE, then=_registry_cache.clear)
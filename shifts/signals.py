@@ -1,11 +1,143 @@
 # shifts/signals.py
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import ShiftBooking
+from .models import ComplianceDocType, ComplianceDocument, RoleDocRequirement, Shift, ShiftBooking
 from .emails import send_booking_email
+from .facts import booking_key, schedule_refresh
+from .requirements import DEFAULT_ROLE, invalidate_role_registry
+from .utils import refresh_role_compliance, roles_using_doc_type, schedule_compliance_refresh
 
 @receiver(post_save, sender=ShiftBooking)
 def notify_user_on_booking_create(sender, instance: ShiftBooking, created, **kwargs):
     # Only on creation, not every update (e.g., clock in/out)
     if created:
         send_booking_email(instance)
+
+
+# ---- Shift.booked_count bookkeeping ----
+@receiver(post_save, sender=ShiftBooking)
+def count_booking_seat(sender, instance: ShiftBooking, created, **kwargs):
+    # Bookings made through utils.create_booking already claimed their seat
+    # atomically; anything else (admin, shell, scripts) is counted here.
+    if created and not getattr(instance, "_seat_claimed", False):
+        Shift.all_objects.filter(pk=instance.shift_id).update(booked_count=F("booked_count") + 1)
+
+@receiver(post_delete, sender=ShiftBooking)
+def release_booking_seat(sender, instance: ShiftBooking, **kwargs):
+    Shift.all_objects.filter(pk=instance.shift_id, booked_count__gt=0).update(booked_count=F("booked_count") - 1)
+
+
+# ---- UserRoleCompliance upkeep ----
+@receiver([post_save, post_delete], sender=ComplianceDocument)
+def refresh_user_role_compliance(sender, instance: ComplianceDocument, **kwargs):
+    # only the document owner's rows can change
+    user_id = instance.user_id
+    transaction.on_commit(lambda: refresh_role_compliance([user_id]))
+
+# Rule/type edits change the compiled requirements. Only the users and roles
+# they can affect are recomputed: an org's rule touches that org's users, a doc
+# type touches the roles that name it (every org) and the orgs whose rules use it.
+_DOC_TYPE_RULE_FIELDS = ("name", "requires_expiry", "is_active")
+
+
+@receiver(pre_save, sender=ComplianceDocType)
+def remember_doc_type_rules(sender, instance: ComplianceDocType, **kwargs):
+    instance._rules_before = (
+        ComplianceDocType.objects.filter(pk=instance.pk).values_list(*_DOC_TYPE_RULE_FIELDS).first()
+        if instance.pk else None
+    )
+
+
+@receiver([post_save, post_delete], sender=ComplianceDocType)
+def refresh_doc_type_compliance(sender, instance: ComplianceDocType, **kwargs):
+    before = getattr(instance, "_rules_before", None)
+    if kwargs.get("created") is False and before == tuple(getattr(instance, f) for f in _DOC_TYPE_RULE_FIELDS):
+        return  # e.g. default_validity_days: no rule changed
+    invalidate_role_registry()
+    names = {instance.name} | ({before[0]} if before else set())
+    roles = roles_using_doc_type(*names)
+    if roles is None or roles:
+        schedule_compliance_refresh(roles=roles)
+    overrides = {}
+    # on delete the cascaded RoleDocRequirement rows are gone and have refreshed their own orgs
+    for org_id, role in RoleDocRequirement.all_objects.filter(doc_type_id=instance.pk).values_list("organization_id", "role"):
+        overrides.setdefault(org_id, set()).add(role)
+    for org_id, org_roles in overrides.items():
+        schedule_compliance_refresh(org_id, None if DEFAULT_ROLE in org_roles else org_roles)
+
+
+@receiver(pre_save, sender=RoleDocRequirement)
+def remember_requirement_role(sender, instance: RoleDocRequirement, **kwargs):
+    instance._rules_before = (
+        RoleDocRequirement.all_objects.filter(pk=instance.pk).values_list("organization_id", "role").first()
+        if instance.pk else None
+    )
+
+
+@receiver([post_save, post_delete], sender=RoleDocRequirement)
+def refresh_requirement_compliance(sender, instance: RoleDocRequirement, **kwargs):
+    invalidate_role_registry()
+    scopes = {(instance.organization_id, instance.role)}
+    before = getattr(instance, "_rules_before", None)
+    if before:
+        scopes.add(before)  # the row moved from another role/org
+    for org_id, role in scopes:
+        schedule_compliance_refresh(org_id, None if role == DEFAULT_ROLE else [role])
+
+
+# ---- DailyAttendanceFact upkeep (see shifts/facts.py) ----
+# saves that only touch other fields (signatures, verification, notes) skip the refresh
+_FACT_BOOKING_FIELDS = {"clock_in_at", "clock_out_at", "attendance_status", "paid_at", "shift", "user"}
+_FACT_SHIFT_FIELDS = ("date", "role", "start_time", "end_time")
+
+
+def _touches(update_fields, fields) -> bool:
+    return update_fields is None or bool(set(update_fields) & set(fields))
+
+
+@receiver(pre_save, sender=ShiftBooking)
+def remember_booking_fact_key(sender, instance: ShiftBooking, update_fields=None, **kwargs):
+    # an edit can move the booking to another user/shift: the old row must be refreshed too
+    if instance.pk and _touches(update_fields, ("shift", "user")):
+        instance._fact_key_before = (
+            ShiftBooking.all_objects.filter(pk=instance.pk)
+            .values_list("organization_id", "user_id", "shift__date", "shift__role").first()
+        )
+
+
+@receiver(post_save, sender=ShiftBooking)
+def refresh_booking_fact(sender, instance: ShiftBooking, created, update_fields=None, **kwargs):
+    if created or _touches(update_fields, _FACT_BOOKING_FIELDS):
+        schedule_refresh(k for k in (booking_key(instance), getattr(instance, "_fact_key_before", None)) if k)
+
+
+@receiver(post_delete, sender=ShiftBooking)
+def refresh_deleted_booking_fact(sender, instance: ShiftBooking, **kwargs):
+    # a cascading Shift delete removes the bookings first, so the shift is still readable here
+    key = booking_key(instance)
+    if key:
+        schedule_refresh([key])
+
+
+@receiver(pre_save, sender=Shift)
+def remember_shift_fact_fields(sender, instance: Shift, update_fields=None, **kwargs):
+    if instance.pk and _touches(update_fields, _FACT_SHIFT_FIELDS):
+        instance._fact_fields_before = (
+            Shift.all_objects.filter(pk=instance.pk).values_list(*_FACT_SHIFT_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=Shift)
+def refresh_shift_facts(sender, instance: Shift, created, **kwargs):
+    before = getattr(instance, "_fact_fields_before", None)
+    if created or not before or before == tuple(getattr(instance, f) for f in _FACT_SHIFT_FIELDS):
+        return
+    user_ids = list(ShiftBooking.all_objects.filter(shift_id=instance.pk).values_list("user_id", flat=True))
+    old_date, old_role = before[0], before[1]
+    schedule_refresh(
+        key for uid in user_ids
+        for key in ((instance.organization_id, uid, old_date, old_role),
+                    (instance.organization_id, uid, instance.date, instance.role))
+    )
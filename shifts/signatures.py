@@ -0,0 +1,183 @@
+# shifts/signatures.py
+"""
+Clock-out signature ingestion.
+
+In the request, a signature is only sniffed and size-checked
+(SIGNATURE_MAX_BYTES) and then streamed to storage as-is. Multipart uploads
+arrive as an UploadedFile that Django has already spooled to disk, so the
+request never holds or decodes the image.
+
+After the clock-out commits, process_signature() re-encodes the original:
+- a palette PNG, or WebP when SIGNATURE_FORMAT = "webp"
+- plus a small thumbnail
+It does this on a small in-process thread pool (SIGNATURE_WORKERS; 0 disables
+it). `manage.py process_signatures` picks up anything left unprocessed, e.g.
+after a restart.
+"""
+import base64
+import binascii
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import ShiftBooking
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_MAX_BYTES = getattr(settings, "SIGNATURE_MAX_BYTES", 512 * 1024)
+SIGNATURE_MAX_PIXELS = getattr(settings, "SIGNATURE_MAX_PIXELS", 4_000_000)
+SIGNATURE_FORMAT = getattr(settings, "SIGNATURE_FORMAT", "png")
+SIGNATURE_THUMB_SIZE = getattr(settings, "SIGNATURE_THUMB_SIZE", (240, 80))
+
+# magic bytes -> extension; anything else is rejected without decoding
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"RIFF", "webp"),
+)
+
+
+class SignatureError(ValueError):
+    """The upload is not an acceptable signature image (message is user-facing)."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _sniff(head: bytes) -> str:
+    for magic, ext in _SIGNATURES:
+        if head.startswith(magic) and (ext != "webp" or head[8:12] == b"WEBP"):
+            return ext
+    raise SignatureError("Signature must be a PNG, JPEG or WebP image.")
+
+
+def _check_size(size: int):
+    if size > SIGNATURE_MAX_BYTES:
+        raise SignatureError(f"Signature is too large (max {SIGNATURE_MAX_BYTES // 1024} KB).", status=413)
+
+
+def max_request_bytes() -> int:
+    """Largest clock-out body worth parsing: a max-size signature as base64, plus the form fields."""
+    return SIGNATURE_MAX_BYTES * 4 // 3 + 64 * 1024
+
+
+def signature_from_upload(uploaded, filename_prefix: str):
+    """Validate a multipart/binary upload without reading it into memory; returns a file to attach."""
+    _check_size(uploaded.size)
+    uploaded.seek(0)
+    ext = _sniff(uploaded.read(12))
+    uploaded.seek(0)
+    uploaded.name = f"{filename_prefix}.{ext}"
+    return uploaded
+
+
+def signature_from_dataurl(data_url: str, filename_prefix: str) -> ContentFile | None:
+    """
+    Legacy JSON path: 'data:image/png;base64,AAAA...'. The size is checked on
+    the encoded length before anything is decoded. Returns None for an empty value.
+    """
+    if not data_url:
+        return None
+    if not data_url.startswith("data:image") or "," not in data_url:
+        raise SignatureError("Signature must be an image data URL.")
+    header, b64 = data_url.split(",", 1)
+    _check_size(len(b64) * 3 // 4)
+    try:
+        data = base64.b64decode(b64, validate=True)
+    except (binascii.Error, ValueError):
+        raise SignatureError("Signature data is not valid base64.")
+    return ContentFile(data, name=f"{filename_prefix}.{_sniff(data[:12])}")
+
+
+def attach_signature(booking: ShiftBooking, sig_file) -> None:
+    """Store the original (streamed in chunks); call schedule_processing() once the booking is saved."""
+    booking.clock_out_signature.save(sig_file.name, sig_file, save=False)
+    booking.clock_out_signature_thumb = None
+    booking.signature_processed_at = None
+
+
+def schedule_processing(booking: ShiftBooking) -> None:
+    transaction.on_commit(lambda: enqueue(booking.pk))
+
+
+# ---------- Background processing ----------
+_executor = None
+
+
+def enqueue(booking_id: int) -> None:
+    global _executor
+    workers = getattr(settings, "SIGNATURE_WORKERS", 1)
+    if workers <= 0:
+        return  # left for `manage.py process_signatures`
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="signatures")
+    _executor.submit(_run, booking_id)
+
+
+def _run(booking_id: int) -> None:
+    try:
+        process_signature(booking_id)
+    except Exception:
+        logger.exception("Signature processing failed for booking %s", booking_id)
+    finally:
+        close_old_connections()
+
+
+def _encode(img, fmt: str) -> bytes:
+    out = BytesIO()
+    if fmt == "webp":
+        img.save(out, format="WEBP", quality=80, method=6)
+    else:
+        # pen strokes on a plain background: a 16-colour palette keeps them crisp
+        from PIL import Image
+        img.quantize(colors=16, method=Image.Quantize.FASTOCTREE).save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def process_signature(booking_id: int) -> bool:
+    """Re-encode one booking's signature and add its thumbnail. Returns True if it did."""
+    from PIL import Image, ImageOps
+
+    booking = ShiftBooking.all_objects.select_related("organization").filter(pk=booking_id).first()
+    if booking is None or not booking.clock_out_signature or booking.signature_processed_at:
+        return False
+    original = booking.clock_out_signature.name
+
+    with booking.clock_out_signature.open("rb") as fh:
+        img = Image.open(fh)
+        if img.width * img.height > SIGNATURE_MAX_PIXELS:
+            logger.warning("Signature for booking %s is %sx%s px; keeping it unprocessed", booking_id, img.width, img.height)
+            ShiftBooking.all_objects.filter(pk=booking_id, clock_out_signature=original).update(
+                signature_processed_at=timezone.now())
+            return False
+        img = ImageOps.exif_transpose(img).convert("RGBA")
+
+    fmt = "webp" if SIGNATURE_FORMAT == "webp" else "png"
+    stem = os.path.splitext(os.path.basename(original))[0]
+    thumb = img.copy()
+    thumb.thumbnail(SIGNATURE_THUMB_SIZE)
+
+    full_name = booking.clock_out_signature.field.generate_filename(booking, f"{stem}.{fmt}")
+    thumb_name = booking.clock_out_signature_thumb.field.generate_filename(booking, f"{stem}.{fmt}")
+    storage = booking.clock_out_signature.storage
+    new_full = storage.save(full_name, ContentFile(_encode(img, fmt)))
+    new_thumb = storage.save(thumb_name, ContentFile(_encode(thumb, fmt)))
+
+    # only swap in if nobody replaced the signature while we were working
+    updated = ShiftBooking.all_objects.filter(pk=booking_id, clock_out_signature=original).update(
+        clock_out_signature=new_full, clock_out_signature_thumb=new_thumb, signature_processed_at=timezone.now(),
+    )
+    if not updated:
+        storage.delete(new_full)
+        storage.delete(new_thumb)
+        return False
+    if new_full != original:
+        storage.delete(original)
+    return True
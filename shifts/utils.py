@@ -2,9 +2,12 @@
 from __future__ import annotations
 from typing import Iterable
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Q
 from .models import ComplianceDocument, ComplianceDocType
-from .models import AuditLog, AuditAction
+from .models import Shift, ShiftBooking
+from .models import AuditLog, AuditAction, UserRoleCompliance
+from .requirements import DEFAULT_ROLE, get_role_registry, required_type_ids, role_requirements
 from datetime import date
 
 from .models import ComplianceDocType, ComplianceDocument
@@ -26,13 +29,12 @@ ROLE_DOC_RULES = {
     "_DEFAULT": ["Right to Work"],
 }
 
-def required_types_for_role(role: str):
+def required_types_for_role(role: str, org=None):
     """
-    Returns a queryset of ComplianceDocType required for the given role.
-    No DB schema change needed; we match by name.
+    Returns a queryset of ComplianceDocType required for the given role
+    (per-organization rules first, then ROLE_DOC_RULES; see shifts.requirements).
     """
-    names = ROLE_DOC_RULES.get(role) or ROLE_DOC_RULES["_DEFAULT"]
-    return ComplianceDocType.objects.filter(is_active=True, name__in=names)
+    return ComplianceDocType.objects.filter(id__in=required_type_ids(role, org))
 
 
 # ---- 2) Compliance check for a user vs a role ----
@@ -55,20 +57,207 @@ def _has_valid_document(user, doc_type: ComplianceDocType) -> bool:
     return qs.exists()
 
 
-def user_is_compliant_for_role(user, role: str) -> bool:
+def user_is_compliant_for_role(user, role: str, org=None) -> bool:
     """
     True only if the user holds a valid doc for every required type for that role.
+    Requirements come from the compiled registry; the only query is the user's documents.
+    For many users/roles at once use ComplianceMatrix instead.
     """
-    req_types = list(required_types_for_role(role))
-    if not req_types:
-        # If you prefer "no required docs means compliant", keep True.
-        # If you prefer the opposite, return False here.
+    required = required_type_ids(role, org)
+    if not required:
         return True
+    held = ComplianceDocument.objects.filter(user=user, doc_type_id__in=required).filter(_valid_document_q())
+    return required <= set(held.values_list("doc_type_id", flat=True))
 
-    for dt in req_types:
-        if not _has_valid_document(user, dt):
-            return False
-    return True
+
+def _valid_document_q(today: date | None = None) -> Q:
+    # same rule as _has_valid_document: approved, and expiring types need expiry_date >= today
+    today = today or date.today()
+    return Q(status="approved") & (Q(doc_type__requires_expiry=False) | Q(expiry_date__gte=today))
+
+
+# ---- 3) Batched compliance (many users x many roles, constant queries) ----
+class ComplianceMatrix:
+    """
+    Loads every valid document for `users` in one query and keeps, per user, the
+    frozenset of doc type ids they satisfy. (user, role) checks are then a
+    subset test against the compiled requirement registry; no further queries.
+
+        matrix = ComplianceMatrix(users, org=tenant)
+        matrix.is_compliant(user, "Care")
+    """
+
+    def __init__(self, users: Iterable, today: date | None = None, org=None):
+        self.org = org
+        self._role_requirements = {}
+
+        user_ids = [getattr(u, "pk", u) for u in users]
+        valid = (
+            ComplianceDocument.objects
+            .filter(_valid_document_q(today), user_id__in=user_ids, doc_type__is_active=True)
+            .values_list("user_id", "doc_type_id")
+            .distinct()
+        )
+        held = {user_id: set() for user_id in user_ids}
+        for user_id, type_id in valid:
+            held[user_id].add(type_id)
+        self._held = {user_id: frozenset(ids) for user_id, ids in held.items()}
+
+    def required(self, role: str) -> frozenset:
+        required = self._role_requirements.get(role)
+        if required is None:
+            required = self._role_requirements[role] = required_type_ids(role, self.org)
+        return required
+
+    def is_compliant(self, user, role: str) -> bool:
+        return self.required(role) <= self._held.get(getattr(user, "pk", user), frozenset())
+
+
+# ---- 4) Materialized compliance (UserRoleCompliance) ----
+def compliance_roles() -> list[str]:
+    """Roles we keep UserRoleCompliance rows for: shift roles plus any role with explicit rules."""
+    roles = [value for value, _ in Shift.ROLE_CHOICES]
+    roles += [r for r in ROLE_DOC_RULES if r != "_DEFAULT" and r not in roles]
+    return roles
+
+
+def refresh_role_compliance(user_ids: Iterable[int] | None = None, today: date | None = None,
+                            roles: Iterable[str] | None = None) -> int:
+    """
+    Recompute UserRoleCompliance for `user_ids` (all users when None) and
+    `roles` (every compliance role when None), and upsert the rows, using the
+    rules of each user's profile organization. Returns the number of rows written.
+    """
+    today = today or date.today()
+    roles = compliance_roles() if roles is None else [r for r in compliance_roles() if r in set(roles)]
+    if not roles:
+        return 0
+
+    if user_ids is None:
+        user_ids = get_user_model().objects.values_list("pk", flat=True)
+    user_ids = list(user_ids)
+
+    written = 0
+    for i in range(0, len(user_ids), 500):
+        chunk = user_ids[i:i + 500]
+        orgs = dict(get_user_model().objects.filter(pk__in=chunk).values_list("pk", "profile__organization_id"))
+        # user -> {doc type id: last valid day (None = never expires)}
+        held = {uid: {} for uid in chunk}
+        docs = (
+            ComplianceDocument.objects
+            .filter(_valid_document_q(today), user_id__in=chunk, doc_type__is_active=True)
+            .values("user_id", "doc_type_id", "doc_type__requires_expiry")
+            .annotate(until=Max("expiry_date"))
+        )
+        for d in docs:
+            held[d["user_id"]][d["doc_type_id"]] = d["until"] if d["doc_type__requires_expiry"] else None
+
+        rows = []
+        for uid in chunk:
+            org_id = orgs.get(uid)
+            registry = get_role_registry(org_id)  # org_id None -> ROLE_DOC_RULES only
+            for role in roles:
+                required = role_requirements(registry, role)
+                ok = required.issubset(held[uid])
+                untils = [held[uid][t] for t in required if ok and held[uid][t] is not None]
+                rows.append(UserRoleCompliance(
+                    user_id=uid, role=role, organization_id=org_id, is_compliant=ok,
+                    valid_until=min(untils) if untils else None,
+                ))
+        UserRoleCompliance.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=["user", "role"],
+            update_fields=["organization", "is_compliant", "valid_until", "refreshed_at"],
+        )
+        written += len(rows)
+    return written
+
+
+def schedule_compliance_refresh(org_id: int | None = None, roles: Iterable[str] | None = None) -> None:
+    """
+    After commit, refresh_role_compliance for the users of `org_id` (every user
+    when None), limited to `roles` (every role when None). Used when rules or
+    doc types change.
+    """
+    roles = None if roles is None else set(roles)
+
+    def refresh():
+        users = get_user_model().objects.all()
+        if org_id is not None:
+            users = users.filter(profile__organization_id=org_id)
+        refresh_role_compliance(users.values_list("pk", flat=True), roles=roles)
+
+    transaction.on_commit(refresh)
+
+
+def roles_using_doc_type(*names: str) -> set[str] | None:
+    """ROLE_DOC_RULES roles that list any of `names`; None (every role) if the default rule does."""
+    roles = {role for role, required in ROLE_DOC_RULES.items() if set(names) & set(required)}
+    return None if DEFAULT_ROLE in roles else roles
+
+
+class ComplianceTable:
+    """
+    ComplianceMatrix's interface, answered from UserRoleCompliance: one query
+    for every (user, role) of a grid. Rows that are missing, expired, or
+    written under another org's rules are recomputed first in one batch, so a
+    stale table never says yes (as in role_compliance_for). Roles the table
+    doesn't keep fall back to a ComplianceMatrix.
+
+        table = ComplianceTable(users, {s.role for s in shifts}, org=tenant)
+        table.is_compliant(user, "Care")
+    """
+
+    def __init__(self, users: Iterable, roles: Iterable[str], today: date | None = None, org=None):
+        self.org = org
+        self.today = today or date.today()
+        self._user_ids = [getattr(u, "pk", u) for u in users]
+        self._fallback = None
+        self.roles = set(roles) & set(compliance_roles())
+
+        self._ok = self._load(self._user_ids)
+        stale = [uid for uid in self._user_ids if any((uid, role) not in self._ok for role in self.roles)]
+        if stale:
+            refresh_role_compliance(stale, self.today, roles=self.roles)
+            self._ok.update(self._load(stale))
+
+    def _load(self, user_ids) -> dict:
+        if not user_ids or not self.roles:
+            return {}
+        rows = (
+            UserRoleCompliance.objects
+            .filter(user_id__in=user_ids, role__in=self.roles, organization_id=getattr(self.org, "pk", self.org))
+            .filter(Q(valid_until__isnull=True) | Q(valid_until__gte=self.today))
+            .values_list("user_id", "role", "is_compliant")
+        )
+        return {(uid, role): ok for uid, role, ok in rows}
+
+    def is_compliant(self, user, role: str) -> bool:
+        if role in self.roles:
+            return self._ok.get((getattr(user, "pk", user), role), False)
+        if self._fallback is None:
+            self._fallback = ComplianceMatrix(self._user_ids, self.today, org=self.org)
+        return self._fallback.is_compliant(user, role)
+
+
+def role_compliance_for(user, role: str, today: date | None = None) -> bool:
+    """
+    Compliance check backed by UserRoleCompliance (one indexed lookup). Missing,
+    expired, or other-org rows are recomputed on the spot, so a stale table never says yes.
+    """
+    if role not in compliance_roles():
+        return user_is_compliant_for_role(user, role)
+    today = today or date.today()
+    profile = getattr(user, "profile", None)
+    rows = (
+        UserRoleCompliance.objects
+        .filter(user_id=user.pk, role=role, organization_id=getattr(profile, "organization_id", None))
+        .values_list("is_compliant", "valid_until")
+    )
+    row = rows.first()
+    if row is None or (row[1] is not None and row[1] < today):
+        refresh_role_compliance([user.pk], today)
+        row = rows.first()
+    return bool(row and row[0])
 
 
 def log_audit(*, actor=None, subject=None, action:str, shift=None, booking=None, message:str="", **extra):
@@ -81,3 +270,44 @@ def log_audit(*, actor=None, subject=None, action:str, shift=None, booking=None,
         message=message or "",
         extra=extra or {},
     )
+
+
+# ---- 3) Race-free booking (capacity kept in Shift.booked_count) ----
+class ShiftFullError(Exception):
+    pass
+
+
+class AlreadyBookedError(Exception):
+    pass
+
+
+def create_booking(shift: Shift, user) -> ShiftBooking:
+    """
+    Claim a seat and create the booking in one transaction.
+
+    The seat is taken with `UPDATE ... SET booked_count = booked_count + 1
+    WHERE booked_count < max_staff`, so concurrent requests can never
+    oversubscribe a shift; the unique (user, shift) constraint catches
+    double-submits. Any failure rolls the seat back with the transaction.
+    """
+    if ShiftBooking.all_objects.filter(shift=shift, user=user).exists():
+        raise AlreadyBookedError
+
+    with transaction.atomic():
+        claimed = (
+            Shift.all_objects
+            .filter(pk=shift.pk, booked_count__lt=F("max_staff"))
+            .update(booked_count=F("booked_count") + 1)
+        )
+        if not claimed:
+            raise ShiftFullError
+        booking = ShiftBooking(user=user, shift=shift, organization_id=shift.organization_id)
+        booking._seat_claimed = True  # tells the post_save counter not to count it twice
+        try:
+            with transaction.atomic():
+                booking.save()
+        except IntegrityError:
+            raise AlreadyBookedError
+
+    shift.booked_count += 1
+    return booking
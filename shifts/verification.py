@@ -0,0 +1,167 @@
+# shifts/verification.py
+"""
+Punch location rules, and deferred verification of punches.
+
+location_problem() is the single rule the punch views and the background
+verifier share: distance from the site for geofenced shifts, otherwise the
+detected postcode against the shift's allowed_postcode.
+
+With settings.PUNCH_VERIFICATION_DEFERRED on, a punch that would have to wait
+on the remote geocoder is saved at once with its raw coordinates and
+clock_in/out_verification = "pending". `manage.py verify_pending_punches` works
+through pending punches in batches: distinct coordinates are resolved in
+parallel (through the geohash cache, see shifts.geocoding), each punch is
+marked verified or mismatched with a conditional UPDATE, and the outcome is
+written to the AuditLog. Mismatches are listed in the admin punch queue.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .geocoding import resolve_postcode
+from .geofence import punch_distance
+from .models import AuditAction, AuditLog, PunchVerification, ShiftBooking
+
+PUNCHES = ("in", "out")
+
+
+def _norm_pc(s):
+    return "".join(ch for ch in (s or "").upper() if ch.isalnum())
+
+
+def _outward_pc(s):
+    n = _norm_pc(s)
+    return n[:-3] if len(n) > 3 else n
+
+
+def postcode_matches(resolved_pc: str, target_pc: str) -> bool:
+    """Same full postcode, or at least the same outward code (e.g. "SW1A")."""
+    return _norm_pc(resolved_pc) == _norm_pc(target_pc) or _outward_pc(resolved_pc) == _outward_pc(target_pc)
+
+
+def location_problem(shift, lat: float, lng: float, resolved_pc: str | None):
+    """None if the punch satisfies the shift's location rule, else (http status, message)."""
+    dist = punch_distance(shift, lat, lng)
+    if dist is not None:
+        radius = shift.geofence_radius_m
+        if dist > radius:
+            return 403, f"You are {dist:.0f} m from the shift site; punches must be within {radius} m."
+        return None
+
+    target_pc = shift.allowed_postcode or ""
+    if not target_pc:
+        return None
+    if not resolved_pc:
+        return 422, "Could not determine your postcode from location. Please enable precise location (GPS) and try again."
+    if not postcode_matches(resolved_pc, target_pc):
+        return 403, f"Postcode mismatch. Detected: {resolved_pc}; expected: {target_pc}."
+    return None
+
+
+def defers_verification(booking) -> bool:
+    """Punches on postcode-checked shifts skip the remote geocoder when deferral is on."""
+    shift = booking.shift
+    return (
+        getattr(settings, "PUNCH_VERIFICATION_DEFERRED", False)
+        and bool(shift.allowed_postcode) and not shift.has_geofence
+    )
+
+
+def pending_punches():
+    """Bookings with at least one punch waiting for the verifier (all organizations)."""
+    return ShiftBooking.all_objects.filter(
+        Q(clock_in_verification=PunchVerification.PENDING) | Q(clock_out_verification=PunchVerification.PENDING)
+    )
+
+
+def mismatched_punches(org):
+    return ShiftBooking.all_objects.filter(
+        Q(clock_in_verification=PunchVerification.MISMATCHED) | Q(clock_out_verification=PunchVerification.MISMATCHED),
+        organization=org,
+    )
+
+
+def _resolve_all(coords, workers: int) -> dict:
+    coords = list(coords)
+    if not coords:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(coords)))) as pool:
+        return dict(zip(coords, pool.map(lambda c: resolve_postcode(*c), coords)))
+
+
+def verify_pending_punches(limit: int | None = None, workers: int | None = None, now=None, after_id: int = 0) -> dict:
+    """
+    Verify up to `limit` pending bookings with id > after_id. Returns counts:
+      {"checked", "verified", "mismatched", "retry", "last_id"}
+    (last_id is None once there is nothing left; pass it back to walk the queue).
+    A punch whose postcode can't be resolved yet stays pending until it is
+    PUNCH_VERIFICATION_RETRY_HOURS old, then counts as a mismatch.
+    """
+    limit = limit or getattr(settings, "PUNCH_VERIFICATION_BATCH", 200)
+    workers = workers or getattr(settings, "PUNCH_VERIFICATION_WORKERS", 2)
+    now = now or timezone.now()
+    give_up_before = now - timedelta(hours=getattr(settings, "PUNCH_VERIFICATION_RETRY_HOURS", 24))
+
+    bookings = list(pending_punches().filter(id__gt=after_id).select_related("shift").order_by("id")[:limit])
+
+    # one lookup per distinct coordinate pair, in parallel
+    todo = []
+    for b in bookings:
+        for punch in PUNCHES:
+            if getattr(b, f"clock_{punch}_verification") != PunchVerification.PENDING:
+                continue
+            lat, lng = getattr(b, f"clock_{punch}_lat"), getattr(b, f"clock_{punch}_lng")
+            todo.append((b, punch, lat, lng))
+    resolved = _resolve_all(
+        {(lat, lng) for b, punch, lat, lng in todo
+         if lat is not None and lng is not None and not getattr(b, f"clock_{punch}_postcode")},
+        workers,
+    )
+
+    counts = {"checked": 0, "verified": 0, "mismatched": 0, "retry": 0,
+              "last_id": bookings[-1].pk if bookings else None}
+    entries = []
+    with transaction.atomic():
+        for b, punch, lat, lng in todo:
+            counts["checked"] += 1
+            punched_at = getattr(b, f"clock_{punch}_at")
+            pc = getattr(b, f"clock_{punch}_postcode") or resolved.get((lat, lng))
+            if lat is None or lng is None:
+                problem = (400, "No coordinates were recorded.")
+            else:
+                problem = location_problem(b.shift, lat, lng, pc)
+            if problem and problem[0] == 422 and punched_at and punched_at > give_up_before:
+                counts["retry"] += 1
+                continue  # geocoder had no answer (yet); try again next run
+
+            state = PunchVerification.MISMATCHED if problem else PunchVerification.VERIFIED
+            changes = {f"clock_{punch}_verification": state, f"clock_{punch}_postcode": pc or None}
+            if problem:
+                changes["verification_note"] = f"Clock {punch}: {problem[1]}"[:255]
+            # only if the punch is still the one we looked at (not re-punched / overridden meanwhile)
+            updated = (
+                ShiftBooking.all_objects
+                .filter(pk=b.pk, **{f"clock_{punch}_verification": PunchVerification.PENDING, f"clock_{punch}_at": punched_at})
+                .update(**changes)
+            )
+            if not updated:
+                continue
+            counts[state] += 1
+            entries.append(AuditLog(
+                actor=None, subject_id=b.user_id, shift_id=b.shift_id, booking_id=b.pk,
+                action=(AuditAction.PUNCH_MISMATCH if problem
+                        else AuditAction.CLOCK_IN if punch == "in" else AuditAction.CLOCK_OUT),
+                message=(f"Clock {punch} failed verification: {problem[1]}" if problem
+                         else f"Clock {punch} recorded (verified after the punch)."),
+                extra={
+                    "detected_postcode": pc, "lat": lat, "lng": lng,
+                    "punched_at": punched_at.isoformat() if punched_at else None,
+                    "verification": "deferred",
+                },
+            ))
+        AuditLog.objects.bulk_create(entries)
+    return counts
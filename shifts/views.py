@@ -3,16 +3,14 @@ from __future__ import annotations
 
 import base64
 import calendar
-import csv
 import json
 import logging
 import secrets
 import string
 import traceback
 from datetime import date, timedelta, datetime, time
-from io import BytesIO
 
-import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
@@ -20,27 +18,46 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.views import LoginView
 from django.db import transaction, IntegrityError, DatabaseError, connection
-from django.db.models import Count, F, Q
+from django.db.models import F, Q
 from django.db.models.functions import TruncDate
-from django.http import HttpResponse, JsonResponse
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_control, never_cache
 from django.views.decorators.http import require_POST
 from core.tenant import org_context, get_current_org
+from core.request_context import get_request_context
+from core.idempotency import idempotent
+from core.ratelimit import limited, ratelimit
 
 
 from core.org_context import org_context
 
-from .utils import user_is_compliant_for_role
+from .utils import role_compliance_for, ComplianceTable
 
 from .forms import AdminComplianceUploadForm, AdminUserCreateForm, ShiftForm, UserAvailabilityForm, HolidayRequestForm, AdminHolidayResponseForm
 from .models import ComplianceDocType, Shift, ShiftBooking, UserAvailability, HolidayRequest
 from .models import ComplianceDocument
-from .utils import log_audit
-from .models import AuditAction
+from .utils import log_audit, create_booking, AlreadyBookedError, ShiftFullError
+from .geocoding import aresolve_postcode, resolve_postcode
+from .geofence import punch_distance
+from .models import AttendanceStatus, AuditAction, AuditLog, ExportKind, PunchVerification
+from .verification import defers_verification, location_problem, mismatched_punches
+from .attendance import team_punch
+from .exports import (
+    ATTENDANCE_COLUMNS, PAID_COLUMNS, attendance_page_rows, attendance_queryset, attendance_rows,
+    paid_queryset, paid_rows, stream_csv, xlsx_response,
+)
+from .export_jobs import redirect_to_job, request_export, runs_in_background
+from .columnar import parquet_response
+from .facts import GROUPINGS, fact_summary, fact_totals, facts_between, keys_for_bookings, schedule_refresh
+from .signatures import (
+    SignatureError, attach_signature, max_request_bytes, schedule_processing,
+    signature_from_dataurl, signature_from_upload,
+)
 import logging, traceback
 logger = logging.getLogger(__name__)
 
@@ -55,7 +72,8 @@ def is_admin_or_staff(user):
 User = get_user_model()
 
 def _active_tenant(request):
-    return getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    """Active org for this request (host > session > profile), from the request context."""
+    return get_request_context(request).org
 
 # ---------- Admin: create / list shifts ----------
 
@@ -70,13 +88,13 @@ def create_shift(request):
     - Uses atomic transaction so the audit log and shift save are consistent.
     """
     # 1) Preconditions: profile org + tenant present and matching
-    try:
-        user_org = request.user.profile.organization
-    except AttributeError:
+    ctx = get_request_context(request)
+    if ctx.profile is None:
         messages.error(request, "You must belong to an organization to create shifts.")
         return redirect("profile_setup")  # or render the form page; adjust to your flow
+    user_org = ctx.profile_org
 
-    tenant = getattr(request, "tenant", None)
+    tenant = ctx.org
     if tenant is None:
         messages.error(request, "No active workspace detected. Please select an organization.")
         return redirect("home")
@@ -135,44 +153,26 @@ def create_shift(request):
             messages.error(request, "Please fix the errors below.")
     else:
         form = ShiftForm()
-    org_name = getattr(getattr(request.user, 'profile', None), 'organization', None)
-    org_name = getattr(org_name, 'name', "") if org_name else ""
+    org_name = getattr(user_org, 'name', "") if user_org else ""
     return render(request, "create_shift.html", {"form": form, "org_name": org_name})
 
 @user_passes_test(is_admin)
 def list_shifts(request):
     # ---- resolve active tenant/org ----
-    tenant = getattr(request, "tenant", None)
-    if tenant is None:
-        tenant = getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
 
-    # ---- filter for upcoming shifts only ----
-    now = timezone.localtime()
-    today = now.date()
-    current_time = now.time()
-    
-    # upcoming = strictly in future OR later today (not finished)
-    future_q = (
-        Q(date__gt=today) |
-        (Q(date=today) & (
-            Q(end_time__gt=current_time) |
-            Q(end_time__isnull=True, start_time__gt=current_time) |
-            Q(start_time__isnull=True, end_time__isnull=True)
-        ))
-    )
-
-    shifts = (
+    # ---- upcoming shifts only (not finished yet) ----
+    shifts = list(
         Shift.all_objects
-        .filter(future_q, organization=tenant)
-        .annotate(booked_count=Count("bookings"))
+        .upcoming(tenant, timezone.now())
         .order_by("date", "start_time")
     )
     
     # Calculate statistics
-    total_shifts = shifts.count()
+    total_shifts = len(shifts)
     available_shifts = sum(1 for shift in shifts if shift.booked_count < shift.max_staff)
     full_shifts = sum(1 for shift in shifts if shift.booked_count >= shift.max_staff)
     
@@ -189,29 +189,11 @@ def list_shifts(request):
 @login_required
 def available_shifts(request):
     # ---- resolve active tenant/org ----
-    tenant = getattr(request, "tenant", None)
-    if tenant is None:
-        tenant = getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
 
-    now = timezone.localtime()
-    today = now.date()
-    current_time = now.time()
-
-    # upcoming: future dates, or later today if not finished
-    future_q = (
-        Q(date__gt=today) |
-        (
-            Q(date=today) & (
-                Q(end_time__gt=current_time) |
-                Q(end_time__isnull=True, start_time__gt=current_time) |
-                Q(start_time__isnull=True, end_time__isnull=True)
-            )
-        )
-    )
-
     # shifts the user has already booked (org-scoped explicitly)
     booked_shift_ids = (
         ShiftBooking.all_objects
@@ -222,10 +204,9 @@ def available_shifts(request):
     # available shifts = org-scoped upcoming, not already booked, not full
     shifts = (
         Shift.all_objects
-        .filter(future_q, organization=tenant)
+        .upcoming(tenant, timezone.now())
         .exclude(id__in=booked_shift_ids)
-        .annotate(booked_total=Count("bookings", distinct=True))
-        .filter(booked_total__lt=F("max_staff"))
+        .filter(booked_count__lt=F("max_staff"))
         .order_by("date", "start_time")
     )
 
@@ -233,20 +214,20 @@ def available_shifts(request):
 
 
 @login_required
+@idempotent
 def book_shift(request, shift_id):
     shift = get_object_or_404(Shift, id=shift_id)
 
-    # already full?
-    if not shift.has_space:
-        messages.warning(request, f"'{shift.title}' is already full.")
-        return redirect("available_shifts")
-
-    # already booked?
-    if ShiftBooking.objects.filter(user=request.user, shift=shift).exists():
+    # seat claim + insert happen atomically (no check-then-insert race)
+    try:
+        booking = create_booking(shift, request.user)
+    except AlreadyBookedError:
         messages.info(request, f"You have already booked '{shift.title}'.")
         return redirect("available_shifts")
+    except ShiftFullError:
+        messages.warning(request, f"'{shift.title}' is already full.")
+        return redirect("available_shifts")
 
-    booking = ShiftBooking.objects.create(user=request.user, shift=shift, organization=shift.organization)
     messages.success(request, f"You have successfully booked '{shift.title}'.")
     
     # For Audit log
@@ -259,26 +240,15 @@ def book_shift(request, shift_id):
 
 @login_required
 def my_bookings(request):
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
 
     now = timezone.localtime()
-    today = now.date()
-    current_time = now.time()
-
-    # upcoming: strictly future OR later today (not finished)
-    future_q = (
-        Q(shift__date__gt=today) |
-        (
-            Q(shift__date=today) & (
-                Q(shift__end_time__gt=current_time) |
-                Q(shift__end_time__isnull=True, shift__start_time__gt=current_time) |
-                Q(shift__start_time__isnull=True, shift__end_time__isnull=True)
-            )
-        )
-    )
+
+    # upcoming: shift not finished yet
+    future_q = Q(shift__end_at__gt=now)
 
     # in-progress or needs action: clocked in but not clocked out
     needs_clock_out_q = Q(clock_in_at__isnull=False, clock_out_at__isnull=True)
@@ -322,7 +292,7 @@ def my_bookings(request):
 def completed_shifts(request):
     """User tab: completed but not yet paid."""
     # Use the same tenant resolution as my_bookings
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -344,7 +314,7 @@ def completed_shifts(request):
 @login_required
 def past_shifts(request):
     """User tab: completed and paid (historical)."""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -371,7 +341,7 @@ def cancel_booking(request, booking_id):
     booking = get_object_or_404(ShiftBooking.all_objects, id=booking_id, user=request.user)
     
     # Verify the booking belongs to the user's organization
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant and booking.organization_id != getattr(tenant, "id", None):
         messages.error(request, "Booking not found or access denied.")
         return redirect("my_bookings")
@@ -403,7 +373,7 @@ def my_calendar(request):
     import calendar
     from .models import UserAvailability, HolidayRequest
     
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -558,16 +528,11 @@ class NoCacheLoginView(LoginView):
 
     def get_success_url(self):
         # Check if we're on the Delaala domain and user is not authorized
-        host = self.request.get_host().split(":")[0]
-        if host == getattr(settings, 'DELAALA_DOMAIN', '') and not self.request.user.is_superuser:
-            from core.org_utils import user_org_name
-            org = (user_org_name(self.request.user) or "").strip().lower()
-            delaala_org = getattr(settings, 'DELAALA_ORG_NAME', '').lower()
-            
-            if org != delaala_org:
-                from django.contrib.auth import logout
-                logout(self.request)
-                return reverse("login") + "?error=not_authorized"
+        # (context is rebuilt for the freshly logged-in user)
+        if get_request_context(self.request).domain_locked_out:
+            from django.contrib.auth import logout
+            logout(self.request)
+            return reverse("login") + "?error=not_authorized"
         
         return reverse("account_profile")
 
@@ -590,227 +555,498 @@ def home(request):
 
 # ---------- Location & postcode helpers ----------
 def _parse_coords_from_json(request):
-    """Expecting JSON body: { 'lat': <float>, 'lng': <float> }"""
+    """Expecting JSON body (or multipart form fields): { 'lat': <float>, 'lng': <float> }"""
     try:
-        data = json.loads(request.body.decode("utf-8"))
+        data = _parse_json(request)
         return float(data["lat"]), float(data["lng"])
     except Exception:
         return None
 
-def _resolve_postcode(lat: float, lng: float) -> str | None:
-    """Reverse-geocode with OpenStreetMap Nominatim to get a postcode."""
-    try:
-        resp = requests.get(
-            "https://nominatim.openstreetmap.org/reverse",
-            params={"format": "jsonv2", "lat": lat, "lon": lng, "zoom": 18, "addressdetails": 1},
-            headers={"User-Agent": "ScheduloApp/1.0 (contact: admin@example.com)"},
-            timeout=6,
-        )
-        if resp.status_code != 200:
-            return None
-        js = resp.json()
-        addr = js.get("address") or {}
-        return addr.get("postcode") or addr.get("postal_code") or addr.get("ISO3166-2-lvl4")
-    except Exception:
-        return None
+def _resolve_postcode(lat: float, lng: float, local_only: bool = False) -> str | None:
+    """Reverse-geocode to a postcode (offline index first, then Nominatim unless local_only)."""
+    return resolve_postcode(lat, lng, local_only=local_only)
 
 def _clock_json(ok: bool, msg: str, status: int = 200):
     return JsonResponse({"ok": ok, "msg": msg}, status=status)
 
 def _parse_json(request):
+    # multipart clock-outs carry the signature as a file part; never touch request.body for those
+    if request.content_type == "multipart/form-data":
+        return request.POST.dict()
     try:
         return json.loads(request.body.decode("utf-8"))
     except Exception:
         return {}
 
-def _save_signature_from_dataurl(data_url: str, filename_prefix: str = "signature"):
-    """
-    Accepts 'data:image/png;base64,AAAA...' and returns a ContentFile.
-    """
-    if not data_url or not data_url.startswith("data:image"):
-        return None
-    try:
-        header, b64 = data_url.split(",", 1)
-        ext = "png"
-        if "image/jpeg" in header:
-            ext = "jpg"
-        data = base64.b64decode(b64)
-        from django.core.files.base import ContentFile
-
-        return ContentFile(data, name=f"{filename_prefix}.{ext}")
-    except Exception:
-        return None
+def _signature_from_request(request, payload, booking):
+    """Multipart `signature` file if present, else the legacy `signature_data_url` field (or None)."""
+    prefix = f"booking_{booking.id}_clockout"
+    uploaded = request.FILES.get("signature") if request.content_type == "multipart/form-data" else None
+    if uploaded is not None:
+        return signature_from_upload(uploaded, prefix)
+    return signature_from_dataurl(payload.get("signature_data_url") or "", prefix)
 
 # ---------- Clock in / out ----------
-@require_POST
-@login_required
-def clock_in(request, booking_id):
+# Each punch is split into a sync "precheck" (load + authorise + time window),
+# the geocode, and a sync "commit" (postcode rule + persist + audit). The WSGI
+# views run all three inline; the async views (served under ASGI) await the
+# geocode without blocking and hop to a thread only for the ORM phases.
+def _needs_remote_geocode(booking):
+    # geofenced shifts are checked by distance; the postcode is only recorded
+    # if the offline index can supply it for free. Deferred punches are
+    # resolved later by the verifier (shifts/verification.py).
+    return bool(booking.shift.allowed_postcode) and not booking.shift.has_geofence and not defers_verification(booking)
+
+def _location_error(booking, lat, lng, resolved_pc):
+    """Distance check when the site is geocoded, otherwise the postcode rule."""
+    problem = location_problem(booking.shift, lat, lng, resolved_pc)
+    if problem:
+        status, msg = problem
+        return _clock_json(False, msg, status=status)
+    return None
+
+def _deferred(booking, resolved_pc):
+    # the offline index answered: nothing to defer, check it now
+    return defers_verification(booking) and not resolved_pc
+
+def _load_punch_booking(request, booking_id):
+    # Use all_objects to bypass tenant filtering, then manually check tenant
+    booking = get_object_or_404(ShiftBooking.all_objects.select_related("shift"), id=booking_id, user=request.user)
+
+    # Verify the booking belongs to the user's organization
+    tenant = _active_tenant(request)
+    if tenant and booking.organization_id != getattr(tenant, "id", None):
+        return None, _clock_json(False, "Booking not found or access denied.", status=404)
+    return booking, None
+
+def _shift_window(shift):
+    tz = timezone.get_current_timezone()
+    return (datetime.combine(shift.date, shift.start_time or time.min, tzinfo=tz),
+            datetime.combine(shift.date, shift.end_time or time.max, tzinfo=tz))
+
+def _clock_in_allowed(booking, now):
+    # If your existing guard rejects, allow within 30-minute grace after start
+    if booking.can_clock_in(now=now):
+        return True
+    sd, ed = _shift_window(booking.shift)
+    return sd <= now <= min(sd + timedelta(minutes=30), ed)
+
+def _clock_out_allowed(booking, now):
+    # Still allow if we're inside the shift window
+    if booking.can_clock_out(now=now):
+        return True
+    sd, ed = _shift_window(booking.shift)
+    return sd <= now <= ed
+
+def _backfill_clock_in(booking, now):
+    # If they never clocked in and we're past the 30-min grace, backfill a sensible "in" time
+    if booking.clock_in_at is None:
+        sd, _ = _shift_window(booking.shift)
+        grace_deadline = sd + timedelta(minutes=30)
+        # Use the grace deadline, capped at 'now' just in case
+        booking.clock_in_at = min(grace_deadline, now)
+        # Optional: annotate that this was an auto backfill
+        booking.clock_out_note = (booking.clock_out_note or "")
+        booking.clock_out_note += (("\n" if booking.clock_out_note else "") + "[System] Auto-set clock-in at start+30m due to late clock-in.")
+
+def _clock_in_precheck(request, booking_id):
+    """Returns (booking, (lat, lng), error_response)."""
+    booking, err = _load_punch_booking(request, booking_id)
+    if err:
+        return None, None, err
+
+    now = timezone.localtime()
+
+    if not _clock_in_allowed(booking, now):
+        return booking, None, _clock_json(False, "Clock-in not allowed at this time.", status=400)
+
+    coords = _parse_coords_from_json(request)
+    if not coords:
+        return booking, None, _clock_json(False, "Missing or invalid coordinates.", status=400)
+    return booking, coords, None
+
+def _clock_in_commit(request, booking, lat, lng, resolved_pc):
+    deferred = _deferred(booking, resolved_pc)
+    if not deferred:
+        err = _location_error(booking, lat, lng, resolved_pc)
+        if err:
+            return err
+
+    # ✅ actually persist the clock-in
+    if not booking.clock_in_at:
+        booking.clock_in_at = timezone.now()
+        booking.clock_in_lat = lat
+        booking.clock_in_lng = lng
+        booking.clock_in_postcode = resolved_pc or None
+        booking.clock_in_verification = PunchVerification.PENDING if deferred else PunchVerification.INLINE
+        booking.save(update_fields=["clock_in_at", "clock_in_lat", "clock_in_lng", "clock_in_postcode",
+                                    "clock_in_verification"])
+
+    if deferred:
+        # the verifier audits the punch once its location is checked
+        messages.success(request, "Clock-in recorded.")
+        return _clock_json(True, "Clock-in successful.")
+
+    log_audit(actor=request.user, subject=request.user, action=AuditAction.CLOCK_IN,
+              shift=booking.shift, booking=booking,
+              message="Clock in recorded.",
+              detected_postcode=resolved_pc, lat=lat, lng=lng,
+              distance_m=punch_distance(booking.shift, lat, lng))
+
+    messages.success(request, "Clock-in recorded.")
+    return _clock_json(True, "Clock-in successful.")
+
+def _clock_out_precheck(request, booking_id):
+    """Returns (booking, payload, (lat, lng), error_response)."""
+    booking, err = _load_punch_booking(request, booking_id)
+    if err:
+        return None, None, None, err
+
+    now = timezone.localtime()
+
+    if not _clock_out_allowed(booking, now):
+        return booking, None, None, _clock_json(False, "Clock-out not allowed right now.", status=400)
+
+    _backfill_clock_in(booking, now)
+
+    # refuse oversized bodies before Django parses/spools them
+    if int(request.META.get("CONTENT_LENGTH") or 0) > max_request_bytes():
+        return booking, None, None, _clock_json(False, "Request too large.", status=413)
+
+    payload = _parse_json(request)
+
+    coords = _parse_coords_from_json(request)
+    if not coords:
+        return booking, payload, None, _clock_json(False, "Missing or invalid coordinates.", status=400)
+    return booking, payload, coords, None
+
+def _clock_out_commit(request, booking, payload, lat, lng, resolved_pc):
+    deferred = _deferred(booking, resolved_pc)
+    if not deferred:
+        err = _location_error(booking, lat, lng, resolved_pc)
+        if err:
+            return err
+
+    if booking.clock_out_at:
+        return _clock_json(True, "Already clocked out.")
+
+    # Optional extras
+    note = (payload.get("note") or "").strip()
+    supervisor_name = (payload.get("supervisor_name") or "").strip()
     try:
-        # Use all_objects to bypass tenant filtering, then manually check tenant
-        booking = get_object_or_404(ShiftBooking.all_objects, id=booking_id, user=request.user)
-        
-        # Verify the booking belongs to the user's organization
-        tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
-        if tenant and booking.organization_id != getattr(tenant, "id", None):
-            return _clock_json(False, "Booking not found or access denied.", status=404)
-        
-        now = timezone.localtime()
-
-        # If your existing guard rejects, allow within 30-minute grace after start
-        if not booking.can_clock_in(now=now):
-            sh = booking.shift
-            sd = datetime.combine(sh.date, sh.start_time or time.min, tzinfo=timezone.get_current_timezone())
-            ed = datetime.combine(sh.date, sh.end_time or time.max, tzinfo=timezone.get_current_timezone())
-            from datetime import timedelta
-            if not (sd <= now <= min(sd + timedelta(minutes=30), ed)):
-                return _clock_json(False, "Clock-in not allowed at this time.", status=400)
-
-        coords = _parse_coords_from_json(request)
-        if not coords:
-            return _clock_json(False, "Missing or invalid coordinates.", status=400)
-        lat, lng = coords
+        sig_file = _signature_from_request(request, payload, booking)
+    except SignatureError as e:
+        return _clock_json(False, str(e), status=e.status)
+
+    booking.clock_out_at = timezone.now()
+    booking.clock_out_lat = lat
+    booking.clock_out_lng = lng
+    booking.clock_out_postcode = resolved_pc or None
+    booking.clock_out_verification = PunchVerification.PENDING if deferred else PunchVerification.INLINE
+    booking.clock_out_note = note
+    booking.clock_out_supervisor_name = supervisor_name
 
-        resolved_pc = _resolve_postcode(lat, lng)  # may be None
-        target_pc_raw = booking.shift.allowed_postcode or ""
+    if sig_file:
+        attach_signature(booking, sig_file)  # recompressed + thumbnailed in the background
 
-        if target_pc_raw:
-            if not resolved_pc:
-                return _clock_json(False, "Could not determine your postcode from location. Please enable precise location (GPS) and try again.", status=422)
+    booking.save()
+    if sig_file:
+        schedule_processing(booking)
 
-            def _norm(s): return "".join(ch for ch in (s or "").upper() if ch.isalnum())
-            def _outward(s):
-                n = _norm(s); return n[:-3] if len(n) > 3 else n
+    if deferred:
+        messages.success(request, "Clock-out recorded.")
+        return _clock_json(True, "Clock-out successful.")
 
-            if not (_norm(resolved_pc) == _norm(target_pc_raw) or _outward(resolved_pc) == _outward(target_pc_raw)):
-                return _clock_json(False, f"Postcode mismatch. Detected: {resolved_pc}; expected: {target_pc_raw}.", status=403)
+    # For Audit log
+    log_audit(actor=request.user, subject=request.user, action=AuditAction.CLOCK_OUT,
+          shift=booking.shift, booking=booking,
+          message="Clock out recorded.",
+          detected_postcode=resolved_pc, note=note, supervisor=supervisor_name, lat=lat, lng=lng,
+          distance_m=punch_distance(booking.shift, lat, lng))
 
-        # ✅ actually persist the clock-in
-        if not booking.clock_in_at:
-            booking.clock_in_at = timezone.now()
-            booking.clock_in_lat = lat
-            booking.clock_in_lng = lng
-            booking.clock_in_postcode = resolved_pc or None
-            booking.save(update_fields=["clock_in_at", "clock_in_lat", "clock_in_lng", "clock_in_postcode"])
+    messages.success(request, "Clock-out recorded.")
+    return _clock_json(True, "Clock-out successful.")
 
-        log_audit(actor=request.user, subject=request.user, action=AuditAction.CLOCK_IN,
-                  shift=booking.shift, booking=booking,
-                  message="Clock in recorded.",
-                  detected_postcode=resolved_pc, lat=lat, lng=lng)
+@require_POST
+@login_required
+@ratelimit("punch")
+@idempotent
+def clock_in(request, booking_id):
+    try:
+        booking, coords, err = _clock_in_precheck(request, booking_id)
+        if err:
+            return err
+        lat, lng = coords
+        resolved_pc = _resolve_postcode(lat, lng, local_only=not _needs_remote_geocode(booking))  # may be None
+        return _clock_in_commit(request, booking, lat, lng, resolved_pc)
 
-        messages.success(request, "Clock-in recorded.")
-        return _clock_json(True, "Clock-in successful.")
-        
     except Exception as e:
         # Log the error for debugging
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f"Clock-in error for booking {booking_id}: {str(e)}", exc_info=True)
         return _clock_json(False, "An error occurred during clock-in. Please try again.", status=500)
 
 @require_POST
 @login_required
+@ratelimit("punch")
+@idempotent
 def clock_out(request, booking_id):
     try:
-        # Use all_objects to bypass tenant filtering, then manually check tenant
-        booking = get_object_or_404(ShiftBooking.all_objects, id=booking_id, user=request.user)
-        
-        # Verify the booking belongs to the user's organization
-        tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
-        if tenant and booking.organization_id != getattr(tenant, "id", None):
-            return _clock_json(False, "Booking not found or access denied.", status=404)
-        
-        now = timezone.localtime()
-
-        if not booking.can_clock_out(now=now):
-            # Still allow if we're inside the shift window
-            sh = booking.shift
-            sd = datetime.combine(sh.date, sh.start_time or time.min, tzinfo=timezone.get_current_timezone())
-            ed = datetime.combine(sh.date, sh.end_time or time.max, tzinfo=timezone.get_current_timezone())
-            if not (sd <= now <= ed):
-                return _clock_json(False, "Clock-out not allowed right now.", status=400)
-
-            # If they never clocked in and we're past the 30-min grace, backfill a sensible "in" time
-        if booking.clock_in_at is None:
-            from datetime import timedelta
-            sd = datetime.combine(booking.shift.date, booking.shift.start_time or time.min, tzinfo=timezone.get_current_timezone())
-            grace_deadline = sd + timedelta(minutes=30)
-            # Use the grace deadline, capped at 'now' just in case
-            booking.clock_in_at = min(grace_deadline, now)
-            # Optional: annotate that this was an auto backfill
-            booking.clock_out_note = (booking.clock_out_note or "")
-            booking.clock_out_note += (("\n" if booking.clock_out_note else "") + "[System] Auto-set clock-in at start+30m due to late clock-in.")
-
-        payload = _parse_json(request)
-
-        coords = _parse_coords_from_json(request)
-        if not coords:
-            return _clock_json(False, "Missing or invalid coordinates.", status=400)
+        booking, payload, coords, err = _clock_out_precheck(request, booking_id)
+        if err:
+            return err
         lat, lng = coords
+        resolved_pc = _resolve_postcode(lat, lng, local_only=not _needs_remote_geocode(booking))
+        return _clock_out_commit(request, booking, payload, lat, lng, resolved_pc)
 
-        resolved_pc = _resolve_postcode(lat, lng)
-        target_pc_raw = booking.shift.allowed_postcode or ""
+    except Exception as e:
+        # Log the error for debugging
+        logger.error(f"Clock-out error for booking {booking_id}: {str(e)}", exc_info=True)
+        return _clock_json(False, "An error occurred during clock-out. Please try again.", status=500)
 
-        if target_pc_raw:
-            if not resolved_pc:
-                return _clock_json(
-                    False,
-                    "Could not determine your postcode from location. Please enable precise location (GPS) and try again.",
-                    status=422,
-                )
+# Async punch views (routed when PUNCH_VIEWS_ASYNC is on; see Schedulo_app/urls.py).
+# Tenant ContextVars set by the middlewares are copied into every
+# sync_to_async hop, so TenantManager scoping keeps working across awaits.
+@require_POST
+@login_required
+@ratelimit("punch")
+@idempotent
+async def clock_in_async(request, booking_id):
+    try:
+        await request.auser()
+        booking, coords, err = await sync_to_async(_clock_in_precheck)(request, booking_id)
+        if err:
+            return err
+        lat, lng = coords
+        resolved_pc = await aresolve_postcode(lat, lng, local_only=not _needs_remote_geocode(booking))  # may be None
+        return await sync_to_async(_clock_in_commit)(request, booking, lat, lng, resolved_pc)
 
-            def _norm(s): return "".join(ch for ch in (s or "").upper() if ch.isalnum())
-            def _outward(s):
-                n = _norm(s)
-                return n[:-3] if len(n) > 3 else n
+    except Exception as e:
+        logger.error(f"Clock-in error for booking {booking_id}: {str(e)}", exc_info=True)
+        return _clock_json(False, "An error occurred during clock-in. Please try again.", status=500)
 
-            if not (_norm(resolved_pc) == _norm(target_pc_raw) or _outward(resolved_pc) == _outward(target_pc_raw)):
-                return _clock_json(
-                    False, f"Postcode mismatch. Detected: {resolved_pc}; expected: {target_pc_raw}.", status=403
-                )
+@require_POST
+@login_required
+@ratelimit("punch")
+@idempotent
+async def clock_out_async(request, booking_id):
+    try:
+        await request.auser()
+        booking, payload, coords, err = await sync_to_async(_clock_out_precheck)(request, booking_id)
+        if err:
+            return err
+        lat, lng = coords
+        resolved_pc = await aresolve_postcode(lat, lng, local_only=not _needs_remote_geocode(booking))
+        return await sync_to_async(_clock_out_commit)(request, booking, payload, lat, lng, resolved_pc)
 
-        if booking.clock_out_at:
-            return _clock_json(True, "Already clocked out.")
+    except Exception as e:
+        logger.error(f"Clock-out error for booking {booking_id}: {str(e)}", exc_info=True)
+        return _clock_json(False, "An error occurred during clock-out. Please try again.", status=500)
 
-        # Optional extras
-        note = (payload.get("note") or "").strip()
-        supervisor_name = (payload.get("supervisor_name") or "").strip()
-        sig_data_url = payload.get("signature_data_url") or ""
+# ---------- Offline punch sync ----------
+# A phone that punched without signal queues the punches and posts them here in
+# one request: {"punches": [{"id", "booking", "kind": "in"|"out", "at": ISO 8601
+# device time, "lat", "lng", "note"?, "supervisor_name"?, "signature"?}]}.
+# As multipart, "punches" is a JSON string and "signature" names a file part;
+# in JSON, "signature_data_url" works as in clock_out.
+# Every item is checked with the live views' rules evaluated at the device time
+# (accepted up to PUNCH_SYNC_MAX_SKEW_SECONDS ahead of the server clock and
+# PUNCH_SYNC_MAX_AGE_HOURS behind it). Postcodes are resolved before any row is
+# locked; everything that passes is written in one transaction.
+def _device_time(value):
+    dt = parse_datetime(value) if isinstance(value, str) else None
+    if dt is None:
+        return None
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, timezone.get_current_timezone())
+    return timezone.localtime(dt)
 
-        booking.clock_out_at = timezone.now()
-        booking.clock_out_lat = lat
-        booking.clock_out_lng = lng
-        booking.clock_out_postcode = resolved_pc or None
-        booking.clock_out_note = note
-        booking.clock_out_supervisor_name = supervisor_name
+def _sync_coords(item):
+    try:
+        return float(item["lat"]), float(item["lng"])
+    except (KeyError, TypeError, ValueError):
+        return None
 
-        sig_file = _save_signature_from_dataurl(sig_data_url, filename_prefix=f"booking_{booking.id}_clockout")
-        if sig_file:
-            booking.clock_out_signature.save(sig_file.name, sig_file, save=False)
+def _sync_result(item, ok, status, msg, **extra):
+    return {"id": item.get("id"), "booking": item.get("booking"), "kind": item.get("kind"),
+            "ok": ok, "status": status, "msg": msg, **extra}
 
-        booking.save()
-        
-        # For Audit log
-        log_audit(actor=request.user, subject=request.user, action=AuditAction.CLOCK_OUT,
-              shift=booking.shift, booking=booking,
-              message="Clock out recorded.",
-              detected_postcode=resolved_pc, note=note, supervisor=supervisor_name, lat=lat, lng=lng)
+def _apply_synced_punch(request, booking, item, at, lat, lng, resolved_pc, received_at):
+    """
+    Validate one queued punch and apply it to `booking` in memory.
+    Returns (result, audit entry or None, signature file or None).
+    """
+    kind = item["kind"]
+    if (kind, booking.attendance_status) in (("in", AttendanceStatus.NO_SHOW), ("out", AttendanceStatus.AUTO_CLOSED)):
+        # a real punch that was queued offline replaces what close_overdue_bookings filled in
+        before = (booking.clock_out_at, booking.clock_out_note, booking.attendance_status)
+        if kind == "out":
+            booking.clock_out_at = None
+        booking.attendance_status = AttendanceStatus.OPEN
+        outcome = _apply_synced_punch(request, booking, item, at, lat, lng, resolved_pc, received_at)
+        if not outcome[0]["ok"]:
+            booking.clock_out_at, booking.clock_out_note, booking.attendance_status = before
+        return outcome
+
+    punched_at = getattr(booking, f"clock_{kind}_at")
+    if punched_at:
+        if abs((punched_at - at).total_seconds()) < 1:
+            return _sync_result(item, True, "duplicate", "Already recorded."), None, None
+        return _sync_result(item, False, "rejected", f"Already clocked {kind}."), None, None
+
+    allowed = _clock_in_allowed(booking, at) if kind == "in" else _clock_out_allowed(booking, at)
+    if not allowed:
+        return _sync_result(item, False, "rejected", f"Clock-{kind} not allowed at this time."), None, None
+    if kind == "out" and booking.clock_in_at and at < booking.clock_in_at:
+        return _sync_result(item, False, "rejected", "Clock-out is before clock-in."), None, None
+
+    deferred = _deferred(booking, resolved_pc)
+    if not deferred:
+        problem = location_problem(booking.shift, lat, lng, resolved_pc)
+        if problem:
+            return _sync_result(item, False, "rejected", problem[1]), None, None
+
+    sig_file = None
+    if kind == "out":
+        prefix = f"booking_{booking.id}_clockout"
+        try:
+            ref = item.get("signature")
+            uploaded = request.FILES.get(ref) if ref and request.content_type == "multipart/form-data" else None
+            if uploaded is not None:
+                sig_file = signature_from_upload(uploaded, prefix)
+            else:
+                sig_file = signature_from_dataurl(item.get("signature_data_url") or "", prefix)
+        except SignatureError as e:
+            return _sync_result(item, False, "rejected", str(e)), None, None
+        _backfill_clock_in(booking, at)
+        booking.clock_out_note = (item.get("note") or "").strip()
+        booking.clock_out_supervisor_name = (item.get("supervisor_name") or "").strip()
+
+    state = PunchVerification.PENDING if deferred else PunchVerification.INLINE
+    setattr(booking, f"clock_{kind}_at", at)
+    setattr(booking, f"clock_{kind}_lat", lat)
+    setattr(booking, f"clock_{kind}_lng", lng)
+    setattr(booking, f"clock_{kind}_postcode", resolved_pc or None)
+    setattr(booking, f"clock_{kind}_verification", state)
+
+    entry = None
+    if not deferred:  # deferred punches are audited by the verifier
+        entry = AuditLog(
+            actor=request.user, subject=request.user,
+            action=AuditAction.CLOCK_IN if kind == "in" else AuditAction.CLOCK_OUT,
+            shift=booking.shift, booking=booking,
+            message=f"Clock {kind} recorded (offline sync).",
+            extra={
+                "detected_postcode": resolved_pc, "lat": lat, "lng": lng,
+                "distance_m": punch_distance(booking.shift, lat, lng),
+                "device_at": at.isoformat(), "received_at": received_at.isoformat(),
+            },
+        )
+    return _sync_result(item, True, "applied", f"Clock-{kind} recorded.", verification=state), entry, sig_file
 
-        messages.success(request, "Clock-out recorded.")
-        return _clock_json(True, "Clock-out successful.")
-        
-    except Exception as e:
-        # Log the error for debugging
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Clock-out error for booking {booking_id}: {str(e)}", exc_info=True)
-        return _clock_json(False, "An error occurred during clock-out. Please try again.", status=500)
+_SYNC_FIELDS = [
+    "clock_in_at", "clock_in_lat", "clock_in_lng", "clock_in_postcode", "clock_in_verification",
+    "clock_out_at", "clock_out_lat", "clock_out_lng", "clock_out_postcode", "clock_out_verification",
+    "clock_out_note", "clock_out_supervisor_name",
+    "clock_out_signature", "clock_out_signature_thumb", "signature_processed_at", "attendance_status",
+]
+
+@require_POST
+@login_required
+@idempotent
+def sync_punches(request):
+    data = _parse_json(request)
+    items = data.get("punches") if isinstance(data, dict) else None
+    if isinstance(items, str):  # multipart: JSON in a form field
+        try:
+            items = json.loads(items)
+        except ValueError:
+            items = None
+    if not isinstance(items, list) or not items or not all(isinstance(i, dict) for i in items):
+        return _clock_json(False, "Expected a non-empty \"punches\" list.", status=400)
+    if len(items) > getattr(settings, "PUNCH_SYNC_MAX_ITEMS", 10):
+        return _clock_json(False, "Too many punches in one batch.", status=413)
+    # same "punch" buckets as clock_in/clock_out, one token per item
+    throttled = limited("punch", request, cost=len(items))
+    if throttled:
+        return throttled
+
+    tenant = _active_tenant(request)
+    received_at = timezone.localtime()
+    newest = received_at + timedelta(seconds=getattr(settings, "PUNCH_SYNC_MAX_SKEW_SECONDS", 300))
+    oldest = received_at - timedelta(hours=getattr(settings, "PUNCH_SYNC_MAX_AGE_HOURS", 72))
+
+    results = [None] * len(items)
+    todo = []  # (index, booking_id, device time, lat, lng)
+    for i, item in enumerate(items):
+        at = _device_time(item.get("at"))
+        coords = _sync_coords(item)
+        if item.get("kind") not in ("in", "out"):
+            results[i] = _sync_result(item, False, "rejected", "kind must be \"in\" or \"out\".")
+        elif at is None:
+            results[i] = _sync_result(item, False, "rejected", "Invalid device timestamp.")
+        elif at > newest:
+            results[i] = _sync_result(item, False, "rejected", "Device clock is ahead of the server.")
+        elif at < oldest:
+            results[i] = _sync_result(item, False, "rejected", "Punch is too old to sync.")
+        elif not coords:
+            results[i] = _sync_result(item, False, "rejected", "Missing or invalid coordinates.")
+        else:
+            try:
+                b_id = int(item.get("booking"))
+            except (TypeError, ValueError):
+                b_id = None
+            todo.append((i, b_id, at, *coords))
+
+    bookings = ShiftBooking.all_objects.select_related("shift").filter(user=request.user)
+    if tenant:
+        bookings = bookings.filter(organization=tenant)
+    ids = {b_id for _, b_id, *_ in todo if b_id is not None}
+
+    # geocode outside the transaction: no row locks held while waiting on a resolver
+    resolved = {}
+    for b in bookings.filter(id__in=ids):
+        remote = _needs_remote_geocode(b)
+        for _, b_id, _, lat, lng in todo:
+            if b_id == b.id and (lat, lng, remote) not in resolved:
+                resolved[(lat, lng, remote)] = _resolve_postcode(lat, lng, local_only=not remote)
+
+    entries, signed = [], []
+    with transaction.atomic():
+        locked = {b.id: b for b in bookings.select_for_update(of=("self",)).filter(id__in=ids)}
+        dirty = {}
+        # device order, so an "in" and its "out" from the same queue apply in sequence
+        for i, b_id, at, lat, lng in sorted(todo, key=lambda t: t[2]):
+            booking = locked.get(b_id)
+            if booking is None:
+                results[i] = _sync_result(items[i], False, "rejected", "Booking not found or access denied.")
+                continue
+            pc = resolved.get((lat, lng, _needs_remote_geocode(booking)))
+            result, entry, sig_file = _apply_synced_punch(request, booking, items[i], at, lat, lng, pc, received_at)
+            results[i] = result
+            if result["status"] != "applied":
+                continue
+            dirty[booking.id] = booking
+            if entry:
+                entries.append(entry)
+            if sig_file:
+                attach_signature(booking, sig_file)
+                signed.append(booking)
+        if dirty:
+            ShiftBooking.all_objects.bulk_update(list(dirty.values()), _SYNC_FIELDS)
+            schedule_refresh(keys_for_bookings(dirty))  # bulk_update sends no post_save
+        AuditLog.objects.bulk_create(entries)
+        for booking in signed:
+            schedule_processing(booking)
+
+    applied = sum(r["status"] == "applied" for r in results)
+    return JsonResponse({"ok": all(r["ok"] for r in results), "applied": applied, "results": results})
 
 # ---------- Reports ----------
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def attendance_report(request):
     # ---- org scope ----
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -828,184 +1064,54 @@ def attendance_report(request):
 
     include_paid = request.GET.get("include_paid") == "1"
 
-    # ---- base queryset (org + date range) ----
-    qs = (
-        ShiftBooking.all_objects  # bypass any implicit tenant filtering
-        .select_related("user", "shift")
-        .filter(organization=tenant)
-        .filter(shift__date__gte=start, shift__date__lte=end)
-    )
-    # apply paid filter only when requested
-    if not include_paid:
-        qs = qs.filter(paid_at__isnull=True)
-
-    qs = qs.order_by("shift__date", "shift__start_time", "user__username")
-
-    # ---- rows ----
-    rows = []
-    now = timezone.localtime()
-    tz = timezone.get_current_timezone()
-    for b in qs:
-        sh = b.shift
-        sd = datetime.combine(sh.date, sh.start_time or time.min, tzinfo=tz)
-        ed = datetime.combine(sh.date, sh.end_time or time.max, tzinfo=tz)
-
-        ci = b.clock_in_at
-        co = b.clock_out_at
-        ci_local = timezone.localtime(ci) if ci else None
-        co_local = timezone.localtime(co) if co else None
-
-        worked_sec = int((co - ci).total_seconds()) if ci and co and co >= ci else 0
-        late_min   = int(round((ci - sd).total_seconds() / 60.0)) if ci and ci > sd else 0
-        early_min  = int(round((ed - co).total_seconds() / 60.0)) if co and co < ed else 0
-
-        if not ci and now > ed:
-            status = "No show"
-        elif ci and not co and now > ed:
-            status = "Incomplete"
-        elif ci and co:
-            status = "Present"
-        else:
-            status = "Pending"
-
-        hours = worked_sec // 3600
-        minutes = (worked_sec % 3600) // 60
-        worked_hhmm = f"{hours:02d}:{minutes:02d}"
-
-        rows.append({
-            "date": sh.date.isoformat(),
-            "user": b.user.get_username(),
-            "role": sh.role,
-            "title": sh.title,
-            "start": sd.strftime("%H:%M"),
-            "end": ed.strftime("%H:%M"),
-            "clock_in": ci_local.strftime("%H:%M") if ci_local else "",
-            "clock_out": co_local.strftime("%H:%M") if co_local else "",
-            "worked": worked_hhmm,
-            "late_min": late_min,
-            "early_min": early_min,
-            "status": status,
-        })
+    # ---- base queryset (org + date range; paid only when requested) ----
+    qs = attendance_queryset(tenant, start, end, include_paid)
 
+    now = timezone.now()
     fmt = (request.GET.get("format") or "").lower()
+    if fmt in ("csv", "xlsx", "parquet") and runs_in_background(request, start, end):
+        job = request_export(tenant, request.user, ExportKind.ATTENDANCE, fmt, {
+            "start": start.isoformat(), "end": end.isoformat(), "include_paid": include_paid,
+        })
+        return redirect_to_job(job)
     if fmt == "csv":
-        return _attendance_csv(rows, start, end)
+        return stream_csv(request, f"attendance_{start}_{end}.csv", ATTENDANCE_COLUMNS, attendance_rows(qs, now))
     if fmt == "xlsx":
         try:
-            return _attendance_xlsx(rows, start, end)
+            return xlsx_response(request, f"attendance_{start}_{end}.xlsx", "Attendance",
+                                 ATTENDANCE_COLUMNS, attendance_rows(qs, now))
         except ImportError:
             messages.error(request, "Excel export requires 'openpyxl'. Try CSV export instead.")
+    if fmt == "parquet":
+        try:
+            return parquet_response(request, f"attendance_{start}_{end}_parquet.zip", qs, now)
+        except ImportError:
+            messages.error(request, "Parquet export requires 'pyarrow'. Try CSV export instead.")
+
+    # ---- rows; stat cards and totals from the daily rollup ----
+    rows = list(attendance_page_rows(qs, now))
+    facts = facts_between(tenant, start, end, paid=None if include_paid else False)
+    group = request.GET.get("group") or ""
+    totals = fact_totals(facts, group) if group in GROUPINGS else []
+    for t in totals:
+        t["worked"] = f"{t['worked_minutes_total'] // 60}:{t['worked_minutes_total'] % 60:02d}"
 
     return render(request, "reports/attendance.html", {
         "rows": rows,
         "start": start,
         "end": end,
+        "summary": fact_summary(facts),
+        "group": group if group in GROUPINGS else "",
+        "groupings": list(GROUPINGS),
+        "totals": totals,
     })
 
-def _attendance_csv(rows, start, end):
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = f'attachment; filename="attendance_{start}_{end}.csv"'
-    writer = csv.writer(response)
-    writer.writerow(
-        [
-            "Date",
-            "User",
-            "Role",
-            "Title",
-            "Start",
-            "End",
-            "Clock In",
-            "Clock Out",
-            "Worked (HH:MM)",
-            "Late (min)",
-            "Early Leave (min)",
-            "Status",
-        ]
-    )
-    for r in rows:
-        writer.writerow(
-            [
-                r["date"],
-                r["user"],
-                r["role"],
-                r["title"],
-                r["start"],
-                r["end"],
-                r["clock_in"],
-                r["clock_out"],
-                r["worked"],
-                r["late_min"],
-                r["early_min"],
-                r["status"],
-            ]
-        )
-    return response
-
-def _attendance_xlsx(rows, start, end):
-    # pip install openpyxl
-    from openpyxl import Workbook
-    from openpyxl.utils import get_column_letter
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Attendance"
-
-    headers = [
-        "Date",
-        "User",
-        "Role",
-        "Title",
-        "Start",
-        "End",
-        "Clock In",
-        "Clock Out",
-        "Worked (HH:MM)",
-        "Late (min)",
-        "Early Leave (min)",
-        "Status",
-    ]
-    ws.append(headers)
-
-    for r in rows:
-        ws.append(
-            [
-                r["date"],
-                r["user"],
-                r["role"],
-                r["title"],
-                r["start"],
-                r["end"],
-                r["clock_in"],
-                r["clock_out"],
-                r["worked"],
-                r["late_min"],
-                r["early_min"],
-                r["status"],
-            ]
-        )
-
-    for col in range(1, len(headers) + 1):
-        ws.column_dimensions[get_column_letter(col)].width = 18
-
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-
-    response = HttpResponse(
-        bio.getvalue(),
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-    response["Content-Disposition"] = f'attachment; filename="attendance_{start}_{end}.xlsx"'
-    return response
-
 # ---------- Admin dashboard ----------
 @login_required
 @user_passes_test(is_admin)
 def admin_dashboard(request):
     # ---- resolve active tenant/org (same pattern we used in admin_manage_shifts) ----
-    tenant = getattr(request, "tenant", None)
-    if tenant is None:
-        tenant = getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1013,17 +1119,6 @@ def admin_dashboard(request):
     # ---- dates/times ----
     now = timezone.localtime()
     today = now.date()
-    current_time = now.time()
-
-    # upcoming = strictly in future OR later today (not finished)
-    future_q = (
-        Q(date__gt=today) |
-        (Q(date=today) & (
-            Q(end_time__gt=current_time) |
-            Q(end_time__isnull=True, start_time__gt=current_time) |
-            Q(start_time__isnull=True, end_time__isnull=True)
-        ))
-    )
 
     # ---- KPIs (all org-scoped) ----
     total_shifts = Shift.all_objects.filter(organization=tenant).count()
@@ -1033,9 +1128,8 @@ def admin_dashboard(request):
     # available shifts = upcoming AND not full
     available_shifts = (
         Shift.all_objects
-        .filter(future_q, organization=tenant)
-        .annotate(booked_total=Count("bookings"))
-        .filter(booked_total__lt=F("max_staff"))
+        .upcoming(tenant, now)
+        .filter(booked_count__lt=F("max_staff"))
         .count()
     )
 
@@ -1046,11 +1140,13 @@ def admin_dashboard(request):
         .count()
     )
 
+    # last 7 days of attendance, from the daily rollup
+    week = fact_summary(facts_between(tenant, today - timedelta(days=6), today))
+
     # ---- Upcoming table (org-scoped) ----
     upcoming_shifts = (
         Shift.all_objects
-        .filter(future_q, organization=tenant)
-        .annotate(booked_count=Count("bookings"))
+        .upcoming(tenant, now)
         .order_by("date", "start_time")[:10]
     )
 
@@ -1067,6 +1163,8 @@ def admin_dashboard(request):
         "total_bookings": total_bookings,
         "total_users": total_users,
         "todays_shifts": todays_shifts,
+        "week_worked_hours": round(week["worked_minutes"] / 60, 1),
+        "week_no_shows": week["no_show"],
         "upcoming_shifts": upcoming_shifts,
         "users": list(users),
         # (optional extras you had before)
@@ -1152,27 +1250,18 @@ def admin_manage_shifts(request):
     user_q = (request.GET.get("user_q") or "").strip()
 
     # ---- resolve active tenant/org ----
-    tenant = getattr(request, "tenant", None)
-    if tenant is None:
-        tenant = getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
 
     # ---- base: upcoming (today onwards, not finished) ----
-    now = timezone.localtime()
-    today = now.date()
-    current_time = now.time()
-    future_q = (
-        Q(date__gt=today) |
-        (Q(date=today) & (Q(end_time__gt=current_time) | Q(end_time__isnull=True) | Q(start_time__gt=current_time)))
-    )
+    now = timezone.now()
 
     # shifts list (org-scoped)
     shifts_qs = (
         Shift.all_objects  # bypass TenantManager to avoid any hidden filters
-        .filter(future_q, organization=tenant)
-        .annotate(booked_total=Count("bookings"))
+        .upcoming(tenant, now)
         .order_by("date", "start_time", "title")
     )
 
@@ -1185,7 +1274,7 @@ def admin_manage_shifts(request):
     if end_q:
         shifts_qs = shifts_qs.filter(date__lte=end_q)
     if only_open:
-        shifts_qs = shifts_qs.filter(booked_total__lt=F("max_staff"))
+        shifts_qs = shifts_qs.filter(booked_count__lt=F("max_staff"))
 
     upcoming_shifts = list(shifts_qs[:50])
 
@@ -1204,23 +1293,20 @@ def admin_manage_shifts(request):
         )
     users = list(users_qs[:300])
 
-    # attach (user, is_compliant) rows
+    # attach (user, is_compliant) rows — one UserRoleCompliance query for the whole grid
+    compliance = ComplianceTable(users, {sh.role for sh in upcoming_shifts}, org=tenant)
     for sh in upcoming_shifts:
-        sh.user_rows = [(u, user_is_compliant_for_role(u, sh.role)) for u in users]
+        sh.user_rows = [(u, compliance.is_compliant(u, sh.role)) for u in users]
 
     # ---- metrics (ALL org-scoped so they match the list) ----
     total_shifts = Shift.all_objects.filter(organization=tenant).count()
     total_users  = User.objects.filter(profile__organization=tenant).count()
     available_upcoming = (
-        Shift.all_objects.filter(future_q, organization=tenant)
-        .annotate(c=Count("bookings"))
-        .filter(c__lt=F("max_staff"))
+        Shift.all_objects.upcoming(tenant, now).filter(booked_count__lt=F("max_staff"))
         .count()
     )
     booked_upcoming = (
-        Shift.all_objects.filter(future_q, organization=tenant)
-        .annotate(c=Count("bookings"))
-        .filter(c__gt=0)
+        Shift.all_objects.upcoming(tenant, now).filter(booked_count__gt=0)
         .count()
     )
 
@@ -1258,7 +1344,7 @@ def admin_paid_bookings(request):
     List all PAID bookings with filters + CSV/XLSX export (same shape as attendance).
     """
     # resolve active org/tenant
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1278,80 +1364,42 @@ def admin_paid_bookings(request):
     except ValueError:
         start, end = default_start, today
 
-    qs = (
-        ShiftBooking.all_objects                # bypass any tenant manager
-        .select_related("user", "shift")
-        .filter(organization=tenant)             # scope to active org
-        .filter(paid_at__isnull=False)
-        .filter(shift__date__gte=start, shift__date__lte=end)
-        .order_by("-paid_at", "-id")
-    )
-    if user_q:
-        qs = qs.filter(
-            Q(user__username__icontains=user_q) |
-            Q(user__first_name__icontains=user_q) |
-            Q(user__last_name__icontains=user_q) |
-            Q(user__email__icontains=user_q)
-        )
-    if role_q:
-        qs = qs.filter(shift__role__iexact=role_q)
-
-    # build rows (reuse attendance layout + paid_at column)
-    rows = []
-    for b in qs:
-        sh = b.shift
-        sd = datetime.combine(sh.date, sh.start_time or time.min, tzinfo=timezone.get_current_timezone())
-        ed = datetime.combine(sh.date, sh.end_time or time.max, tzinfo=timezone.get_current_timezone())
-        worked_sec = int((b.clock_out_at - b.clock_in_at).total_seconds()) if b.clock_in_at and b.clock_out_at and b.clock_out_at >= b.clock_in_at else 0
-        hours = worked_sec // 3600
-        minutes = (worked_sec % 3600) // 60
-        rows.append({
-            "date": sh.date.isoformat(),
-            "user": b.user.get_username(),
-            "role": sh.role,
-            "title": sh.title,
-            "start": sd.strftime("%H:%M"),
-            "end": ed.strftime("%H:%M"),
-            "clock_in": timezone.localtime(b.clock_in_at).strftime("%H:%M") if b.clock_in_at else "",
-            "clock_out": timezone.localtime(b.clock_out_at).strftime("%H:%M") if b.clock_out_at else "",
-            "worked": f"{hours:02d}:{minutes:02d}",
-            "paid_at": timezone.localtime(b.paid_at).strftime("%Y-%m-%d %H:%M"),
-            "booking_id": b.id,   # <— add this
-            
-        })
+    qs = paid_queryset(tenant, start, end, user_q, role_q)
 
     fmt = (request.GET.get("format") or "").lower()
+    if fmt in ("csv", "xlsx", "parquet") and runs_in_background(request, start, end):
+        job = request_export(tenant, request.user, ExportKind.PAID, fmt, {
+            "start": start.isoformat(), "end": end.isoformat(), "user_q": user_q, "role_q": role_q,
+        })
+        return redirect_to_job(job)
     if fmt == "csv":
-        # include paid_at in export
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = f'attachment; filename="paid_{start}_{end}.csv"'
-        import csv
-        writer = csv.writer(response)
-        writer.writerow(["Date","User","Role","Title","Start","End","Clock In","Clock Out","Worked (HH:MM)","Paid At"])
-        for r in rows:
-            writer.writerow([r["date"],r["user"],r["role"],r["title"],r["start"],r["end"],r["clock_in"],r["clock_out"],r["worked"],r["paid_at"]])
-        return response
+        return stream_csv(request, f"paid_{start}_{end}.csv", PAID_COLUMNS, paid_rows(qs))
 
     if fmt == "xlsx":
         try:
-            from openpyxl import Workbook
-            from openpyxl.utils import get_column_letter
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Paid"
-            headers = ["Date","User","Role","Title","Start","End","Clock In","Clock Out","Worked (HH:MM)","Paid At"]
-            ws.append(headers)
-            for r in rows:
-                ws.append([r["date"],r["user"],r["role"],r["title"],r["start"],r["end"],r["clock_in"],r["clock_out"],r["worked"],r["paid_at"]])
-            for col in range(1, len(headers)+1):
-                ws.column_dimensions[get_column_letter(col)].width = 18
-            from io import BytesIO
-            bio = BytesIO(); wb.save(bio); bio.seek(0)
-            response = HttpResponse(bio.getvalue(), content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-            response["Content-Disposition"] = f'attachment; filename="paid_{start}_{end}.xlsx"'
-            return response
+            return xlsx_response(request, f"paid_{start}_{end}.xlsx", "Paid", PAID_COLUMNS, paid_rows(qs))
         except ImportError:
             messages.error(request, "Excel export requires 'openpyxl'. Try CSV instead.")
+    if fmt == "parquet":
+        try:
+            return parquet_response(request, f"paid_{start}_{end}_parquet.zip", qs)
+        except ImportError:
+            messages.error(request, "Parquet export requires 'pyarrow'. Try CSV instead.")
+
+    # rows (attendance layout + paid_at column)
+    rows = list(paid_rows(qs))
+
+    facts = facts_between(tenant, start, end, paid=True)
+    if user_q:
+        facts = facts.filter(
+            Q(user__username__icontains=user_q) |
+            Q(user__first_name__icontains=user_q) |
+            Q(user__last_name__icontains=user_q) |
+            Q(user__email__icontains=user_q)
+        )
+    if role_q:
+        facts = facts.filter(role__iexact=role_q)
+    summary = fact_summary(facts)
 
     return render(request, "admin/paid_bookings.html", {
         "rows": rows,
@@ -1359,7 +1407,8 @@ def admin_paid_bookings(request):
         "end": end,
         "user_q": user_q,
         "role_q": role_q,
-        "count": qs.count(),
+        "count": len(rows),
+        "worked_hours": round(summary["worked_minutes"] / 60, 1),
     })
 
 
@@ -1368,7 +1417,7 @@ def admin_paid_bookings(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_mark_paid(request, booking_id):
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     b = get_object_or_404(ShiftBooking.all_objects, pk=booking_id, organization=tenant)
     if not b.paid_at:
         b.paid_at = timezone.now()
@@ -1380,7 +1429,7 @@ def admin_mark_paid(request, booking_id):
 @login_required
 @user_passes_test(is_admin)
 def admin_unmark_paid(request, booking_id):
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     b = get_object_or_404(ShiftBooking.all_objects, pk=booking_id, organization=tenant)
     if b.paid_at:
         b.paid_at = None
@@ -1389,11 +1438,60 @@ def admin_unmark_paid(request, booking_id):
     return redirect(request.META.get("HTTP_REFERER") or "admin_dashboard")
 
 
+# ---------- ADMIN: punch verification queue ----------
+@login_required
+@user_passes_test(is_admin)
+def admin_punch_mismatches(request):
+    """Punches the background verifier flagged (see shifts/verification.py)."""
+    tenant = _active_tenant(request)
+    if tenant is None:
+        messages.error(request, "No active workspace selected. Please select an organization.")
+        return redirect("home")
+
+    mismatches = (
+        mismatched_punches(tenant)
+        .select_related("user", "shift")
+        .order_by("-shift__date", "-id")
+    )
+    pending_count = (
+        ShiftBooking.all_objects
+        .filter(organization=tenant)
+        .filter(Q(clock_in_verification=PunchVerification.PENDING) | Q(clock_out_verification=PunchVerification.PENDING))
+        .count()
+    )
+    return render(request, "admin/punch_mismatches.html", {
+        "mismatches": mismatches,
+        "pending_count": pending_count,
+    })
+
+@require_POST
+@login_required
+@user_passes_test(is_admin)
+def admin_accept_punch(request, booking_id):
+    """Accept a flagged punch location after review."""
+    tenant = _active_tenant(request)
+    b = get_object_or_404(ShiftBooking.all_objects.select_related("shift"), pk=booking_id, organization=tenant)
+    fields = [
+        f"clock_{punch}_verification" for punch in ("in", "out")
+        if getattr(b, f"clock_{punch}_verification") == PunchVerification.MISMATCHED
+    ]
+    if fields:
+        for f in fields:
+            setattr(b, f, PunchVerification.VERIFIED)
+        b.save(update_fields=fields)
+        log_audit(actor=request.user, subject=b.user, action=AuditAction.STATUS_OVERRIDE,
+                  shift=b.shift, booking=b,
+                  message="Flagged punch location accepted by admin.",
+                  note=b.verification_note)
+        messages.success(request, f"Accepted punch location for booking #{b.id}.")
+    return redirect(request.META.get("HTTP_REFERER") or "admin_punch_mismatches")
+
+
 # ---------- USER: My paid shifts ----------
 @login_required
 def my_paid_shifts(request):
     # resolve tenant the same way as my_bookings
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1429,19 +1527,13 @@ def admin_book_for_user(request):
     override = request.POST.get("override") == "1"
     reason   = (request.POST.get("reason") or "").strip()
 
-    # Capacity check
-    booked_total = ShiftBooking.objects.filter(shift=shift).count()
-    if booked_total >= shift.max_staff:
+    # Cheap early-outs (the atomic claim below is the real guard)
+    if not shift.has_space:
         messages.error(request, f"'{shift.title}' is already full.")
         return redirect("admin_manage_shifts")
 
-    # Duplicate check
-    if ShiftBooking.objects.filter(shift=shift, user=user).exists():
-        messages.info(request, f"{user} is already booked on '{shift.title}'.")
-        return redirect("admin_manage_shifts")
-
     # Compliance guard
-    if not user_is_compliant_for_role(user, shift.role) and not override:
+    if not override and not role_compliance_for(user, shift.role):
         messages.error(
             request,
             f"{user.get_username()} is not compliant for role '{shift.get_role_display()}'. "
@@ -1449,13 +1541,14 @@ def admin_book_for_user(request):
         )
         return redirect("admin_manage_shifts")
 
-    # In admin_book_for_user, ensure organization is set
-    from django.db import IntegrityError
     try:
-        booking = ShiftBooking.objects.create(user=user, shift=shift, organization=shift.organization)
-    except IntegrityError:
+        booking = create_booking(shift, user)
+    except AlreadyBookedError:
         messages.info(request, f"{user} is already booked on '{shift.title}'.")
         return redirect("admin_manage_shifts")
+    except ShiftFullError:
+        messages.error(request, f"'{shift.title}' is already full.")
+        return redirect("admin_manage_shifts")
     note = f" (override: {reason})" if override and reason else (" (override)" if override else "")
     messages.success(request, f"Booked {user.get_username()} on '{shift.title}'.{note}")
     
@@ -1518,7 +1611,8 @@ def admin_clock_in_for_user(request, booking_id):
     booking.clock_out_note = (booking.clock_out_note or "")
     if reason:
         booking.clock_out_note += (("\n" if booking.clock_out_note else "") + f"[Admin IN] {reason}")
-    booking.save(update_fields=["clock_in_at", "clock_out_note"])
+    booking.attendance_status = AttendanceStatus.OPEN  # an admin clock-in overrides a settled no-show
+    booking.save(update_fields=["clock_in_at", "clock_out_note", "attendance_status"])
 
     # ✅ Log the correct action
     log_audit(
@@ -1575,6 +1669,57 @@ def admin_clock_out_for_user(request, booking_id):
     messages.success(request, "Clock-out recorded.")
     return redirect(request.META.get("HTTP_REFERER") or "admin_manage_shifts")
 
+
+# ---------- ADMIN: team clock in/out ----------
+@login_required
+@user_passes_test(is_admin)
+def admin_shift_team(request, shift_id):
+    """
+    Clock several carers on one shift in or out at once (e.g. the site tablet is down).
+    POST booking_ids[], kind=in|out, reason, override. Answers JSON when asked for it.
+    """
+    tenant = _active_tenant(request)
+    if tenant is None:
+        messages.error(request, "No active workspace selected. Please select an organization.")
+        return redirect("home")
+    shift = get_object_or_404(Shift.all_objects, pk=shift_id, organization=tenant)
+
+    results = None
+    if request.method == "POST":
+        kind = request.POST.get("kind")
+        try:
+            booking_ids = [int(x) for x in request.POST.getlist("booking_ids")]
+        except ValueError:
+            booking_ids = None
+        if kind not in ("in", "out") or not booking_ids:
+            if "application/json" in request.headers.get("Accept", ""):
+                return JsonResponse({"ok": False, "msg": "Pick clock in or out and at least one booking."}, status=400)
+            messages.error(request, "Pick clock in or out and at least one booking.")
+            return redirect("admin_shift_team", shift_id=shift.id)
+
+        results = team_punch(
+            shift, booking_ids, kind, actor=request.user,
+            override=request.POST.get("override") == "1",
+            reason=(request.POST.get("reason") or "").strip(),
+        )
+        applied = sum(r["status"] == "applied" for r in results)
+        if "application/json" in request.headers.get("Accept", ""):
+            return JsonResponse({"ok": True, "kind": kind, "applied": applied, "results": results})
+        summary = f"Clocked {kind} {applied} of {len(results)} selected booking(s)."
+        (messages.success if applied == len(results) else messages.warning)(request, summary)
+
+    bookings = (
+        ShiftBooking.all_objects
+        .filter(organization=tenant, shift=shift)
+        .select_related("user")
+        .order_by("user__username")
+    )
+    return render(request, "admin/shift_team.html", {
+        "shift": shift,
+        "bookings": bookings,
+        "results": results,
+    })
+
 @require_POST
 @login_required
 @user_passes_test(is_admin)
@@ -1664,7 +1809,7 @@ def my_compliance(request):
 @login_required
 def my_availability(request):
     """User can view and manage their availability"""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1684,7 +1829,7 @@ def add_availability(request):
     from .forms import UserAvailabilityForm
     from .models import UserAvailability
     
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1717,7 +1862,7 @@ def edit_availability(request, availability_id):
     from .forms import UserAvailabilityForm
     from .models import UserAvailability
     
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1759,7 +1904,7 @@ def delete_availability(request, availability_id):
     """User can delete their own availability"""
     from .models import UserAvailability
     
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1811,7 +1956,7 @@ def my_holidays(request):
     """User can view their holiday requests"""
     from .models import HolidayRequest
     
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1831,7 +1976,7 @@ def request_holiday(request):
     from .forms import HolidayRequestForm
     from .models import HolidayRequest
     
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1875,7 +2020,7 @@ def admin_holiday_requests(request):
     """Admin view to manage all holiday requests"""
     from .models import HolidayRequest
     
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1923,7 +2068,7 @@ def admin_holiday_requests(request):
 @user_passes_test(is_admin)
 def admin_user_availabilities(request):
     """Admin view to see all user availabilities"""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -1977,7 +2122,7 @@ def admin_user_availabilities(request):
 @user_passes_test(is_admin)
 def admin_add_user_availability(request):
     """Admin can add availability for any user"""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace detected. Please select an organization.")
         return redirect("home")
@@ -2020,7 +2165,7 @@ def admin_add_user_availability(request):
 @user_passes_test(is_admin)
 def admin_delete_user_availability(request, availability_id):
     """Admin can delete any user's availability"""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -2054,7 +2199,7 @@ def admin_delete_user_availability(request, availability_id):
 @user_passes_test(is_admin)
 def admin_holiday_dashboard(request):
     """Admin dashboard for holiday management with statistics"""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -2100,7 +2245,7 @@ def admin_holiday_dashboard(request):
 @user_passes_test(is_admin)
 def admin_add_holiday_request(request):
     """Admin can add holiday request for any user"""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -2151,7 +2296,7 @@ def admin_add_holiday_request(request):
 @login_required
 def cancel_holiday_request(request, request_id):
     """User can cancel their own holiday request"""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -2189,7 +2334,7 @@ def cancel_holiday_request(request, request_id):
 @user_passes_test(is_admin)
 def approve_holiday_request(request, request_id):
     """Admin approve holiday request"""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
@@ -2227,7 +2372,7 @@ def approve_holiday_request(request, request_id):
 @user_passes_test(is_admin)
 def reject_holiday_request(request, request_id):
     """Admin reject holiday request"""
-    tenant = getattr(request, "tenant", None) or getattr(getattr(request.user, "profile", None), "organization", None)
+    tenant = _active_tenant(request)
     if tenant is None:
         messages.error(request, "No active workspace selected. Please select an organization.")
         return redirect("home")
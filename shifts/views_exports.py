@@ -0,0 +1,74 @@
+# shifts/views_exports.py
+"""Pages for background report exports (see shifts/export_jobs.py)."""
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+
+from core.request_context import get_request_context
+from .exports import file_response
+from .models import ExportJob, ExportStatus
+
+
+def is_staff(u): return u.is_authenticated and u.is_staff
+
+
+def _job_json(job) -> dict:
+    return {
+        "id": job.pk,
+        "kind": job.kind,
+        "format": job.format,
+        "status": job.status,
+        "status_label": job.get_status_display(),
+        "rows_written": job.rows_written,
+        "total_rows": job.total_rows,
+        "percent": job.percent,
+        "error": job.error,
+        "download_url": reverse("admin_export_job_download", args=[job.pk]) if job.status == ExportStatus.DONE else None,
+        "expires_at": job.expires_at.isoformat() if job.expires_at else None,
+    }
+
+
+def _tenant_job(request, job_id):
+    tenant = get_request_context(request).org
+    if tenant is None:
+        raise Http404("No active workspace.")
+    return get_object_or_404(ExportJob.all_objects, pk=job_id, organization=tenant)
+
+
+@login_required
+@user_passes_test(is_staff)
+def export_jobs(request):
+    tenant = get_request_context(request).org
+    if tenant is None:
+        messages.error(request, "No active workspace selected. Please select an organization.")
+        return redirect("home")
+
+    jobs = list(ExportJob.all_objects.filter(organization=tenant).select_related("requested_by")[:50])
+    highlight = request.GET.get("job") or ""
+    return render(request, "admin/export_jobs.html", {
+        "jobs": jobs,
+        "highlight": int(highlight) if highlight.isdigit() else None,
+        "any_active": any(j.is_active for j in jobs),
+    })
+
+
+@login_required
+@user_passes_test(is_staff)
+def export_job_status(request, job_id):
+    """Polled by the jobs page while an export is queued or running."""
+    return JsonResponse(_job_json(_tenant_job(request, job_id)))
+
+
+@login_required
+@user_passes_test(is_staff)
+def export_job_download(request, job_id):
+    job = _tenant_job(request, job_id)
+    if job.status != ExportStatus.DONE or not job.file:
+        raise Http404("This export isn't ready (or has expired).")
+    try:
+        fh = job.file.storage.open(job.file.name, "rb")
+    except FileNotFoundError:
+        raise Http404("This export has expired.")
+    return file_response(request, fh, job.filename)
@@ -1,10 +1,32 @@
+import hashlib
 import os
+from django.utils.deconstruct import deconstructible
 from django.utils.text import slugify
 from core.multitenancy import get_current_tenant
 
-def tenant_upload_to(subfolder):
-    def _path(instance, filename):
-        tenant = get_current_tenant()
+
+@deconstructible
+class TenantUploadTo:
+    """
+    upload_to callable: tenants/<org slug>/<subfolder>/<ab>/<cd>/<filename>.
+
+    The org comes from the instance when it has one (so background jobs file
+    things correctly), else from the current tenant. <ab>/<cd> are taken from
+    a hash of the filename to keep any one directory small.
+    """
+
+    def __init__(self, subfolder):
+        self.subfolder = subfolder
+
+    def __call__(self, instance, filename):
+        tenant = getattr(instance, "organization", None) or get_current_tenant()
         tslug = tenant.slug if tenant else "global"
-        return os.path.join("tenants", tslug, subfolder, filename)
-    return _path
+        digest = hashlib.md5(filename.encode("utf-8"), usedforsecurity=False).hexdigest()
+        return os.path.join("tenants", tslug, self.subfolder, digest[:2], digest[2:4], filename)
+
+    def __eq__(self, other):
+        return isinstance(other, TenantUploadTo) and self.subfolder == other.subfolder
+
+
+def tenant_upload_to(subfolder):
+    return TenantUploadTo(subfolder)